@@ -1,51 +1,410 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from tkinter.ttk import Progressbar
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    from tkinter.ttk import Progressbar
+    from tkhtmlview import HTMLLabel
+except ImportError:
+    # Servidor sem interface gráfica: só o modo headless (servidor_envio.py) funciona
+    tk = filedialog = messagebox = Progressbar = HTMLLabel = None
 import pandas as pd
+import numpy as np
 import threading
 import time
+import bisect
+import collections
+import contextlib
+import copy
+import csv
+import hashlib
+import heapq
+import io
+import itertools
+import sqlite3
 import uuid  # Adicionada importação do uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, SessionNotCreatedException
 import requests
 import json
 import os
+import queue
+import random
+import re
+import shutil
+import subprocess
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
-from tkhtmlview import HTMLLabel
 from selenium.webdriver.edge.service import Service as EdgeService
 from selenium.webdriver.edge.options import Options as EdgeOptions
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
+try:
+    import psutil
+except ImportError:
+    # Opcional: sem ele o vigia do navegador não mede a memória dos processos
+    psutil = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Opcional: sem ele as imagens anexadas vão sem redução
+    Image = ImageOps = None
 
 # Configurações globais
 CONFIG_FILE = "config.json"
 CONFIG_TEMPLATE_FILE = "config.template.json"
 COOKIES_FILE = "whatsapp_cookies.pkl"
 USER_DATA_DIR = os.path.join(os.getcwd(), "whatsapp_selenium_data")
-PROGRESS_FILE = "send_progress.json"
+LEDGER_FILE = "send_ledger.tsv"
+LEDGER_META_FILE = "send_ledger.json"
+DRIVER_CACHE_FILE = "driver_cache.json"
+PHONE_CACHE_FILE = "whatsapp_numbers.db"
+PHONE_CACHE_TTL = 30 * 24 * 3600  # Segundos
+PHONE_CACHE_FLUSH_BATCH = 200  # Envios confirmados gravados de uma vez no cache
+
+# Base local de contatos (importada dos CSVs exportados) e CSVs gerados pelas consultas
+CONTACTS_DB_FILE = "contatos.db"
+CONTACT_QUERY_DIR = "consultas"
+CONTACT_STORE_COLUMNS = ['client_id', 'name', 'phone', 'created_at']
+CONTACT_QUERY_FILTERS = ('created_since', 'created_until', 'not_sent_days', 'limit')
+CONTACTS_FLUSH_BATCH = 200  # Envios confirmados gravados de uma vez na base
+
+# Anexos (imagem ou PDF do cardápio), preparados uma vez e guardados pelo hash do conteúdo
+MEDIA_CACHE_DIR = "media_cache"
+MEDIA_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+MEDIA_DOCUMENT_EXTENSIONS = ('.pdf',)
+MEDIA_MAX_SIDE = 1600  # Pixels do maior lado da imagem enviada
+MEDIA_JPEG_QUALITY = 80
+MEDIA_MAX_MB = 16  # Limite do WhatsApp para fotos; PDFs maiores vão como estão
+
+# Registro de envios (uma linha por tentativa)
+LEDGER_COLUMNS = ['phone', 'status', 'attempts', 'timestamp', 'latency', 'error', 'account']
+LEDGER_FLUSH_INTERVAL = 0.5  # Segundos entre gravações em grupo
+LEDGER_FLUSH_BATCH = 200  # Registros que forçam uma gravação antecipada
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+STATUS_INVALID = 'invalid'
+
+# Classes de falha no envio; as permanentes nunca são reenviadas
+ERROR_INVALID_PHONE = 'invalid_phone'
+ERROR_COMPOSE_TIMEOUT = 'compose_timeout'
+ERROR_SEND_BUTTON = 'send_button_not_found'
+ERROR_ACK_TIMEOUT = 'ack_timeout'
+ERROR_DRIVER_CRASH = 'driver_crash'
+ERROR_CANCELLED = 'cancelled'
+ERROR_ATTACHMENT = 'attachment_failed'
+PERMANENT_ERRORS = {ERROR_INVALID_PHONE}
+
+# Reenvio de falhas transitórias
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 60  # Segundos; dobra a cada nova tentativa
+RETRY_INTERLEAVE = 3  # Contatos novos enviados entre dois reenvios
+
+# O que fazer com números já vistos sem WhatsApp
+INVALID_PHONE_SKIP = 'skip'
+INVALID_PHONE_DEPRIORITIZE = 'deprioritize'
+DEVTOOLS_PORT_FILE = "DevToolsActivePort"
+BROWSER_START_TIMEOUT = 20  # Segundos
+BROWSER_RELEASE_RECHECK = 1  # Segundos entre verificações enquanto outra thread usa o navegador do perfil
+
+# Navegador enxuto para o envio (config lean_browser): só texto é enviado, então
+# imagens, mídia, fontes e telemetria são bloqueadas (CDP Network.setBlockedURLs)
+LEAN_BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.ico",
+    "*.mp4", "*.webm", "*.ogg", "*.opus", "*.mp3",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*://pps.whatsapp.net/*",  # Fotos de perfil
+    "*://mmg.whatsapp.net/*",  # Mídia das conversas
+    "*://media*.whatsapp.net/*",
+    "*://crashlogs.whatsapp.net/*",
+    "*://dit.whatsapp.net/*",
+]
+LEAN_BROWSER_ARGS = [
+    "--blink-settings=imagesEnabled=false",
+    "--renderer-process-limit=2",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    "--mute-audio",
+    "--no-pings",
+]
+LEAN_BROWSER_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.default_content_setting_values.notifications': 2,
+    'profile.default_content_setting_values.media_stream': 2,
+    'profile.default_content_setting_values.geolocation': 2,
+}
+
+# Vigia da saúde do navegador durante o envio: recicla o navegador da conta
+# antes que o WhatsApp Web acumule memória e fique lento
+WATCHDOG_MAX_MESSAGES = 400  # Tentativas de envio por navegador antes de reciclar
+WATCHDOG_CHECK_EVERY = 20  # Tentativas entre duas medições de memória e latência
+WATCHDOG_MAX_HEAP_MB = 1024  # Heap JS da página (CDP Runtime.getHeapUsage)
+WATCHDOG_MAX_RSS_MB = 2048  # Navegador + processos de renderização (precisa do psutil)
+WATCHDOG_LATENCY_DRIFT = 2.0  # Mediana recente / mediana logo após abrir o navegador
+WATCHDOG_WINDOW = 20  # Envios usados em cada mediana de latência
+WATCHDOG_RESTART_ATTEMPTS = 3  # Tentativas de reabrir o navegador após queda
+WATCHDOG_RESTART_DELAY = 10  # Segundos; multiplicado pelo número da tentativa
+
+# Métricas de campanha: endpoint local e log de eventos JSON-lines
+METRICS_PORT = 8790  # http://127.0.0.1:8790/metrics (0 desativa)
+METRICS_EVENTS_FILE = "send_events.jsonl"
+METRICS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # Limites (segundos) dos histogramas
+
+# Leitura dos contatos em blocos
+CONTACT_COLUMNS = ['name', 'phone']
+CSV_CHUNK_SIZE = 50000  # Linhas por bloco
+CSV_SCAN_BLOCK = 1024 * 1024  # Bytes por leitura ao varrer arquivos (contagem de linhas, hash do anexo)
+CSV_BLANK_BYTES = np.isin(np.arange(256), list(b' \t\r\n'))  # Por valor de byte: linha só com esses é em branco
+
+# Modelos de mensagem: %campo%, %campo|padrão% e %campo:primeiro%
+SAUDACOES = ((5, "Bom dia"), (12, "Boa tarde"), (18, "Boa noite"))  # (hora de início, saudação)
+TEMPLATE_FIELD = re.compile(r'%([A-Za-z_][A-Za-z0-9_]*)(?::([a-z]+))?(?:\|([^%\n]*))?%')
+RENDER_BLOCK_SIZE = 1000  # Contatos renderizados de uma vez à frente do envio
+
+# Normalização de telefones
+DEFAULT_COUNTRY_CODE = '55'
+POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+BRAZIL_DDDS = [
+    11, 12, 13, 14, 15, 16, 17, 18, 19,
+    21, 22, 24, 27, 28,
+    31, 32, 33, 34, 35, 37, 38,
+    41, 42, 43, 44, 45, 46, 47, 48, 49,
+    51, 53, 54, 55,
+    61, 62, 63, 64, 65, 66, 67, 68, 69,
+    71, 73, 74, 75, 77, 79,
+    81, 82, 83, 84, 85, 86, 87, 88, 89,
+    91, 92, 93, 94, 95, 96, 97, 98, 99,
+]
 
 # Variáveis globais
-driver = None
 current_message = None
 DELAY_BETWEEN_MESSAGES = 5  # Segundos
 MAX_MESSAGES_PER_HOUR = 45
 BATCH_SIZE = 30
+BATCH_PAUSE = 300  # Segundos de pausa a cada BATCH_SIZE envios
+RATE_WINDOW = 3600  # Janela (segundos) do limite MAX_MESSAGES_PER_HOUR
+LIMITER_RECHECK = 1  # Segundos entre verificações de limites alterados durante uma espera
+UI_FRAME_MS = 100  # Intervalo entre atualizações da tela durante o envio
+
+# Fila de campanhas (interface e servidor_envio.py usam o mesmo motor)
+CAMPAIGN_JOBS_FILE = "campaign_jobs.json"
+CAMPAIGN_JOBS_KEEP = 200  # Campanhas encerradas mantidas no histórico
+# Limites aceitos por campanha: tipo e valor mínimo de cada um
+CAMPAIGN_LIMITS = {
+    'per_hour': (int, 1),
+    'spacing': (float, 0),
+    'batch_size': (int, 0),  # 0 desativa a pausa entre lotes
+    'batch_pause': (float, 0),
+}
+CAMPAIGN_ETA_STEP = 300  # Segundos por passo na simulação da agenda (previsão de término)
+CAMPAIGN_ETA_HORIZON = 30 * 24 * 3600  # Segundos à frente que a previsão considera
+SEND_WINDOW_PATTERN = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')  # "08:00-20:00"
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_PAUSED = 'paused'  # Fora da janela de envio ou cedeu a vez a uma campanha mais importante
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_INTERRUPTED = 'interrupted'
+JOB_FINISHED = {JOB_DONE, JOB_FAILED, JOB_CANCELLED, JOB_INTERRUPTED}
 
 # Configurações da API
 GEMINI_API_KEY = None
+LEAN_BROWSER = False  # Navegador de envio enxuto (config lean_browser)
 WHATSAPP_NUMBER = None
 MENU_LINK = None
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1/models/gemini-pro:generateContent"
+GEMINI_TIMEOUT = (5, 30)  # Segundos para conectar / para a resposta
+GEMINI_WORKERS = 3  # Gerações simultâneas
+
+# Estoque de variantes de mensagem geradas em segundo plano
+VARIANT_CACHE_FILE = "message_variants.db"
+VARIANT_CACHE_TTL = 7 * 24 * 3600  # Segundos
+VARIANT_CACHE_MAX = 500  # Variantes guardadas no total
+VARIANT_POOL_SIZE = 5  # Variantes prontas por prompt
+
+# Preview de mensagens
+PREVIEW_CANDIDATES = 3  # Candidatas exibidas lado a lado
+PREVIEW_POLL_MS = 100  # Intervalo de verificação das gerações em andamento
+PREVIEW_SAMPLE_CONTACT = {'name': 'Maria Silva', 'phone': '5511999999999'}  # Contato fictício do preview
+
+# Personalização do texto por contato, em lotes
+PERSONALIZE_COLUMNS = ['client_id', 'created_at']  # Colunas do CSV usadas no perfil
+PERSONALIZE_BATCH_SIZE = 20  # Contatos por chamada ao Gemini
+PERSONALIZE_LOOKAHEAD = 3  # Lotes gerados à frente do envio
+PERSONALIZE_WAIT = 3  # Segundos máximos esperando o lote antes de usar o texto padrão
+PERSONALIZE_MAX_CHARS = 500
+
+# Regras do texto gerado pela IA
+PIZZA_MANIA_PROMPT = (
+    "Crie uma mensagem divertida e amigável para uma pizzaria seguindo estas regras:\n"
+    "1. NÃO inclua saudação inicial ou nome\n"
+    "2. Use muitos emojis relevantes (pizza, comida, diversão)\n"
+    "3. Fale sobre como é bom comer pizza hoje\n"
+    "4. Use o nome *Pizza Mania* mencionando que é a melhor pizzaria\n"
+    "5. NÃO mencione promoções, descontos ou cupons\n"
+    "6. Use negrito com *texto* em palavras-chave\n"
+    "7. Use itálico com _texto_ para ênfase\n"
+    "8. Mantenha a mensagem curta (máximo 3 linhas)\n"
+    "9. Seja divertido e acolhedor\n"
+    "10. Foque em sabor, qualidade e momentos felizes\n"
+    "11. NÃO inclua valores ou preços\n"
+    "12. NÃO mencione horários de funcionamento\n"
+    "13. Apenas crie um texto amigável sobre pizza\n"
+    "14. Encerre com uma chamada para pedir pizza"
+)
+
+# Texto usado quando a IA não responde
+DEFAULT_MESSAGE_BODY = "🌟 Venha para a *Pizza Mania*! _A melhor pizzaria da cidade_ 🍕✨"
 
 # Adicionar constantes para WhatsApp
-WHATSAPP_QR_SELECTOR = "#app div[data-testid='qrcode']"
+WHATSAPP_WEB_URL = "https://web.whatsapp.com"
+WHATSAPP_QR_SELECTOR = "#app div[data-testid='qrcode'], div[data-ref] canvas, canvas[aria-label='Scan me!']"
+WHATSAPP_SIDE_SELECTOR = "#side"  # Painel da lista de conversas: só existe logado
 WHATSAPP_CHAT_LIST_SELECTOR = "div[data-testid='chat-list']"
 WHATSAPP_LOGIN_STATUS_FILE = "whatsapp_login_status.json"
+WHATSAPP_TEXTBOX_SELECTOR = '#main div[role="textbox"]'  # A pesquisa em #side também é um textbox
+WHATSAPP_SEND_BUTTON_SELECTOR = (
+    'button[aria-label="Enviar"], button[aria-label="Send"], '
+    'span[data-icon="send"], span[data-icon="wds-ic-send-filled"]'
+)
+WHATSAPP_ACK_SELECTOR = 'span[data-icon="msg-check"], span[data-icon="msg-dblcheck"]'
+
+# Anexos: botão do clipe, campos de arquivo do menu (fotos e documentos) e a
+# prévia da mídia com legenda e botão de enviar próprios
+WHATSAPP_ATTACH_BUTTON_SELECTOR = (
+    '#main footer div[title="Anexar"], #main footer div[title="Attach"], '
+    '#main footer span[data-icon="plus"], #main footer span[data-icon="clip"]'
+)
+WHATSAPP_MEDIA_INPUT_SELECTORS = {
+    'image': 'input[type="file"][accept*="image"]',
+    'document': 'input[type="file"][accept="*"]',
+}
+WHATSAPP_CAPTION_SELECTOR = (
+    'div[role="textbox"][aria-label="Adicionar legenda"], div[role="textbox"][aria-label="Add a caption"], '
+    'div[role="textbox"][aria-placeholder="Adicionar legenda"], div[role="textbox"][aria-placeholder="Add a caption"]'
+)
+WHATSAPP_MEDIA_SEND_SELECTOR = 'div[role="button"][aria-label="Enviar"], div[role="button"][aria-label="Send"]'
+ATTACH_TIMEOUT = 15  # Segundos até a prévia do anexo aparecer
+MEDIA_ACK_TIMEOUT = 60  # Segundos até a confirmação de uma mensagem com anexo (inclui o upload)
+
+# Estado do login por perfil: o resultado verificado vale por LOGIN_STATUS_TTL
+# e é descartado quando o navegador mostra o QR Code ou o login falha
+LOGIN_PROBE_TIMEOUT = 20  # Segundos até a página mostrar as conversas ou o QR Code
+LOGIN_PROBE_TIMEOUT_KNOWN = 60  # Idem, quando o perfil tem login confirmado recente
+LOGIN_STATUS_TTL = 12 * 3600  # Segundos
+
+# Tempos máximos de espera no envio (segundos)
+COMPOSE_TIMEOUT = 30
+SEND_BUTTON_TIMEOUT = 5
+SEND_ACK_TIMEOUT = 10
+WARM_CHAT_TIMEOUT = 5
+
+# Modos de envio: 'cold' recarrega o WhatsApp Web a cada contato (send?phone=),
+# 'warm' abre a conversa dentro da página já carregada no login
+SEND_MODE_COLD = 'cold'
+SEND_MODE_WARM = 'warm'
+MAX_WARM_FALLBACKS = 3
+
+# Instala um MutationObserver em #main que marca o envio como confirmado assim que
+# uma bolha de saída nova (data-id "true_...") exibir o ícone de check
+SEND_ACK_OBSERVER_SCRIPT = """
+const previous = window.__robodozapAck;
+if (previous && previous.observer) { previous.observer.disconnect(); }
+const root = document.querySelector('#main') || document.body;
+const known = new Set(Array.from(root.querySelectorAll('[data-id]')).map(e => e.getAttribute('data-id')));
+const sentIcons = ['msg-check', 'msg-dblcheck', 'msg-dblcheck-ack'];
+const state = {status: null, resolve: null, observer: null};
+const check = () => {
+    for (const row of root.querySelectorAll('[data-id^="true_"]')) {
+        if (known.has(row.getAttribute('data-id'))) { continue; }
+        const icons = Array.from(row.querySelectorAll('span[data-icon]')).map(i => i.getAttribute('data-icon'));
+        if (icons.some(icon => sentIcons.includes(icon))) {
+            state.status = 'acked';
+            state.observer.disconnect();
+            if (state.resolve) { state.resolve('acked'); }
+            return;
+        }
+    }
+};
+state.observer = new MutationObserver(check);
+state.observer.observe(root, {childList: true, subtree: true, attributes: true, attributeFilter: ['data-icon']});
+window.__robodozapAck = state;
+"""
+
+# Modo warm: a conversa é aberta pela pesquisa da lista de conversas (#side),
+# digitando o número e clicando no resultado com esse número, como uma pessoa faria.
+# Ainda não conferido no WhatsApp Web real, por isso o padrão continua 'cold'
+WHATSAPP_SEARCH_BOX_SELECTOR = '#side div[contenteditable="true"][data-tab="3"], #side div[contenteditable="true"][role="textbox"]'
+
+# Marca o #main atual para distinguir a conversa aberta pela pesquisa
+PREPARE_CHAT_SEARCH_SCRIPT = """
+const current = document.querySelector('#main');
+if (current) { current.setAttribute('data-robodozap-stale', '1'); }
+"""
+
+# Resultado da pesquisa cujo título (número formatado, ex.: "+55 67 91234-5678")
+# tem exatamente os dígitos do telefone; null enquanto ele não aparece
+SEARCH_RESULT_SCRIPT = """
+for (const title of document.querySelectorAll('#side span[title], #pane-side span[title]')) {
+    if (title.getAttribute('title').replace(/\\D/g, '') === arguments[0]) {
+        return title.closest('[role="listitem"], [role="row"]') || title;
+    }
+}
+return null;
+"""
+WARM_TEXTBOX_SELECTOR = '#main:not([data-robodozap-stale]) div[role="textbox"]'
+
+# Cola o texto na caixa de mensagem (preserva emojis e quebras de linha); o
+# segundo argumento opcional troca a caixa (ex.: legenda do anexo)
+INSERT_TEXT_SCRIPT = """
+const box = document.querySelector(arguments[1] || '#main div[role="textbox"]');
+box.focus();
+const data = new DataTransfer();
+data.setData('text/plain', arguments[0]);
+box.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+"""
+
+# Estado da tela após abrir uma conversa: 'chat', 'invalid' (aviso de número
+# sem WhatsApp, que é fechado) ou null enquanto nenhum dos dois apareceu
+CHAT_STATE_SCRIPT = """
+if (document.querySelector(arguments[0])) { return 'chat'; }
+const popup = document.querySelector('[data-animate-modal-popup="true"], div[role="dialog"]');
+if (popup && /inv[aá]lid/i.test(popup.innerText)) {
+    const ok = popup.querySelector('button');
+    if (ok) { ok.click(); }
+    return 'invalid';
+}
+return null;
+"""
+
+# Estado da tela de login: 'logged_in' (lista de conversas), 'qr' (QR Code para
+# escanear) ou null enquanto a página ainda não mostrou nenhum dos dois
+LOGIN_STATE_SCRIPT = """
+if (document.querySelector(arguments[0])) { return 'logged_in'; }
+if (document.querySelector(arguments[1])) { return 'qr'; }
+return null;
+"""
+
+# Aguarda (assíncrono) o observer instalado acima resolver ou o tempo esgotar
+SEND_ACK_WAIT_SCRIPT = """
+const done = arguments[arguments.length - 1];
+const state = window.__robodozapAck;
+if (!state) { done('no-observer'); return; }
+if (state.status) { done(state.status); return; }
+const timer = setTimeout(() => { state.observer.disconnect(); done('timeout'); }, arguments[0]);
+state.resolve = (status) => { clearTimeout(timer); done(status); };
+"""
 
 # Adicionar constante para tipos de navegador
 BROWSER_TYPES = {
@@ -53,80 +412,453 @@ BROWSER_TYPES = {
     'edge': 'Microsoft Edge'
 }
 
+# Chaves do config.json: o valor padrão também define o tipo aceito em
+# ConfigService.update(); CONFIG_CHOICES restringe os valores de algumas
+CONFIG_DEFAULTS = {
+    'api_key': '',
+    'serial_number': '',
+    'whatsapp': {'number': '', 'menu_link': ''},
+    'browser_type': 'chrome',
+    'send_mode': SEND_MODE_COLD,
+    'lean_browser': False,
+    'keep_browser_open': False,
+    'personalize_messages': False,
+    'invalid_phone_policy': INVALID_PHONE_SKIP,
+    'metrics_port': METRICS_PORT,
+    'accounts': [],
+    'limits': {},  # Ajustes dos limites de envio (chaves de CAMPAIGN_LIMITS)
+    'send_window': '',  # Janela diária de envio padrão das campanhas ("08:00-20:00"; vazio = qualquer hora)
+    'menu_attachment': '',  # Imagem ou PDF do cardápio anexado a cada mensagem (vazio = só texto)
+}
+CONFIG_CHOICES = {
+    'browser_type': set(BROWSER_TYPES),
+    'send_mode': {SEND_MODE_WARM, SEND_MODE_COLD},
+    'invalid_phone_policy': {INVALID_PHONE_SKIP, INVALID_PHONE_DEPRIORITIZE},
+}
+
+# Executáveis dos navegadores (PATH e pastas padrão do Windows)
+BROWSER_BINARIES = {
+    'chrome': {
+        'names': ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome'],
+        'paths': [
+            ('PROGRAMFILES', r'Google\Chrome\Application\chrome.exe'),
+            ('PROGRAMFILES(X86)', r'Google\Chrome\Application\chrome.exe'),
+            ('LOCALAPPDATA', r'Google\Chrome\Application\chrome.exe'),
+        ]
+    },
+    'edge': {
+        'names': ['msedge', 'microsoft-edge', 'microsoft-edge-stable'],
+        'paths': [
+            ('PROGRAMFILES(X86)', r'Microsoft\Edge\Application\msedge.exe'),
+            ('PROGRAMFILES', r'Microsoft\Edge\Application\msedge.exe'),
+        ]
+    }
+}
+
 # Adicionar variável global para a barra de progresso
 progress_frame = None
 progress_var = None
 progress_label = None
 
-def load_config():
-    """Carrega configurações"""
-    if not os.path.exists(CONFIG_FILE):
-        if not os.path.exists(CONFIG_TEMPLATE_FILE):
-            raise FileNotFoundError("Arquivo config.template.json não encontrado!")
-            
-        with open(CONFIG_TEMPLATE_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            config["api_key"] = input("Digite sua Gemini API key: ")
-            config["whatsapp"] = {
+# Quantas vezes seguidas o modo warm precisou cair para o recarregamento completo (por sessão)
+warm_fallbacks = {}
+
+# Acionado para interromper o envio em andamento (inclusive no meio de uma espera)
+stop_sending = threading.Event()
+
+# Serializa a resolução dos WebDrivers entre as contas
+driver_path_lock = threading.Lock()
+
+class Metrics:
+    """Contadores e histogramas de latência do robô, com log de eventos
+
+    count(), gauge() e observe() só atualizam números em memória (com
+    rótulos, ex.: fase do envio ou classe da falha); event() acrescenta uma linha JSON em
+    METRICS_EVENTS_FILE. serve() publica tudo em um endpoint HTTP local:
+    /metrics no formato texto do Prometheus e /metrics.json como dicionário.
+    """
+    def __init__(self, events_path=METRICS_EVENTS_FILE, buckets=METRICS_BUCKETS):
+        self.events_path = events_path
+        self.buckets = tuple(buckets)
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.events = None
+        self.server = None
+
+    def count(self, name, value=1, **labels):
+        """Soma `value` ao contador `name` com os rótulos indicados"""
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def gauge(self, name, value, **labels):
+        """Guarda o valor atual de `name` (ex.: memória do navegador)"""
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        """Registra uma duração no histograma `name`"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Mede o bloco `with` no histograma `name`"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - inicio, **labels)
+
+    def event(self, kind, **fields):
+        """Acrescenta um evento ao log JSON-lines"""
+        line = json.dumps({'ts': round(time.time(), 3), 'event': kind, **fields}, ensure_ascii=False)
+        with self.lock:
+            try:
+                if self.events is None:
+                    self.events = open(self.events_path, 'a', encoding='utf-8', buffering=1)
+                self.events.write(line + "\n")
+            except OSError as e:
+                print(f"Erro ao gravar evento: {e}")
+
+    def snapshot(self):
+        """Cópia dos contadores, medidores e histogramas (nome{rótulos} -> valor)"""
+        with self.lock:
+            counters = {self._label(key): value for key, value in self.counters.items()}
+            gauges = {self._label(key): value for key, value in self.gauges.items()}
+            histograms = {
+                self._label(key): {
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 3),
+                    'mean': round(histogram['sum'] / histogram['count'], 3),
+                    'buckets': dict(zip([*map(str, self.buckets), '+Inf'],
+                                        itertools.accumulate(histogram['buckets']))),
+                }
+                for key, histogram in self.histograms.items()
+            }
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def render(self):
+        """Métricas no formato texto do Prometheus"""
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"robodozap_{name}{self._labels(labels)} {value:g}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append(f"robodozap_{name}{self._labels(labels)} {value:g}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                for bound, total in zip([*map(str, self.buckets), '+Inf'],
+                                        itertools.accumulate(histogram['buckets'])):
+                    lines.append(f"robodozap_{name}_bucket{self._labels(labels + (('le', bound),))} {total}")
+                lines.append(f"robodozap_{name}_sum{self._labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"robodozap_{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT):
+        """Sobe o endpoint HTTP local em uma thread própria; retorna a URL ou None"""
+        if not port or self.server:
+            return None
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        except OSError as e:
+            print(f"⚠️ Endpoint de métricas indisponível na porta {port}: {e}")
+            return None
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/metrics"
+        print(f"📈 Métricas em {url}")
+        return url
+
+    def close(self):
+        """Encerra o endpoint e fecha o log de eventos"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        with self.lock:
+            if self.events:
+                self.events.close()
+                self.events = None
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    @classmethod
+    def _label(cls, key):
+        return key[0] + cls._labels(key[1])
+
+metrics = Metrics()
+
+def parse_window(text):
+    """'08:00-20:00' -> (480, 1200) em minutos do dia; vazio -> None. Levanta ValueError se inválida
+
+    Uma janela que termina antes de começar atravessa a meia-noite ("22:00-02:00").
+    """
+    if not text:
+        return None
+    match = SEND_WINDOW_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Janela de envio inválida: {text} (use HH:MM-HH:MM)")
+    inicio_h, inicio_m, fim_h, fim_m = map(int, match.groups())
+    if inicio_h > 23 or fim_h > 24 or inicio_m > 59 or fim_m > 59:
+        raise ValueError(f"Janela de envio inválida: {text}")
+    inicio, fim = inicio_h * 60 + inicio_m, fim_h * 60 + fim_m
+    if inicio == fim:
+        raise ValueError(f"Janela de envio vazia: {text}")
+    return inicio, fim
+
+def in_window(window, quando):
+    """Indica se `quando` está dentro da janela (None = sempre)"""
+    if window is None:
+        return True
+    inicio, fim = window
+    minuto = quando.hour * 60 + quando.minute
+    return inicio <= minuto < fim if inicio < fim else minuto >= inicio or minuto < fim
+
+def next_window_change(window, quando):
+    """Próximo momento em que a janela abre (se fechada) ou fecha (se aberta); None se sempre aberta"""
+    if window is None:
+        return None
+    limite = window[1] if in_window(window, quando) else window[0]
+    dia = quando.replace(hour=0, minute=0, second=0, microsecond=0)
+    mudanca = dia + timedelta(minutes=limite)
+    if mudanca <= quando:
+        mudanca += timedelta(days=1)
+    return mudanca
+
+def validate_limits(limits):
+    """Confere limites de envio (chaves de CAMPAIGN_LIMITS); levanta ValueError se inválidos"""
+    unknown = set(limits) - set(CAMPAIGN_LIMITS)
+    if unknown:
+        raise ValueError(f"Limites desconhecidos: {', '.join(sorted(unknown))}")
+    for limit, value in limits.items():
+        tipo, minimo = CAMPAIGN_LIMITS[limit]
+        aceitos = int if tipo is int else (int, float)
+        if not isinstance(value, aceitos) or isinstance(value, bool) or value < minimo:
+            descricao = "um número inteiro" if tipo is int else "um número"
+            raise ValueError(f"O limite '{limit}' deve ser {descricao} maior ou igual a {minimo}")
+
+class ConfigService:
+    """Configuração do app (config.json), lida do disco uma única vez
+
+    get() responde da memória, com o padrão de CONFIG_DEFAULTS para chaves
+    ausentes. update() confere os tipos, grava o arquivo inteiro de forma
+    atômica e avisa quem se inscreveu em subscribe() com as chaves que
+    mudaram, na thread que fez a alteração: assim limites de envio,
+    navegador e link do cardápio mudam no meio de uma campanha.
+    """
+    def __init__(self, path=CONFIG_FILE, template_path=CONFIG_TEMPLATE_FILE):
+        self.path = path
+        self.template_path = template_path
+        self.values = None
+        self.listeners = []
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Lê o config.json, criando-o pelo modelo na primeira execução"""
+        with self.lock:
+            if self.values is not None:
+                return
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.values = json.load(f)
+                return
+            if not os.path.exists(self.template_path):
+                raise FileNotFoundError("Arquivo config.template.json não encontrado!")
+            with open(self.template_path, 'r', encoding='utf-8') as f:
+                values = json.load(f)
+            values["api_key"] = input("Digite sua Gemini API key: ")
+            values["whatsapp"] = {
                 "number": input("Digite seu número WhatsApp: "),
                 "menu_link": input("Digite o link do cardápio: ")
             }
-            
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
-        return config
-        
-    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+            self._write(values)
+            self.values = values
 
-def save_config(config):
-    """Salva as configurações no arquivo config.json"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
-        return True
-    except Exception as e:
-        messagebox.showerror("Erro", f"Erro ao salvar configurações: {e}")
-        return False
+    def get(self, key):
+        """Valor atual da chave (cópia, pode ser alterada à vontade)"""
+        with self.lock:
+            self.load()
+            return copy.deepcopy(self.values.get(key, CONFIG_DEFAULTS.get(key)))
+
+    def update(self, **values):
+        """Confere, grava e publica as alterações; retorna {chave: valor novo} do que mudou
+
+        Chaves com dicionário (whatsapp, limits) são mescladas com o valor
+        atual. Valores inválidos levantam ValueError e nada é gravado.
+        """
+        with self.lock:
+            self.load()
+            changed = {}
+            for key, value in values.items():
+                current = self.values.get(key, CONFIG_DEFAULTS.get(key))
+                if isinstance(value, dict) and isinstance(current, dict):
+                    value = {**current, **value}
+                self._check(key, value)
+                if value != current:
+                    changed[key] = copy.deepcopy(value)
+            if not changed:
+                return {}
+            updated = {**self.values, **changed}
+            self._write(updated)
+            self.values = updated
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                print(f"Erro ao aplicar configuração: {e}")
+        return changed
+
+    def subscribe(self, listener):
+        """Passa a chamar listener({chave: valor novo}) a cada alteração"""
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    @staticmethod
+    def _check(key, value):
+        default = CONFIG_DEFAULTS.get(key)
+        if default is None:
+            return
+        if isinstance(default, bool):
+            valid = isinstance(value, bool)
+        elif isinstance(default, int):
+            valid = isinstance(value, int) and not isinstance(value, bool)
+        else:
+            valid = isinstance(value, type(default))
+        if not valid:
+            raise ValueError(f"Configuração '{key}' deve ser do tipo {type(default).__name__}")
+        if key in CONFIG_CHOICES and value not in CONFIG_CHOICES[key]:
+            raise ValueError(f"Configuração '{key}' inválida: {value}")
+        if key == 'limits':
+            validate_limits(value)
+        if key == 'send_window':
+            parse_window(value)
+
+    def _write(self, values):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(values, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+config_service = ConfigService()
+
+def apply_config(changed=None):
+    """Atualiza as variáveis globais que espelham a configuração"""
+    global GEMINI_API_KEY, WHATSAPP_NUMBER, MENU_LINK, LEAN_BROWSER
+    GEMINI_API_KEY = config_service.get("api_key")
+    LEAN_BROWSER = config_service.get("lean_browser")
+    whatsapp = config_service.get("whatsapp")
+    WHATSAPP_NUMBER = whatsapp.get("number", "")
+    MENU_LINK = whatsapp.get("menu_link", "")
 
 def initialize_config():
-    """Inicializa configurações globais"""
-    global GEMINI_API_KEY, WHATSAPP_NUMBER, MENU_LINK
-    config = load_config()
-    GEMINI_API_KEY = config.get("api_key", "")
-    WHATSAPP_NUMBER = config.get("whatsapp", {}).get("number", "")
-    MENU_LINK = config.get("whatsapp", {}).get("menu_link", "")
-
-def initialize_driver(headless=True, browser_type='chrome'):
-    """Inicializa WebDriver com opção de escolha entre Chrome e Edge"""
-    if browser_type == 'chrome':
-        return initialize_chrome_driver(headless)
-    else:
-        return initialize_edge_driver(headless)
+    """Carrega a configuração e mantém as variáveis globais em dia com ela"""
+    config_service.load()
+    apply_config()
+    config_service.subscribe(apply_config)
+
+def send_limits():
+    """Limites de envio em vigor: os padrões do app com os ajustes do config.json"""
+    return {
+        'per_hour': MAX_MESSAGES_PER_HOUR,
+        'spacing': DELAY_BETWEEN_MESSAGES,
+        'batch_size': BATCH_SIZE,
+        'batch_pause': BATCH_PAUSE,
+        **config_service.get('limits')
+    }
+
+def initialize_driver(headless=True, browser_type='chrome', user_data_dir=None, lean=False):
+    """Inicializa WebDriver com opção de escolha entre Chrome e Edge
+
+    `user_data_dir` permite abrir o perfil de outra conta (padrão USER_DATA_DIR).
+    Com `lean` o navegador sobe enxuto (LEAN_BROWSER_ARGS e LEAN_BROWSER_PREFS)
+    e bloqueia imagens, mídia e fontes (LEAN_BLOCKED_URLS).
+    """
+    with metrics.timer('driver_startup_seconds', browser=browser_type, method='webdriver'):
+        if browser_type == 'chrome':
+            driver = initialize_chrome_driver(headless, user_data_dir, lean)
+        else:
+            driver = initialize_edge_driver(headless, user_data_dir, lean)
+    if driver and lean:
+        apply_lean_profile(driver)
+    return driver
+
+def apply_lean_profile(driver):
+    """Bloqueia imagens, mídia, fontes e telemetria na aba do navegador (CDP)"""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URLS})
+    except Exception as e:
+        print(f"⚠️ Não foi possível bloquear imagens e mídia: {e}")
 
-def initialize_chrome_driver(headless):
+def initialize_chrome_driver(headless, user_data_dir=None, lean=False):
     """Inicializa Chrome WebDriver"""
     # Manter código existente do Chrome exatamente como está
     options = Options()
     if headless:
         options.add_argument("--headless=new")
         options.add_argument("--window-size=1920,1080")
-    options.add_argument(f"user-data-dir={USER_DATA_DIR}")
+    options.add_argument(f"user-data-dir={user_data_dir or USER_DATA_DIR}")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--disable-gpu")
     options.add_argument("--disable-notifications")
-    service = ChromeService(ChromeDriverManager().install())
+    if lean:
+        for argument in LEAN_BROWSER_ARGS:
+            options.add_argument(argument)
+        options.add_experimental_option('prefs', LEAN_BROWSER_PREFS)
+    service = ChromeService(resolve_driver_path('chrome'))
     return webdriver.Chrome(service=service, options=options)
 
-def initialize_edge_driver(headless):
+def initialize_edge_driver(headless, user_data_dir=None, lean=False):
     """Inicializa Edge WebDriver"""
     try:
         # Debug info
         print("🔄 Iniciando configuração do Edge...")
         
         # Cria pasta de dados se não existir
-        edge_data_dir = os.path.join(USER_DATA_DIR, "edge")
+        edge_data_dir = os.path.join(user_data_dir or USER_DATA_DIR, "edge")
         os.makedirs(edge_data_dir, exist_ok=True)
         
         # Configurações do Edge
@@ -144,11 +876,13 @@ def initialize_edge_driver(headless):
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--disable-notifications')
         options.add_argument('--window-size=1920,1080')
+        if lean:
+            for argument in LEAN_BROWSER_ARGS:
+                options.add_argument(argument)
+            options.add_experimental_option('prefs', LEAN_BROWSER_PREFS)
         
-        # Instala/atualiza driver do Edge
-        print("⬇️ Instalando/atualizando Edge WebDriver...")
-        edge_path = EdgeChromiumDriverManager().install()
-        service = EdgeService(edge_path)
+        # Driver do Edge resolvido uma vez e reaproveitado do cache
+        service = EdgeService(resolve_driver_path('edge'))
         
         # Inicializa o driver com mais tempo de espera
         print("🚀 Iniciando Edge WebDriver...")
@@ -162,13 +896,387 @@ def initialize_edge_driver(headless):
         
     except Exception as e:
         print(f"❌ Erro ao inicializar Edge: {str(e)}")
-        messagebox.showerror("Erro", 
+        ui.show_error("Erro",
             f"Erro ao inicializar Microsoft Edge:\n{str(e)}\n"
             "Verifique se o Edge está instalado corretamente.")
         return None
 
-def get_dia_semana():
-    """Retorna o dia da semana atual em português"""
+def load_driver_cache():
+    """Carrega os caminhos de WebDriver já resolvidos em execuções anteriores"""
+    try:
+        if os.path.exists(DRIVER_CACHE_FILE):
+            with open(DRIVER_CACHE_FILE, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Erro ao carregar cache de drivers: {e}")
+    return {}
+
+def resolve_driver_path(browser_type):
+    """Retorna o caminho do WebDriver, consultando o webdriver_manager só uma vez
+
+    Se o binário salvo em DRIVER_CACHE_FILE ainda existe em disco ele é usado
+    direto, sem consulta de versão pela rede (funciona offline).
+    """
+    with driver_path_lock:
+        cache = load_driver_cache()
+        path = cache.get(browser_type)
+        if path and os.path.exists(path):
+            return path
+
+        print(f"⬇️ Resolvendo WebDriver para {BROWSER_TYPES[browser_type]}...")
+        if browser_type == 'chrome':
+            path = ChromeDriverManager().install()
+        else:
+            path = EdgeChromiumDriverManager().install()
+
+        cache[browser_type] = path
+        try:
+            with open(DRIVER_CACHE_FILE, 'w') as f:
+                json.dump(cache, f, indent=4)
+        except Exception as e:
+            print(f"Erro ao salvar cache de drivers: {e}")
+        return path
+
+def invalidate_driver_path(browser_type):
+    """Descarta o WebDriver em cache (ex.: navegador foi atualizado)"""
+    with driver_path_lock:
+        cache = load_driver_cache()
+        if cache.pop(browser_type, None):
+            with open(DRIVER_CACHE_FILE, 'w') as f:
+                json.dump(cache, f, indent=4)
+
+def find_browser_binary(browser_type):
+    """Localiza o executável do navegador no PATH ou nas pastas padrão do Windows"""
+    binaries = BROWSER_BINARIES[browser_type]
+    for name in binaries['names']:
+        path = shutil.which(name)
+        if path:
+            return path
+    for env_var, relative_path in binaries['paths']:
+        base = os.environ.get(env_var)
+        if base and os.path.exists(os.path.join(base, relative_path)):
+            return os.path.join(base, relative_path)
+    return None
+
+def read_devtools_port(profile_dir):
+    """Retorna a porta de depuração de um navegador vivo nesse perfil, se houver"""
+    try:
+        with open(os.path.join(profile_dir, DEVTOOLS_PORT_FILE), 'r') as f:
+            port = int(f.readline().strip())
+        info = requests.get(f"http://127.0.0.1:{port}/json/version", timeout=1).json()
+        return port, 'Headless' in info.get('User-Agent', '')
+    except Exception:
+        return None
+
+def seed_lean_prefs(profile_dir, lean):
+    """Grava (ou retira) LEAN_BROWSER_PREFS no arquivo Preferences do perfil antes de abrir o navegador
+
+    É o equivalente às prefs do ChromeOptions para o navegador aberto por
+    nós; retirar devolve o perfil ao normal para o navegador visível do QR Code.
+    """
+    path = os.path.join(profile_dir, "Default", "Preferences")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            prefs = json.load(f)
+    except (OSError, ValueError):
+        if not lean:
+            return
+        prefs = {}
+    changed = False
+    for key, value in LEAN_BROWSER_PREFS.items():
+        *parents, leaf = key.split('.')
+        node = prefs
+        for parent in parents:
+            if not isinstance(node.get(parent), dict):
+                if not lean:
+                    break
+                node[parent] = {}
+            node = node[parent]
+        else:
+            if lean and node.get(leaf) != value:
+                node[leaf] = value
+                changed = True
+            elif not lean and leaf in node:
+                del node[leaf]
+                changed = True
+    if changed:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(prefs, f)
+        os.replace(temp_path, path)
+
+def launch_debuggable_browser(browser_type, headless, profile_dir, lean=False):
+    """Abre o navegador com porta de depuração remota e retorna (processo, porta)"""
+    binary = find_browser_binary(browser_type)
+    if not binary:
+        return None, None
+    seed_lean_prefs(profile_dir, lean)
+
+    # Remove porta de uma execução antiga para não anexar ao processo errado
+    port_file = os.path.join(profile_dir, DEVTOOLS_PORT_FILE)
+    if os.path.exists(port_file):
+        os.remove(port_file)
+
+    args = [
+        binary,
+        f"--user-data-dir={profile_dir}",
+        "--remote-debugging-port=0",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--no-sandbox",
+        "--disable-dev-shm-usage",
+        "--disable-gpu",
+        "--disable-notifications",
+        "--window-size=1920,1080",
+    ]
+    if headless:
+        args.append("--headless=new")
+    if lean:
+        args.extend(LEAN_BROWSER_ARGS)
+    args.append("about:blank")
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # O navegador grava a porta escolhida em DevToolsActivePort ao subir
+    limite = time.time() + BROWSER_START_TIMEOUT
+    while time.time() < limite:
+        found = read_devtools_port(profile_dir)
+        if found:
+            return process, found[0]
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    return None, None
+
+def attach_driver(browser_type, port):
+    """Conecta um WebDriver ao navegador já aberto na porta de depuração"""
+    for attempt in range(2):
+        try:
+            if browser_type == 'chrome':
+                options = Options()
+                options.debugger_address = f"127.0.0.1:{port}"
+                return webdriver.Chrome(service=ChromeService(resolve_driver_path('chrome')), options=options)
+            options = EdgeOptions()
+            options.debugger_address = f"127.0.0.1:{port}"
+            return webdriver.Edge(service=EdgeService(resolve_driver_path('edge')), options=options)
+        except SessionNotCreatedException:
+            # Driver em cache incompatível com o navegador: resolve de novo uma vez
+            if attempt:
+                raise
+            invalidate_driver_path(browser_type)
+
+def devtools_browser_pid(driver):
+    """PID do processo principal do navegador, informado pelo DevTools (None se indisponível)"""
+    try:
+        for info in driver.execute_cdp_cmd('SystemInfo.getProcessInfo', {})['processInfo']:
+            if info.get('type') == 'browser':
+                return info['id']
+    except Exception:
+        pass
+    return None
+
+def stop_driver_service(driver):
+    """Encerra o processo do WebDriver sem fechar o navegador ao qual ele está ligado"""
+    try:
+        driver.service.stop()
+    except Exception as e:
+        print(f"Erro ao encerrar o WebDriver: {e}")
+
+def wait_browser_exit(profile_dir, pid=None):
+    """Aguarda o navegador do perfil sair (porta de depuração fechada); encerra o `pid` se demorar"""
+    limite = time.time() + BROWSER_START_TIMEOUT
+    while time.time() < limite:
+        if not read_devtools_port(profile_dir):
+            return
+        time.sleep(0.2)
+    if psutil and pid:
+        try:
+            psutil.Process(pid).terminate()
+        except psutil.Error:
+            pass
+
+def close_devtools_browser(browser_type, port, profile_dir):
+    """Fecha o navegador que está aberto na porta de depuração e aguarda ele sair"""
+    pid = None
+    try:
+        driver = attach_driver(browser_type, port)
+        pid = devtools_browser_pid(driver)
+        try:
+            driver.execute_cdp_cmd('Browser.close', {})
+        except Exception:
+            pass
+        stop_driver_service(driver)
+    except Exception as e:
+        print(f"⚠️ Não foi possível conectar ao navegador aberto: {e}")
+    wait_browser_exit(profile_dir, pid)
+
+class BrowserService:
+    """Mantém um navegador por perfil aberto durante toda a sessão do app
+
+    Os envios pedem o navegador com get() e o devolvem com release(); ele só é
+    fechado em discard() (troca de modo headless, falha) ou shutdown(). Entre
+    o get() e o release() o navegador fica reservado para a thread que o
+    pediu: um get() de outra thread aguarda a devolução (ou o fim dessa
+    thread). Cada perfil tem o próprio lock, então abrir o navegador de uma
+    conta não segura as outras. Um navegador deixado vivo no perfil é
+    reaproveitado pela porta de depuração. Com LEAN_BROWSER o navegador
+    headless (o do envio) sobe enxuto; o visível, usado para ler o QR Code, nunca.
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def get(self, browser_type, headless=True, user_data_dir=None):
+        """Retorna um navegador pronto para o perfil, reaproveitando o que já existe"""
+        user_data_dir = user_data_dir or USER_DATA_DIR
+        lean = headless and LEAN_BROWSER
+        profile = self._profile(user_data_dir)
+        with profile:
+            while not self._available(user_data_dir):
+                profile.wait(BROWSER_RELEASE_RECHECK)
+            session = self.sessions.get(user_data_dir)
+            if session and (session['browser_type'], session['headless'], session['lean']) == (browser_type, headless, lean):
+                try:
+                    session['driver'].current_url
+                    session['owner'] = threading.current_thread()
+                    return session['driver']
+                except Exception:
+                    print("⚠️ Navegador em cache não responde, abrindo outro...")
+            self._close(user_data_dir)
+
+            profile_dir = os.path.join(user_data_dir, "edge") if browser_type == 'edge' else user_data_dir
+            os.makedirs(profile_dir, exist_ok=True)
+
+            process = None
+            pid = None
+            inicio = time.perf_counter()
+            found = read_devtools_port(profile_dir)
+            if found and found[1] != headless:
+                # Navegador de outro modo no perfil: o novo não subiria com ele aberto
+                print("⚠️ Fechando navegador de outro modo aberto neste perfil...")
+                close_devtools_browser(browser_type, found[0], profile_dir)
+                found = None
+            if found:
+                print("♻️ Anexando ao navegador já aberto neste perfil...")
+                port = found[0]
+                method = 'attach'
+            else:
+                process, port = launch_debuggable_browser(browser_type, headless, profile_dir, lean)
+                pid = process.pid if process else None
+                method = 'launch'
+
+            if port:
+                driver = attach_driver(browser_type, port)
+                if method == 'attach':
+                    pid = devtools_browser_pid(driver)
+                if lean:
+                    apply_lean_profile(driver)
+                metrics.observe('driver_startup_seconds', time.perf_counter() - inicio,
+                                browser=browser_type, method=method)
+                metrics.event('driver_start', browser=browser_type, method=method, headless=headless,
+                              seconds=round(time.perf_counter() - inicio, 3))
+            else:
+                # Sem executável localizável: WebDriver abre o navegador
+                driver = initialize_driver(headless=headless, browser_type=browser_type,
+                                           user_data_dir=user_data_dir, lean=lean)
+                if not driver:
+                    return None
+                # O navegador é filho do processo do WebDriver
+                service_process = getattr(getattr(driver, 'service', None), 'process', None)
+                pid = service_process.pid if service_process else None
+                method = 'webdriver'
+
+            self.sessions[user_data_dir] = {
+                'driver': driver,
+                'process': process,
+                'pid': pid,
+                'method': method,
+                'profile_dir': profile_dir,
+                'browser_type': browser_type,
+                'headless': headless,
+                'lean': lean,
+                'owner': threading.current_thread()
+            }
+            return driver
+
+    def release(self, driver):
+        """Devolve o navegador ao serviço, mantendo-o aberto para o próximo envio"""
+        for user_data_dir, session in list(self.sessions.items()):
+            if session['driver'] is driver:
+                profile = self._profile(user_data_dir)
+                with profile:
+                    session['owner'] = None
+                    profile.notify_all()
+                return
+
+    def browser_pid(self, user_data_dir=None):
+        """PID do navegador do perfil (ou do WebDriver que o abriu); None se desconhecido"""
+        session = self.sessions.get(user_data_dir or USER_DATA_DIR)
+        return session['pid'] if session else None
+
+    def discard(self, user_data_dir=None):
+        """Fecha o navegador do perfil (será reaberto no próximo get)"""
+        user_data_dir = user_data_dir or USER_DATA_DIR
+        profile = self._profile(user_data_dir)
+        with profile:
+            self._close(user_data_dir)
+            profile.notify_all()
+
+    def shutdown(self, keep_open=False):
+        """Fecha todos os navegadores abertos pelo serviço
+
+        Com keep_open=True os navegadores continuam rodando e a próxima execução
+        do app se anexa a eles pela porta de depuração, sem relançar; só os
+        processos do WebDriver (chromedriver/msedgedriver) são encerrados.
+        """
+        for user_data_dir in list(self.sessions):
+            with self._profile(user_data_dir):
+                if keep_open:
+                    session = self.sessions.pop(user_data_dir, None)
+                    if session:
+                        stop_driver_service(session['driver'])
+                else:
+                    self._close(user_data_dir)
+
+    def _profile(self, user_data_dir):
+        with self.lock:
+            return self.profiles.setdefault(user_data_dir, threading.Condition())
+
+    def _available(self, user_data_dir):
+        session = self.sessions.get(user_data_dir)
+        owner = session and session['owner']
+        return not owner or owner is threading.current_thread() or not owner.is_alive()
+
+    def _close(self, user_data_dir):
+        session = self.sessions.pop(user_data_dir, None)
+        if not session:
+            return
+        if session['method'] == 'attach':
+            # Navegador de uma execução anterior: o driver só se desconecta dele
+            try:
+                session['driver'].execute_cdp_cmd('Browser.close', {})
+            except Exception:
+                pass
+        try:
+            session['driver'].quit()
+        except Exception as e:
+            print(f"Erro ao fechar navegador: {e}")
+        # Navegador aberto por nós com porta de depuração não fecha com o driver
+        if session['process'] and session['process'].poll() is None:
+            session['process'].terminate()
+            try:
+                session['process'].wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                session['process'].kill()
+        elif session['method'] == 'attach':
+            wait_browser_exit(session['profile_dir'], session['pid'])
+
+browser_service = BrowserService()
+
+def get_dia_semana(quando=None):
+    """Retorna o dia da semana (atual ou de `quando`) em português"""
     dias = {
         'Monday': 'Segunda-feira',
         'Tuesday': 'Terça-feira',
@@ -178,90 +1286,378 @@ def get_dia_semana():
         'Saturday': 'Sábado',
         'Sunday': 'Domingo'
     }
-    return dias[datetime.now().strftime('%A')]
+    return dias[(quando or datetime.now()).strftime('%A')]
 
-def gerar_mensagem_pizza_mania(nome="%name%"):
-    """Gera mensagem personalizada via Gemini API"""
-    try:
-        url = "https://generativelanguage.googleapis.com/v1/models/gemini-pro:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": GEMINI_API_KEY
+def get_saudacao(quando=None):
+    """Saudação para a hora atual (ou de `quando`): bom dia, boa tarde ou boa noite"""
+    hora = (quando or datetime.now()).hour
+    saudacao = SAUDACOES[-1][1]
+    for inicio, texto in SAUDACOES:
+        if hora >= inicio:
+            saudacao = texto
+    return saudacao
+
+class VariantCache:
+    """Cache em disco (SQLite) das variantes de mensagem ainda não usadas
+
+    A chave identifica o pedido (prompt, dia da semana e generationConfig).
+    Cada variante é entregue uma única vez. Variantes mais antigas que
+    VARIANT_CACHE_TTL são descartadas e o total fica limitado a
+    VARIANT_CACHE_MAX, saindo as mais antigas primeiro.
+    """
+    def __init__(self, path=VARIANT_CACHE_FILE, ttl=VARIANT_CACHE_TTL, max_entries=VARIANT_CACHE_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connection(self):
+        """Abre o banco na primeira utilização (chamar com self.lock)"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS variants ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, "
+                "text TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS variants_key ON variants (key, id)")
+        return self.conn
+
+    def add(self, key, text):
+        """Guarda uma variante nova e aplica os limites de idade e tamanho"""
+        with self.lock:
+            conn = self._connection()
+            conn.execute("INSERT INTO variants (key, text, created_at) VALUES (?, ?, ?)",
+                         (key, text, time.time()))
+            conn.execute("DELETE FROM variants WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "DELETE FROM variants WHERE id NOT IN "
+                "(SELECT id FROM variants ORDER BY id DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def pop(self, key):
+        """Retira e retorna a variante mais antiga da chave (None se não houver)"""
+        with self.lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT id, text FROM variants WHERE key = ? AND created_at >= ? ORDER BY id LIMIT 1",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM variants WHERE id = ?", (row[0],))
+            conn.commit()
+            return row[1]
+
+    def count(self, key):
+        """Quantidade de variantes prontas para a chave"""
+        with self.lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM variants WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()[0]
+
+class GeminiClient:
+    """Cliente do Gemini com conexões reaproveitadas, timeouts e variantes pré-geradas
+
+    Uma requests.Session mantém as conexões abertas (sem novo handshake TLS a
+    cada chamada) e as gerações rodam em paralelo em até GEMINI_WORKERS
+    threads. Para cada pedido o cliente mantém VARIANT_POOL_SIZE variantes
+    prontas no VariantCache: take() entrega uma delas na hora e repõe o
+    estoque em segundo plano.
+    """
+    def __init__(self, cache=None, pool_size=VARIANT_POOL_SIZE, workers=GEMINI_WORKERS,
+                 timeout=GEMINI_TIMEOUT):
+        self.cache = cache or VariantCache()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini")
+        self.pending = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def cache_key(body, weekday):
+        """Chave do estoque: prompt, dia da semana e configuração de geração"""
+        payload = json.dumps(
+            {'contents': body['contents'], 'config': body.get('generationConfig', {}), 'weekday': weekday},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def generate(self, body):
+        """Faz uma chamada ao Gemini e retorna o texto gerado"""
+        response = self.session.post(
+            GEMINI_API_URL,
+            json=body,
+            headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
+
+    def take(self, body, weekday=None):
+        """Retorna uma variante nova: do estoque, de uma geração em andamento ou gerada na hora"""
+        weekday = weekday or get_dia_semana()
+        key = self.cache_key(body, weekday)
+        text = self.cache.pop(key)
+        if text is None:
+            with self.lock:
+                pending = list(self.pending.get(key, ()))
+            if pending:
+                wait_futures(pending, timeout=sum(self.timeout), return_when=FIRST_COMPLETED)
+                text = self.cache.pop(key)
+        if text is None:
+            text = self.generate(body)
+        self.prefetch(body, weekday)
+        return text
+
+    def prefetch(self, body, weekday=None):
+        """Completa em segundo plano o estoque de variantes do pedido"""
+        weekday = weekday or get_dia_semana()
+        key = self.cache_key(body, weekday)
+        with self.lock:
+            pending = self.pending.setdefault(key, set())
+            for _ in range(self.pool_size - self.cache.count(key) - len(pending)):
+                future = self.executor.submit(self._generate_variant, key, body)
+                pending.add(future)
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+
+    def shutdown(self):
+        """Cancela as gerações pendentes e fecha as conexões"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def _generate_variant(self, key, body):
+        try:
+            self.cache.add(key, self.generate(body))
+        except Exception as e:
+            print(f"Erro ao pré-gerar mensagem: {e}")
+
+    def _finished(self, key, future):
+        with self.lock:
+            self.pending.get(key, set()).discard(future)
+
+gemini_client = GeminiClient()
+
+# Gerações pedidas pelo preview, fora do loop do Tk
+preview_executor = ThreadPoolExecutor(max_workers=PREVIEW_CANDIDATES, thread_name_prefix="preview")
+
+def montar_prompt_pizza_mania():
+    """Corpo da requisição ao Gemini para o texto da Pizza Mania"""
+    return {
+        "contents": [{
+            "role": "user",
+            "parts": [{
+                "text": PIZZA_MANIA_PROMPT
+            }]
+        }],
+        "generationConfig": {
+            "temperature": 0.8,
+            "maxOutputTokens": 100
         }
-        
-        dia_atual = get_dia_semana()
-        
-        prompt = {
-            "contents": [{
-                "role": "user",
-                "parts": [{
-                    "text": (
-                        f"Crie uma mensagem divertida e amigável para uma pizzaria seguindo estas regras:\n"
-                        f"1. NÃO inclua saudação inicial ou nome\n"
-                        f"2. Use muitos emojis relevantes (pizza, comida, diversão)\n"
-                        f"3. Fale sobre como é bom comer pizza hoje\n"
-                        f"4. Use o nome *Pizza Mania* mencionando que é a melhor pizzaria\n"
-                        f"5. NÃO mencione promoções, descontos ou cupons\n"
-                        f"6. Use negrito com *texto* em palavras-chave\n"
-                        f"7. Use itálico com _texto_ para ênfase\n"
-                        f"8. Mantenha a mensagem curta (máximo 3 linhas)\n"
-                        f"9. Seja divertido e acolhedor\n"
-                        f"10. Foque em sabor, qualidade e momentos felizes\n"
-                        f"11. NÃO inclua valores ou preços\n"
-                        f"12. NÃO mencione horários de funcionamento\n"
-                        f"13. Apenas crie um texto amigável sobre pizza\n"
-                        f"14. Encerre com uma chamada para pedir pizza"
-                    )
-                }]
-            }],
-            "generationConfig": {
-                "temperature": 0.8,
-                "maxOutputTokens": 100
-            }
+    }
+
+def montar_prompt_personalizado(clientes):
+    """Corpo da requisição ao Gemini pedindo um texto por cliente, em JSON
+
+    `clientes` é um DataFrame do lote; o perfil de cada um vem da data de
+    cadastro (created_at, dd/mm/aaaa) e é calculado de uma vez para o lote.
+    """
+    if 'created_at' in clientes:
+        cadastro = pd.to_datetime(clientes['created_at'], format='%d/%m/%Y', errors='coerce')
+    else:
+        cadastro = pd.Series(pd.NaT, index=clientes.index)
+    dias = (pd.Timestamp.now().normalize() - cadastro).dt.days
+    perfis = np.select(
+        [dias <= 30, dias <= 180, dias > 180],
+        ['cliente novo, cadastrado há poucos dias', 'cliente recente', 'cliente fiel há mais de 6 meses'],
+        default='cliente'
+    )
+    lista = "\n".join(f"{i}: {perfil}" for i, perfil in enumerate(perfis))
+    return {
+        "contents": [{
+            "role": "user",
+            "parts": [{
+                "text": (
+                    f"{PIZZA_MANIA_PROMPT}\n\n"
+                    f"Crie um texto diferente para cada cliente da lista abaixo (id: perfil), "
+                    f"adaptado ao perfil de cada um:\n{lista}\n\n"
+                    f'Responda somente com um JSON no formato [{{"id": 0, "texto": "..."}}], '
+                    f"com um item para cada id."
+                )
+            }]
+        }],
+        "generationConfig": {
+            "temperature": 0.8,
+            "maxOutputTokens": min(8192, 150 * len(clientes))
         }
+    }
 
-        response = requests.post(url, json=prompt, headers=headers)
-        corpo_mensagem = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-            
-    except Exception as e:
-        print(f"Erro ao gerar mensagem: {e}")
-        corpo_mensagem = "🌟 Venha para a *Pizza Mania*! _A melhor pizzaria da cidade_ 🍕✨"
-    
-    # Formato final da mensagem com ordem específica
-    mensagem_completa = (
-        f"*Boa noite {nome}!* 👋\n\n"  # Saudação inicial com placeholder
+def parse_personalized_bodies(texto, tamanho):
+    """Extrai {id: texto} da resposta em JSON do lote, descartando itens inválidos"""
+    inicio, fim = texto.find('['), texto.rfind(']')
+    if inicio < 0 or fim < inicio:
+        raise ValueError("Resposta sem lista JSON")
+    corpos = {}
+    for item in json.loads(texto[inicio:fim + 1]):
+        if not isinstance(item, dict):
+            continue
+        indice, corpo = item.get('id'), item.get('texto')
+        if (isinstance(indice, int) and 0 <= indice < tamanho and isinstance(corpo, str)
+                and 0 < len(corpo.strip()) <= PERSONALIZE_MAX_CHARS):
+            corpos.setdefault(indice, corpo.strip())
+    return corpos
+
+class BatchPersonalizer:
+    """Gera o texto da IA de cada contato em lotes, adiantado em relação ao envio
+
+    feed() repassa os contatos ao envio mantendo os próximos
+    PERSONALIZE_LOOKAHEAD lotes de PERSONALIZE_BATCH_SIZE contatos em geração
+    no GeminiClient (uma chamada por lote). body_for() devolve o texto do
+    contato, ou DEFAULT_MESSAGE_BODY se o lote falhou, o item veio inválido ou
+    não ficou pronto em PERSONALIZE_WAIT segundos.
+    """
+    def __init__(self, client=None, batch_size=PERSONALIZE_BATCH_SIZE, lookahead=PERSONALIZE_LOOKAHEAD,
+                 wait=PERSONALIZE_WAIT):
+        self.client = client or gemini_client
+        self.batch_size = batch_size
+        self.lookahead = lookahead
+        self.wait = wait
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counters = {'personalizadas': 0, 'padrao': 0}
+
+    def feed(self, rows, columns):
+        """Recebe tuplas com `columns` e gera (nome, telefone), já pedindo os lotes seguintes"""
+        rows = iter(rows)
+        buffer = collections.deque()
+        # Os primeiros lotes começam a ser gerados já, antes do primeiro envio
+        self._fill(rows, columns, buffer)
+
+        def contatos():
+            while buffer:
+                yield buffer.popleft()
+                self._fill(rows, columns, buffer)
+        return contatos()
+
+    def body_for(self, phone):
+        """Texto personalizado do contato (ou o texto padrão)"""
+        with self.lock:
+            future = self.pending.pop(phone, None)
+        corpo = None
+        if future is not None:
+            try:
+                corpo = future.result(timeout=self.wait).get(phone)
+            except Exception:
+                corpo = None
+        with self.lock:
+            self.counters['personalizadas' if corpo else 'padrao'] += 1
+        return corpo or DEFAULT_MESSAGE_BODY
+
+    def _fill(self, rows, columns, buffer):
+        while len(buffer) < self.batch_size * self.lookahead:
+            lote = list(itertools.islice(rows, self.batch_size))
+            if not lote:
+                return
+            clientes = pd.DataFrame(lote, columns=columns)
+            future = self.client.executor.submit(self._generate_batch, clientes)
+            with self.lock:
+                for phone in clientes['phone'].tolist():
+                    self.pending[phone] = future
+            buffer.extend(zip(clientes['name'].tolist(), clientes['phone'].tolist()))
+
+    def _generate_batch(self, clientes):
+        try:
+            texto = self.client.generate(montar_prompt_personalizado(clientes))
+            corpos = parse_personalized_bodies(texto, len(clientes))
+        except Exception as e:
+            print(f"Erro ao personalizar lote de {len(clientes)} contatos: {e}")
+            return {}
+        if len(corpos) < len(clientes):
+            print(f"⚠️ Lote personalizado com {len(clientes) - len(corpos)} texto(s) inválido(s)")
+        phones = clientes['phone'].tolist()
+        return {phones[indice]: corpo for indice, corpo in corpos.items()}
+
+def montar_mensagem_pizza_mania(nome, corpo_mensagem, dia_atual="%dia_semana%", saudacao="%saudacao%"):
+    """Monta a mensagem final: saudação, dia da semana, texto da IA e cardápio
+
+    Por padrão saudação e dia ficam como %saudacao% e %dia_semana%, que só
+    são preenchidos na hora do envio (a campanha pode ser agendada).
+    """
+    return (
+        f"*{saudacao} {nome}!* 👋\n\n"  # Saudação inicial com placeholder
         f"Hoje é *{dia_atual}*! 📅\n\n"  # Dia da semana
         f"{corpo_mensagem}\n\n"  # Corpo da mensagem gerado pela IA
         f"🔍 _Veja nosso cardápio:_ {MENU_LINK}"  # Link do cardápio
     )
+
+def gerar_mensagem_pizza_mania(nome="%name%"):
+    """Gera mensagem personalizada via Gemini API (servida do estoque de variantes)"""
+    dia_atual = get_dia_semana()
+    try:
+        corpo_mensagem = gemini_client.take(montar_prompt_pizza_mania(), dia_atual)
+            
+    except Exception as e:
+        print(f"Erro ao gerar mensagem: {e}")
+        corpo_mensagem = DEFAULT_MESSAGE_BODY
     
-    return mensagem_completa
+    return montar_mensagem_pizza_mania(nome, corpo_mensagem)
 
 def mostrar_preview_mensagem():
-    """Mostra preview da mensagem com botões de ação"""
-    # Usando %name% para o preview
-    mensagem = gerar_mensagem_pizza_mania()  # Sem parâmetro usa o default %name%
-    
+    """Mostra candidatas de mensagem lado a lado, geradas em segundo plano
+
+    A geração roda no preview_executor e a janela acompanha os resultados com
+    after(), então digitar e clicar nunca espera pela rede. Cada candidata
+    aparece assim que fica pronta, já com os campos preenchidos para um
+    contato de exemplo (render_preview); "Usar esta" leva o modelo, com os
+    campos. "Cancelar" descarta a rodada em andamento.
+    """
     # Criar janela de preview
     preview = tk.Toplevel(root)
     preview.title("Preview da Mensagem")
-    preview.geometry("600x500")
+    preview.geometry("900x500")
     preview.resizable(False, False)
     
     # Container principal
     main_container = tk.Frame(preview, padx=20, pady=20)
     main_container.pack(fill=tk.BOTH, expand=True)
     
-    # Variável para armazenar a mensagem atual
-    current_preview_message = mensagem
+    # Estado da geração
+    status_label = tk.Label(main_container, text="", font=("Helvetica", 10, "italic"))
+    status_label.pack(anchor='w', pady=(0, 5))
     
-    # Preview da mensagem
-    html_preview = HTMLLabel(
-        main_container,
-        html=f"<div style='font-family: \"Segoe UI Emoji\", sans-serif; font-size: 12pt; padding: 10px;'>{current_preview_message.replace(chr(10), '<br>')}</div>",
-        background="white"
-    )
-    html_preview.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    def para_html(texto):
+        return f"<div style='font-family: \"Segoe UI Emoji\", sans-serif; font-size: 12pt; padding: 10px;'>{texto.replace(chr(10), '<br>')}</div>"
+    
+    # Uma coluna por candidata, com o botão para escolhê-la
+    candidates_frame = tk.Frame(main_container)
+    candidates_frame.pack(fill=tk.BOTH, expand=True)
+    candidates_frame.rowconfigure(0, weight=1)
+    
+    candidatas = []
+    for i in range(PREVIEW_CANDIDATES):
+        candidates_frame.columnconfigure(i, weight=1, uniform="candidatas")
+        coluna = tk.Frame(candidates_frame, borderwidth=1, relief="groove")
+        coluna.grid(row=0, column=i, sticky="nsew", padx=5)
+        html_preview = HTMLLabel(coluna, html=para_html(""), background="white")
+        html_preview.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        btn_usar = tk.Button(coluna, text="Usar esta", state=tk.DISABLED,
+                             command=lambda i=i: aceitar_mensagem(i))
+        btn_usar.pack(pady=5)
+        candidatas.append({'html': html_preview, 'button': btn_usar, 'mensagem': None})
+    
+    def gerar_candidata():
+        """Modelo gerado e a mesma mensagem renderizada para o contato de exemplo"""
+        mensagem = gerar_mensagem_pizza_mania()
+        return mensagem, render_preview(mensagem)
     
     # Estilo comum para os botões
     button_style = {
@@ -276,34 +1672,68 @@ def mostrar_preview_mensagem():
     button_frame = tk.Frame(main_container)
     button_frame.pack(pady=20, fill=tk.X)
     
-    def aceitar_mensagem():
-        """Aceita a mensagem e a coloca no prompt principal"""
+    # Gerações da rodada atual (lista vazia = nenhuma em andamento)
+    futures = []
+    
+    def aceitar_mensagem(indice):
+        """Aceita a candidata escolhida e a coloca no prompt principal"""
         global current_message
-        current_message = current_preview_message
+        current_message = candidatas[indice]['mensagem']
         message_display.delete("1.0", tk.END)
         message_display.insert("1.0", current_message)
         start_button.config(state=tk.NORMAL)
-        preview.destroy()
+        fechar()
     
     def gerar_novamente():
-        """Gera uma nova mensagem"""
-        nonlocal current_preview_message
-        current_preview_message = gerar_mensagem_pizza_mania("Cliente Teste")
-        html_preview.set_html(
-            f"<div style='font-family: \"Segoe UI Emoji\", sans-serif; font-size: 12pt; padding: 10px;'>{current_preview_message.replace(chr(10), '<br>')}</div>"
-        )
+        """Descarta a rodada atual e pede novas candidatas"""
+        nonlocal futures
+        cancelar_geracao()
+        for candidata in candidatas:
+            candidata['mensagem'] = None
+            candidata['html'].set_html(para_html("⏳ Gerando..."))
+            candidata['button'].config(state=tk.DISABLED)
+        futures = [preview_executor.submit(gerar_candidata) for _ in candidatas]
+        status_label.config(text="⏳ Gerando mensagens...")
+        btn_cancelar.config(state=tk.NORMAL)
+        preview.after(PREVIEW_POLL_MS, acompanhar, futures)
     
-    # Botões
-    btn_aceitar = tk.Button(
-        button_frame,
-        text="Aceitar",
-        command=aceitar_mensagem,
-        bg="#4CAF50",  # Verde
-        fg="white",
-        **button_style
-    )
-    btn_aceitar.pack(side=tk.LEFT, expand=True, padx=5)
+    def acompanhar(rodada):
+        """Mostra as candidatas que ficaram prontas (roda no loop do Tk)"""
+        if rodada is not futures or not preview.winfo_exists():
+            return
+        for candidata, future in zip(candidatas, rodada):
+            if candidata['mensagem'] is None and future.done():
+                candidata['mensagem'], renderizada = future.result()
+                candidata['html'].set_html(para_html(renderizada))
+                candidata['button'].config(state=tk.NORMAL)
+        prontas = sum(candidata['mensagem'] is not None for candidata in candidatas)
+        if prontas == len(candidatas):
+            status_label.config(text="✅ Escolha uma das mensagens")
+            btn_cancelar.config(state=tk.DISABLED)
+        else:
+            status_label.config(text=f"⏳ Gerando mensagens... ({prontas}/{len(candidatas)} prontas)")
+            preview.after(PREVIEW_POLL_MS, acompanhar, rodada)
+    
+    def cancelar_geracao():
+        """Cancela a rodada em andamento; o que já chegou continua na tela"""
+        nonlocal futures
+        if not futures:
+            return
+        for future in futures:
+            future.cancel()
+        futures = []
+        for candidata in candidatas:
+            if candidata['mensagem'] is None:
+                candidata['html'].set_html(para_html("Geração cancelada"))
+        status_label.config(text="Geração cancelada")
+        btn_cancelar.config(state=tk.DISABLED)
+    
+    def fechar():
+        """Fecha o preview descartando gerações pendentes"""
+        cancelar_geracao()
+        preview.destroy()
     
+    # Botões
     btn_gerar = tk.Button(
         button_frame,
         text="Gerar Novamente",
@@ -314,15 +1744,27 @@ def mostrar_preview_mensagem():
     )
     btn_gerar.pack(side=tk.LEFT, expand=True, padx=5)
     
+    btn_cancelar = tk.Button(
+        button_frame,
+        text="Cancelar",
+        command=cancelar_geracao,
+        state=tk.DISABLED,
+        bg="#FF9800",  # Laranja
+        fg="white",
+        **button_style
+    )
+    btn_cancelar.pack(side=tk.LEFT, expand=True, padx=5)
+    
     btn_fechar = tk.Button(
         button_frame,
         text="Fechar",
-        command=preview.destroy,
+        command=fechar,
         bg="#f44336",  # Vermelho
         fg="white",
         **button_style
     )
     btn_fechar.pack(side=tk.LEFT, expand=True, padx=5)
+    preview.protocol("WM_DELETE_WINDOW", fechar)
     
     # Centralizar janela
     preview.transient(root)
@@ -336,303 +1778,2665 @@ def mostrar_preview_mensagem():
     x = (preview.winfo_screenwidth() // 2) - (width // 2)
     y = (preview.winfo_screenheight() // 2) - (height // 2)
     preview.geometry(f'+{x}+{y}')
+    
+    # Primeira rodada começa com a janela já aberta
+    gerar_novamente()
+
+class LoginStatus:
+    """Último estado de login verificado de cada perfil, salvo em JSON
+
+    get() só devolve resultados com menos de `ttl` segundos; mais antigos
+    (ou de perfil nunca verificado) contam como desconhecidos (None).
+    """
+    def __init__(self, path=WHATSAPP_LOGIN_STATUS_FILE, ttl=LOGIN_STATUS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.profiles = None
+
+    def get(self, user_data_dir=None):
+        """True/False se o login do perfil foi verificado recentemente, senão None"""
+        with self.lock:
+            entry = self._load().get(user_data_dir or USER_DATA_DIR)
+        if not entry or time.time() - entry.get('checked_at', 0) > self.ttl:
+            return None
+        return entry['logged_in']
+
+    def save(self, logged_in, user_data_dir=None):
+        """Registra o resultado de uma verificação de login"""
+        with self.lock:
+            profiles = self._load()
+            profiles[user_data_dir or USER_DATA_DIR] = {'logged_in': bool(logged_in), 'checked_at': time.time()}
+            self._write(profiles)
+
+    def invalidate(self, user_data_dir=None):
+        """Esquece o estado do perfil; a próxima verificação vai até a página"""
+        with self.lock:
+            profiles = self._load()
+            if profiles.pop(user_data_dir or USER_DATA_DIR, None) is not None:
+                self._write(profiles)
+
+    def _load(self):
+        if self.profiles is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Formato antigo ({'logged_in': ...}) não diz o perfil nem quando
+                self.profiles = {k: v for k, v in data.items() if isinstance(v, dict)}
+            except (OSError, ValueError):
+                self.profiles = {}
+        return self.profiles
+
+    def _write(self, profiles):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(profiles, f, indent=4)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Erro ao salvar status do login: {e}")
+
+login_status = LoginStatus()
+
+def probe_login_state(driver, timeout=LOGIN_PROBE_TIMEOUT, poll=0.2):
+    """Estado da página do WhatsApp Web assim que ele aparecer: 'logged_in', 'qr' ou None (tempo esgotado)"""
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=poll).until(
+            lambda d: d.execute_script(LOGIN_STATE_SCRIPT, WHATSAPP_SIDE_SELECTOR, WHATSAPP_QR_SELECTOR)
+        )
+    except TimeoutException:
+        return None
+
+def wait_for_whatsapp_login(driver, user_data_dir=None):
+    """Carrega o WhatsApp Web e diz se o perfil está logado
+
+    A página fica carregada ao final, servindo de sessão warm para os envios.
+    """
+    inicio = time.perf_counter()
+    logged_in = False
+    try:
+        logged_in = bool(check_login_page(driver, user_data_dir))
+        return logged_in
+    finally:
+        metrics.observe('login_check_seconds', time.perf_counter() - inicio, logged_in=logged_in)
+        metrics.event('login_check', logged_in=logged_in, seconds=round(time.perf_counter() - inicio, 3))
+
+def check_login_page(driver, user_data_dir=None):
+    """Carrega o WhatsApp Web e espera a lista de conversas ou o QR Code, o que vier primeiro
+
+    Com login confirmado recente a espera é maior (LOGIN_PROBE_TIMEOUT_KNOWN),
+    já que a página lenta quase certamente vai abrir logada.
+    """
+    try:
+        driver.get(f"{WHATSAPP_WEB_URL}/")
+        conhecido = login_status.get(user_data_dir)
+        estado = probe_login_state(driver, LOGIN_PROBE_TIMEOUT_KNOWN if conhecido else LOGIN_PROBE_TIMEOUT)
+    except Exception as e:
+        print(f"❌ Erro ao verificar login: {e}")
+        login_status.invalidate(user_data_dir)
+        return False
+
+    if estado == 'logged_in':
+        print("✅ WhatsApp Web está logado!")
+        login_status.save(True, user_data_dir)
+        return True
+    if estado == 'qr':
+        print("❌ WhatsApp Web NÃO está logado! Necessário escanear QR Code.")
+        login_status.save(False, user_data_dir)
+    else:
+        print("❌ WhatsApp Web não carregou a tempo")
+        login_status.invalidate(user_data_dir)
+    return False
+
+class InvalidPhoneError(Exception):
+    """O WhatsApp Web informou que o número não tem conta no WhatsApp"""
+
+class PhoneCache:
+    """Cache em disco (SQLite) de números com e sem WhatsApp, com validade
+
+    Chave é o telefone normalizado como inteiro. Resultados mais antigos que
+    PHONE_CACHE_TTL são ignorados e o número volta a ser testado. Números sem
+    WhatsApp são gravados na hora; os envios confirmados são gravados em
+    grupo, a cada `flush_batch` envios e no fim da campanha (flush).
+    """
+    def __init__(self, path=PHONE_CACHE_FILE, ttl=PHONE_CACHE_TTL, flush_batch=PHONE_CACHE_FLUSH_BATCH):
+        self.path = path
+        self.ttl = ttl
+        self.flush_batch = flush_batch
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+
+    def _connect(self):
+        """Abre o banco na primeira utilização (chamar com o lock)"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.executescript(
+                "CREATE TABLE IF NOT EXISTS phones ("
+                "phone INTEGER PRIMARY KEY, has_whatsapp INTEGER NOT NULL, checked_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS changes (name TEXT PRIMARY KEY, changed_at REAL NOT NULL);"
+            )
+        return self.conn
+
+    def _execute(self, sql, params=()):
+        """Executa uma consulta abrindo o banco na primeira utilização"""
+        with self.lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _write(self, rows):
+        """Grava resultados (phone, has_whatsapp, checked_at) e anota quando eles mudam known_invalid()"""
+        with self.lock:
+            conn = self._connect()
+            # Número sem WhatsApp sempre muda a lista; com WhatsApp, só se estava nela
+            muda = any(not has_whatsapp for _, has_whatsapp, _ in rows)
+            numbers = [row[0] for row in rows]
+            for start in range(0, len(numbers), 500):
+                if muda:
+                    break
+                parte = numbers[start:start + 500]
+                muda = conn.execute(
+                    "SELECT 1 FROM phones WHERE has_whatsapp = 0 AND checked_at >= ? "
+                    f"AND phone IN ({', '.join('?' * len(parte))}) LIMIT 1",
+                    (time.time() - self.ttl, *parte)
+                ).fetchone() is not None
+            conn.executemany(
+                "INSERT OR REPLACE INTO phones (phone, has_whatsapp, checked_at) VALUES (?, ?, ?)", rows
+            )
+            if muda:
+                conn.execute("INSERT OR REPLACE INTO changes (name, changed_at) VALUES ('invalid', ?)",
+                             (time.time(),))
+            conn.commit()
+
+    def mark(self, phone, has_whatsapp):
+        """Registra o resultado do último envio para o número"""
+        try:
+            number = int(phone)
+        except (TypeError, ValueError):
+            return
+        if has_whatsapp:
+            with self.pending_lock:
+                self.pending[number] = time.time()
+                cheio = len(self.pending) >= self.flush_batch
+            if cheio:
+                self.flush()
+            return
+        with self.pending_lock:
+            self.pending.pop(number, None)
+        self._write([(number, 0, time.time())])
+
+    def flush(self):
+        """Grava no banco os envios confirmados anotados por mark()"""
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        if pending:
+            self._write([(number, 1, checked_at) for number, checked_at in pending.items()])
+
+    def is_invalid(self, phone):
+        """Indica se o número foi visto sem WhatsApp dentro da validade"""
+        try:
+            number = int(phone)
+        except (TypeError, ValueError):
+            return False
+        rows = self._execute(
+            "SELECT 1 FROM phones WHERE phone = ? AND has_whatsapp = 0 AND checked_at >= ?",
+            (number, time.time() - self.ttl)
+        )
+        return bool(rows)
+
+    def known_invalid(self):
+        """Retorna (array int64) os números sem WhatsApp dentro da validade"""
+        rows = self._execute(
+            "SELECT phone FROM phones WHERE has_whatsapp = 0 AND checked_at >= ?",
+            (time.time() - self.ttl,)
+        )
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def invalid_changed_at(self):
+        """Momento da última mudança em known_invalid() (0 se nunca mudou)
+
+        Conta números marcados sem WhatsApp, números que estavam na lista e
+        voltaram a receber mensagem e resultados que venceram a validade;
+        envios confirmados de números que não estavam na lista não mudam nada.
+        """
+        with self.lock:
+            conn = self._connect()
+            anotado = conn.execute("SELECT changed_at FROM changes WHERE name = 'invalid'").fetchone()
+            if anotado is None:
+                # Banco de uma versão sem a anotação: última marcação sem WhatsApp
+                anotado = conn.execute("SELECT MAX(checked_at) FROM phones WHERE has_whatsapp = 0").fetchone()
+            vencido = conn.execute(
+                "SELECT MAX(checked_at) FROM phones WHERE has_whatsapp = 0 AND checked_at < ?",
+                (time.time() - self.ttl,)
+            ).fetchone()[0]
+        return max(anotado[0] or 0, vencido + self.ttl if vencido else 0)
+
+phone_cache = PhoneCache()
+
+class MediaCache:
+    """Anexos preparados para envio, guardados em disco pelo hash do conteúdo
+
+    prepare() faz o trabalho pesado uma única vez por arquivo: imagens são
+    reduzidas para no máximo MEDIA_MAX_SIDE pixels e recomprimidas em JPEG
+    (com o pacote opcional Pillow; sem ele vão como estão), PDFs são só
+    copiados. O resultado fica em MEDIA_CACHE_DIR/<hash SHA-256>/, então o
+    mesmo cardápio não é processado de novo nem entre execuções; enquanto o
+    arquivo não muda (tamanho e data), nem o hash é recalculado. Todos os
+    envios usam o arquivo preparado.
+    """
+    def __init__(self, path=MEDIA_CACHE_DIR):
+        self.path = path
+        self.prepared = {}
+        self.lock = threading.Lock()
+
+    def prepare(self, source):
+        """Retorna o anexo preparado de `source`: dicionário com path, name, kind, sha256 e bytes
+
+        Levanta ValueError para formatos não suportados e OSError se o arquivo
+        não puder ser lido.
+        """
+        stat = os.stat(source)
+        key = (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key in self.prepared:
+                return self.prepared[key]
+
+            base, ext = os.path.splitext(os.path.basename(source))
+            ext = ext.lower()
+            if ext in MEDIA_IMAGE_EXTENSIONS:
+                kind = 'image'
+            elif ext in MEDIA_DOCUMENT_EXTENSIONS:
+                kind = 'document'
+            else:
+                raise ValueError(f"Formato de anexo não suportado: {ext or os.path.basename(source)}")
+
+            inicio = time.perf_counter()
+            digest = hashlib.sha256()
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(CSV_SCAN_BLOCK), b''):
+                    digest.update(block)
+            digest = digest.hexdigest()
+            # Os parâmetros da redução entram na pasta: mudá-los gera outro arquivo
+            reduzir = kind == 'image' and Image is not None
+            folder = os.path.join(self.path, digest[:32] + (f"_{MEDIA_MAX_SIDE}q{MEDIA_JPEG_QUALITY}" if reduzir else ""))
+            target = os.path.join(folder, f"{base}.jpg" if reduzir else f"{base}{ext}")
+
+            if os.path.exists(target):
+                result = 'cache'
+            else:
+                result = 'processed'
+                os.makedirs(folder, exist_ok=True)
+                temp_path = f"{target}.tmp"
+                if reduzir:
+                    self._reduce(source, temp_path)
+                    # Imagem já pequena que não encolheu: vai a original
+                    if ext in ('.jpg', '.jpeg') and os.path.getsize(temp_path) >= stat.st_size:
+                        shutil.copyfile(source, temp_path)
+                else:
+                    shutil.copyfile(source, temp_path)
+                os.replace(temp_path, target)
+
+            size = os.path.getsize(target)
+            if kind == 'image' and size > MEDIA_MAX_MB * 2**20:
+                raise ValueError(f"Imagem do anexo passa de {MEDIA_MAX_MB} MB mesmo depois de reduzida")
+            attachment = {
+                'path': os.path.abspath(target),
+                'name': os.path.basename(target),
+                'kind': kind,
+                'sha256': digest,
+                'bytes': size,
+            }
+            self.prepared[key] = attachment
+
+        duracao = time.perf_counter() - inicio
+        metrics.count('media_prepared_total', result=result)
+        metrics.observe('media_prepare_seconds', duracao)
+        metrics.event('media_prepared', name=attachment['name'], media=kind, result=result,
+                      source_kb=round(stat.st_size / 1024, 1), kb=round(size / 1024, 1), seconds=round(duracao, 3))
+        if result == 'processed':
+            print(f"📎 Anexo preparado: {attachment['name']} ({stat.st_size / 1024:.0f} KB -> {size / 1024:.0f} KB)")
+        return attachment
+
+    @staticmethod
+    def _reduce(source, target):
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Transparência vira fundo branco (JPEG não tem canal alfa)
+                image = image.convert('RGBA')
+                fundo = Image.new('RGB', image.size, (255, 255, 255))
+                fundo.paste(image, mask=image.getchannel('A'))
+                image = fundo
+            else:
+                image = image.convert('RGB')
+            image.thumbnail((MEDIA_MAX_SIDE, MEDIA_MAX_SIDE), Image.LANCZOS)
+            image.save(target, 'JPEG', quality=MEDIA_JPEG_QUALITY, optimize=True, progressive=True)
+
+media_cache = MediaCache()
+
+def wait_for_chat_or_invalid(driver, timeout, textbox_selector=WHATSAPP_TEXTBOX_SELECTOR):
+    """Aguarda a conversa abrir ou o aviso de número inválido, o que vier primeiro"""
+    estado = WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+        lambda d: d.execute_script(CHAT_STATE_SCRIPT, textbox_selector)
+    )
+    if estado == 'invalid':
+        raise InvalidPhoneError("Número sem WhatsApp")
+
+def wait_for_send_ack(driver, timeout=SEND_ACK_TIMEOUT):
+    """Aguarda o observer da página confirmar a saída da mensagem enviada"""
+    driver.set_script_timeout(timeout + 5)
+    status = driver.execute_async_script(SEND_ACK_WAIT_SCRIPT, int(timeout * 1000))
+    if status == 'acked':
+        return True
+    if status == 'no-observer':
+        # Página recarregou e perdeu o observer: volta para a espera por seletor
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, WHATSAPP_ACK_SELECTOR))
+        )
+        return True
+    raise TimeoutException("Confirmação de envio não recebida")
+
+def open_chat_in_page(driver, phone, message):
+    """Abre a conversa pela pesquisa e preenche a mensagem sem recarregar o WhatsApp Web
+
+    Retorna False quando a sessão não está carregada, a pesquisa não mostrou o
+    número ou a conversa não abriu a tempo; nesse caso o envio segue pelo
+    recarregamento completo (send?phone=), que também detecta número sem WhatsApp.
+    Depois de MAX_WARM_FALLBACKS falhas seguidas o modo warm é desativado.
+    """
+    falhas = warm_fallbacks.get(driver.session_id, 0)
+    if falhas >= MAX_WARM_FALLBACKS:
+        return False
+    if not whatsapp_page_ready(driver):
+        return False
+    try:
+        driver.execute_script(PREPARE_CHAT_SEARCH_SCRIPT)
+        pesquisa = driver.find_element(By.CSS_SELECTOR, WHATSAPP_SEARCH_BOX_SELECTOR)
+        pesquisa.click()
+        pesquisa.send_keys(Keys.CONTROL, 'a')
+        pesquisa.send_keys(Keys.BACKSPACE)
+        pesquisa.send_keys(str(phone))
+        WebDriverWait(driver, WARM_CHAT_TIMEOUT, poll_frequency=0.1).until(
+            lambda d: d.execute_script(SEARCH_RESULT_SCRIPT, str(phone))
+        ).click()
+        wait_for_chat_or_invalid(driver, WARM_CHAT_TIMEOUT, WARM_TEXTBOX_SELECTOR)
+        if message:
+            driver.execute_script(INSERT_TEXT_SCRIPT, message)
+    except InvalidPhoneError:
+        warm_fallbacks[driver.session_id] = 0
+        raise
+    except Exception as e:
+        warm_fallbacks[driver.session_id] = falhas + 1
+        print(f"⚠️ Conversa não abriu na página ({e.__class__.__name__}), recarregando WhatsApp Web")
+        if falhas + 1 >= MAX_WARM_FALLBACKS:
+            print("⚠️ Modo warm desativado nesta sessão")
+        return False
+    warm_fallbacks[driver.session_id] = 0
+    return True
+
+def attach_media(driver, attachment, caption):
+    """Anexa o arquivo preparado na conversa aberta com `caption` como legenda
+
+    O navegador lê o arquivo direto do disco (MediaCache); retorna o botão de
+    enviar da prévia do anexo.
+    """
+    WebDriverWait(driver, SEND_BUTTON_TIMEOUT).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, WHATSAPP_ATTACH_BUTTON_SELECTOR))
+    ).click()
+    WebDriverWait(driver, SEND_BUTTON_TIMEOUT).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, WHATSAPP_MEDIA_INPUT_SELECTORS[attachment['kind']]))
+    ).send_keys(attachment['path'])
+    WebDriverWait(driver, ATTACH_TIMEOUT).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, WHATSAPP_CAPTION_SELECTOR))
+    )
+    if caption:
+        driver.execute_script(INSERT_TEXT_SCRIPT, caption, WHATSAPP_CAPTION_SELECTOR)
+    return WebDriverWait(driver, SEND_BUTTON_TIMEOUT).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, WHATSAPP_MEDIA_SEND_SELECTOR))
+    )
+
+class SendCancelled(Exception):
+    """O envio foi interrompido enquanto aguardava a vez da mensagem"""
+
+def send_whatsapp_message(driver, phone, message, timings=None, mode=SEND_MODE_COLD, wait_turn=None,
+                          encoded_message=None, attachment=None):
+    """Envia mensagem individual via WhatsApp Web
+
+    Se `timings` for um dicionário, ele recebe a duração (em segundos) de cada
+    fase do envio: navigate, compose_ready, attached (com anexo), clicked,
+    acked e total; em caso de falha, `timings['error']` recebe a classe da
+    falha (ERROR_INVALID_PHONE, ERROR_COMPOSE_TIMEOUT, ERROR_ATTACHMENT,
+    ERROR_SEND_BUTTON, ERROR_ACK_TIMEOUT ou ERROR_DRIVER_CRASH). Com
+    mode='warm' a conversa é aberta dentro da página carregada em
+    wait_for_whatsapp_login.
+
+    `wait_turn`, se informado, é chamado com a mensagem já composta, logo
+    antes do clique (ex.: SendRateLimiter.acquire); se retornar False o envio
+    é abandonado com ERROR_CANCELLED. Deve ser uma espera curta (o intervalo
+    entre mensagens): as longas ficam para antes da chamada
+    (SendRateLimiter.wait_ready), para não deixar um rascunho parado na conversa. O tempo dessa espera fica em
+    `timings['throttled']` e não entra no total.
+
+    `encoded_message` é a mensagem já codificada para a URL (pré-renderizada
+    pelo TemplateRenderer); sem ela a codificação é feita aqui.
+
+    `attachment` é um anexo de MediaCache.prepare(); a mensagem vai como
+    legenda dele.
+    """
+    if timings is None:
+        timings = {}
+    inicio = time.perf_counter()
+    # Classe atribuída se a fase atual falhar
+    falha = ERROR_COMPOSE_TIMEOUT
+    modo_usado = SEND_MODE_COLD
+    try:
+        marca = inicio
+
+        def registrar_fase(fase):
+            nonlocal marca
+            agora = time.perf_counter()
+            timings[fase] = agora - marca
+            marca = agora
+
+        # Com anexo a conversa abre vazia e o texto vai na legenda
+        texto_conversa = '' if attachment else message
+        if mode == SEND_MODE_WARM and open_chat_in_page(driver, phone, texto_conversa):
+            # Conversa aberta sem recarregar o app: navegação e composição juntas
+            modo_usado = SEND_MODE_WARM
+            registrar_fase('navigate')
+            timings['compose_ready'] = 0.0
+        else:
+            # URL codificada com número e mensagem (mensagem já com nome substituído)
+            if attachment:
+                encoded_message = ''
+            elif encoded_message is None:
+                encoded_message = requests.utils.quote(message)
+            url = f"{WHATSAPP_WEB_URL}/send?phone={phone}&text={encoded_message}"
+            driver.get(url)
+            registrar_fase('navigate')
+            
+            # Aguarda carregamento da conversa (ou o aviso de número inválido)
+            wait_for_chat_or_invalid(driver, COMPOSE_TIMEOUT)
+            registrar_fase('compose_ready')
+
+        # Anexo escolhido e legenda preenchida antes de aguardar a vez
+        send_button = None
+        if attachment:
+            falha = ERROR_ATTACHMENT
+            send_button = attach_media(driver, attachment, message)
+            registrar_fase('attached')
+            falha = ERROR_COMPOSE_TIMEOUT
+        
+        # Aguarda a vez da mensagem com a conversa já aberta
+        if wait_turn is not None:
+            if not wait_turn():
+                raise SendCancelled()
+            registrar_fase('throttled')
+
+        # Observer instalado antes do clique para não perder a bolha nova
+        driver.execute_script(SEND_ACK_OBSERVER_SCRIPT)
+        
+        # Envia a mensagem
+        falha = ERROR_SEND_BUTTON
+        if send_button is not None:
+            # Prévia do anexo: o botão dela envia arquivo e legenda juntos
+            send_button.click()
+            falha = ERROR_ACK_TIMEOUT
+        else:
+            try:
+                # Aguarda o botão de enviar ficar disponível em vez de esperar tempo fixo
+                send_button = WebDriverWait(driver, SEND_BUTTON_TIMEOUT).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, WHATSAPP_SEND_BUTTON_SELECTOR))
+                )
+                send_button.click()
+                falha = ERROR_ACK_TIMEOUT
+
+            except Exception:
+                # Se não encontrar o botão, tenta enviar com ENTER; sem confirmação
+                # depois disso a falha continua sendo do botão
+                driver.execute_script("""
+                    document.querySelector('#main div[role="textbox"]').dispatchEvent(
+                        new KeyboardEvent('keydown', {'key': 'Enter'})
+                    );
+                """)
+        registrar_fase('clicked')
+        
+        # Aguarda confirmação de envio da mensagem atual
+        wait_for_send_ack(driver, MEDIA_ACK_TIMEOUT if attachment else SEND_ACK_TIMEOUT)
+        registrar_fase('acked')
+        timings['total'] = time.perf_counter() - inicio - timings.get('throttled', 0.0)
+        
+        fases = ", ".join(f"{fase}={duracao:.2f}s" for fase, duracao in timings.items())
+        print(f"✅ Mensagem enviada para {phone} ({fases})")
+        phone_cache.mark(phone, True)
+        return True
+        
+    except SendCancelled:
+        timings['error'] = ERROR_CANCELLED
+        timings['total'] = time.perf_counter() - inicio
+        return False
+
+    except InvalidPhoneError:
+        print(f"🚫 Número {phone} não tem WhatsApp")
+        phone_cache.mark(phone, False)
+        timings['error'] = ERROR_INVALID_PHONE
+        timings['total'] = time.perf_counter() - inicio
+        return False
+
+    except Exception as e:
+        # Navegador que não responde mais é queda, qualquer que seja a fase
+        if not driver_responding(driver):
+            falha = ERROR_DRIVER_CRASH
+        print(f"❌ Erro ao enviar para {phone} ({falha}): {e.__class__.__name__}")
+        timings['error'] = falha
+        timings['total'] = time.perf_counter() - inicio
+        return False
+
+    finally:
+        record_send_metrics(phone, modo_usado, timings)
+
+def record_send_metrics(phone, mode, timings):
+    """Registra as fases de um envio nas métricas e no log de eventos
 
-def check_whatsapp_login_status():
-    """Verifica status do login do WhatsApp"""
+    O tempo em espera do limitador (throttled) é contado à parte do tempo de
+    trabalho (navegar, compor, clicar e confirmar).
+    """
+    result = timings.get('error') or STATUS_SENT
+    metrics.count('messages_total', mode=mode, result=result)
+    for fase in ('navigate', 'compose_ready', 'attached', 'clicked', 'acked'):
+        if fase in timings:
+            metrics.observe('send_phase_seconds', timings[fase], phase=fase, mode=mode)
+    if result == STATUS_SENT:
+        metrics.observe('send_seconds', timings['total'], mode=mode)
+    if 'throttled' in timings:
+        metrics.count('rate_limited_seconds_total', timings['throttled'])
+    metrics.count('working_seconds_total', timings.get('total', 0.0))
+    metrics.event('send', phone=str(phone), mode=mode, result=result,
+                  **{fase: round(duracao, 3) for fase, duracao in timings.items() if fase != 'error'})
+
+def driver_responding(driver):
+    """Indica se o navegador ainda responde aos comandos do WebDriver"""
     try:
-        if os.path.exists(WHATSAPP_LOGIN_STATUS_FILE):
-            with open(WHATSAPP_LOGIN_STATUS_FILE, 'r') as f:
-                return json.load(f).get('logged_in', False)
+        driver.execute_script("return 1")
+        return True
+    except Exception:
         return False
-    except:
+
+def js_heap_mb(driver):
+    """Heap JS usado pela página do WhatsApp Web em MB (None se indisponível)"""
+    try:
+        return driver.execute_cdp_cmd('Runtime.getHeapUsage', {})['usedSize'] / 2**20
+    except Exception:
+        pass
+    try:
+        used = driver.execute_script("return performance.memory && performance.memory.usedJSHeapSize")
+        return used / 2**20 if used else None
+    except Exception:
+        return None
+
+def browser_rss_mb(pid):
+    """Memória residente do processo `pid` e de todos os seus filhos em MB (None sem psutil)"""
+    if not psutil or not pid:
+        return None
+    try:
+        process = psutil.Process(pid)
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 2**20
+    except psutil.Error:
+        return None
+
+class BrowserWatchdog:
+    """Acompanha a saúde do navegador de uma conta e diz quando reciclá-lo
+
+    Conta as tentativas de envio desde que o navegador abriu e, a cada
+    WATCHDOG_CHECK_EVERY, mede o heap JS da página, a memória do navegador
+    com os processos de renderização e a latência dos envios. A latência de
+    referência é a mediana dos primeiros WATCHDOG_WINDOW envios do navegador;
+    se a mediana dos últimos passar de WATCHDOG_LATENCY_DRIFT vezes ela, a
+    página degradou. check() retorna o motivo da reciclagem ou None.
+    """
+    def __init__(self, account, max_messages=WATCHDOG_MAX_MESSAGES, check_every=WATCHDOG_CHECK_EVERY,
+                 max_heap_mb=WATCHDOG_MAX_HEAP_MB, max_rss_mb=WATCHDOG_MAX_RSS_MB,
+                 drift=WATCHDOG_LATENCY_DRIFT, window=WATCHDOG_WINDOW):
+        self.account = account
+        self.max_messages = max_messages
+        self.check_every = check_every
+        self.max_heap_mb = max_heap_mb
+        self.max_rss_mb = max_rss_mb
+        self.drift = drift
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """Recomeça a contagem para um navegador recém-aberto"""
+        self.attempts = 0
+        self.baseline = []
+        self.recent = collections.deque(maxlen=self.window)
+
+    def record(self, latency=None):
+        """Registra uma tentativa de envio; `latency` só para envios confirmados"""
+        self.attempts += 1
+        if latency is None:
+            return
+        if len(self.baseline) < self.window:
+            self.baseline.append(latency)
+        self.recent.append(latency)
+
+    def check(self, driver, pid=None):
+        """Motivo para reciclar o navegador agora ('max_messages', 'js_heap', 'rss', 'latency_drift') ou None"""
+        if self.max_messages and self.attempts >= self.max_messages:
+            return 'max_messages'
+        if not self.attempts or self.attempts % self.check_every:
+            return None
+
+        heap = js_heap_mb(driver)
+        rss = browser_rss_mb(pid)
+        baseline = float(np.median(self.baseline)) if len(self.baseline) >= self.window else None
+        recent = float(np.median(self.recent)) if baseline is not None and len(self.recent) >= self.window else None
+        for nome, valor in (('browser_js_heap_mb', heap), ('browser_rss_mb', rss)):
+            if valor is not None:
+                metrics.gauge(nome, round(valor, 1), account=self.account)
+        metrics.event('browser_health', account=self.account, attempts=self.attempts,
+                      js_heap_mb=heap and round(heap, 1), rss_mb=rss and round(rss, 1),
+                      latency_baseline=baseline and round(baseline, 3), latency_recent=recent and round(recent, 3))
+
+        if heap is not None and heap > self.max_heap_mb:
+            return 'js_heap'
+        if rss is not None and rss > self.max_rss_mb:
+            return 'rss'
+        if recent is not None and recent > baseline * self.drift:
+            return 'latency_drift'
+        return None
+
+class SendRateLimiter:
+    """Limites de envio de uma conta: intervalo mínimo, teto por hora e pausa entre lotes
+
+    Só envios de fato consomem o limite: acquire() é chamado com a mensagem já
+    composta, então a navegação e a validação do número correm em paralelo com
+    o intervalo obrigatório, e números inválidos ou conversas que não abriram
+    não gastam a cota. As esperas longas (pausa entre lotes e teto por hora)
+    passam antes, em wait_ready(), com nenhuma conversa aberta. O teto por
+    hora é uma janela deslizante de RATE_WINDOW segundos. A espera termina na hora se o Event `cancel` for acionado, e
+    retune() muda os limites no meio de uma espera, que é recalculada.
+    """
+    def __init__(self, per_hour=MAX_MESSAGES_PER_HOUR, spacing=DELAY_BETWEEN_MESSAGES,
+                 batch_size=BATCH_SIZE, batch_pause=BATCH_PAUSE, cancel=None, clock=time.monotonic):
+        self.window = collections.deque(maxlen=int(per_hour))
+        self.spacing = spacing
+        self.batch_size = int(batch_size)
+        self.batch_pause = batch_pause
+        self.cancel = cancel or threading.Event()
+        self.clock = clock
+        self.sent = 0
+        self.retuned = threading.Event()
+        # Protege a janela e os limites: retune() vem de outra thread (config alterada)
+        self.lock = threading.Lock()
+
+    def retune(self, per_hour=None, spacing=None, batch_size=None, batch_pause=None):
+        """Troca os limites (None mantém o atual); os envios já feitos continuam contando"""
+        with self.lock:
+            if per_hour is not None and int(per_hour) != self.window.maxlen:
+                self.window = collections.deque(self.window, maxlen=int(per_hour))
+            if spacing is not None:
+                self.spacing = spacing
+            if batch_size is not None:
+                self.batch_size = int(batch_size)
+            if batch_pause is not None:
+                self.batch_pause = batch_pause
+        self.retuned.set()
+
+    def delay(self, spacing=True):
+        """Segundos até o próximo envio ser permitido (0 se já pode enviar)
+
+        Com spacing=False conta só a pausa entre lotes e o teto por hora.
+        """
+        with self.lock:
+            return self._delay(spacing)
+
+    def _delay(self, spacing):
+        if not self.window:
+            return 0.0
+        last = self.window[-1]
+        pause = self.spacing if spacing else 0.0
+        if self.batch_size and self.sent % self.batch_size == 0:
+            pause = max(pause, self.batch_pause)
+        slot = last + pause
+        if len(self.window) == self.window.maxlen:
+            slot = max(slot, self.window[0] + RATE_WINDOW)
+        return max(0.0, slot - self.clock())
+
+    def wait_ready(self):
+        """Aguarda as esperas longas sem contabilizar envio; retorna False se cancelado"""
+        return self._wait(spacing=False)
+
+    def acquire(self):
+        """Aguarda a vez do próximo envio e o contabiliza; retorna False se cancelado"""
+        while self._wait(spacing=True):
+            with self.lock:
+                # Limites trocados entre o fim da espera e o registro: espera de novo
+                if self._delay(True) > 0:
+                    continue
+                self.window.append(self.clock())
+                self.sent += 1
+                return True
         return False
 
-def save_whatsapp_login_status(status):
-    """Salva status do login do WhatsApp"""
-    with open(WHATSAPP_LOGIN_STATUS_FILE, 'w') as f:
-        json.dump({'logged_in': status}, f)
+    def _wait(self, spacing):
+        avisado = False
+        while True:
+            self.retuned.clear()
+            espera = self.delay(spacing)
+            if espera <= 0:
+                break
+            if espera > 60 and not avisado:
+                print(f"⏳ Limite de envio atingido, aguardando {espera / 60:.1f} min")
+                avisado = True
+            # Acorda para o cancelamento ou para recalcular com os limites novos
+            fim = time.monotonic() + espera
+            while not self.retuned.is_set() and time.monotonic() < fim:
+                if self.cancel.wait(min(fim - time.monotonic(), LIMITER_RECHECK)):
+                    return False
+        return not self.cancel.is_set()
+
+# Limitador de cada conta, compartilhado por todas as campanhas
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+def account_limiter(account_name, limits):
+    """Limitador da conta com os `limits` indicados; o teto por hora é da conta, não da campanha"""
+    with rate_limiters_lock:
+        limiter = rate_limiters.get(account_name)
+        if limiter is None:
+            limiter = rate_limiters[account_name] = SendRateLimiter(**limits, cancel=stop_sending)
+            return limiter
+    limiter.retune(**limits)
+    return limiter
+
+class RetryScheduler:
+    """Fila de envio de uma conta: contatos novos intercalados com reenvios
+
+    Falhas permanentes (PERMANENT_ERRORS) nunca voltam para a fila. As
+    transitórias voltam depois de RETRY_BASE_DELAY * 2^(tentativa-1) segundos
+    (com variação de ±20%), até RETRY_MAX_ATTEMPTS tentativas. Um reenvio
+    vencido só passa na frente depois de RETRY_INTERLEAVE contatos novos, para
+    não gastar o limite de envios só com reenvios. `counters` guarda, por
+    classe de falha, quantas falhas, reenvios e desistências houve.
+    `attempts` ({telefone int: tentativas}) traz as tentativas já feitas antes
+    de uma retomada: esses contatos seguem a contagem em vez de recomeçar.
+    retry_now() devolve um contato para a frente da fila, sem espera e sem
+    gastar tentativa (queda do navegador no meio do envio).
+    """
+    def __init__(self, contatos, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 interleave=RETRY_INTERLEAVE, clock=time.monotonic, attempts=None):
+        self.fresh = iter(contatos)
+        self.attempts = attempts or {}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.interleave = interleave
+        self.clock = clock
+        self.queue = []
+        self.front = collections.deque()
+        self.restarts = {}
+        self.sequence = itertools.count()
+        self.fresh_since_retry = 0
+        self.exhausted = False
+        self.counters = {}
+
+    def next_contact(self):
+        """Retorna ((nome, telefone, tentativa), 0) com o próximo envio
+
+        Sem envio disponível agora retorna (None, segundos até o próximo
+        reenvio vencer), ou (None, None) quando a fila acabou.
+        """
+        if self.front:
+            return self.front.popleft(), 0
+        now = self.clock()
+        retry_due = bool(self.queue) and self.queue[0][0] <= now
+        if retry_due and (self.exhausted or self.fresh_since_retry >= self.interleave):
+            return self._pop_retry(), 0
+        if not self.exhausted:
+            try:
+                contact_name, phone = next(self.fresh)
+                self.fresh_since_retry += 1
+                attempt = self.attempts.pop(int(phone), 0) + 1 if self.attempts else 1
+                return (contact_name, phone, attempt), 0
+            except StopIteration:
+                self.exhausted = True
+        if retry_due:
+            return self._pop_retry(), 0
+        if self.queue:
+            return None, self.queue[0][0] - now
+        return None, None
+
+    def report_failure(self, contato, error):
+        """Conta a falha e reagenda o contato se ela for transitória
+
+        Retorna True se o contato voltou para a fila.
+        """
+        counters = self.counters.setdefault(error, {'falhas': 0, 'reenvios': 0, 'desistencias': 0})
+        counters['falhas'] += 1
+        contact_name, phone, attempt = contato
+        if error in PERMANENT_ERRORS or attempt >= self.max_attempts:
+            counters['desistencias'] += 1
+            metrics.count('giveups_total', error=error)
+            return False
+        delay = self.base_delay * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+        heapq.heappush(self.queue, (self.clock() + delay, next(self.sequence), (contact_name, phone, attempt + 1)))
+        counters['reenvios'] += 1
+        metrics.count('retries_total', error=error)
+        metrics.event('retry', phone=str(phone), error=error, attempt=attempt + 1, delay=round(delay, 1))
+        return True
+
+    def retry_now(self, contato, error):
+        """Devolve o contato para a frente da fila na mesma tentativa, sem espera
+
+        Retorna False (e nada muda) se ele já voltou assim `max_attempts`
+        vezes; aí a falha segue por report_failure, para um contato que
+        derruba o navegador sempre não prender a fila.
+        """
+        phone = contato[1]
+        if self.restarts.get(phone, 0) >= self.max_attempts:
+            return False
+        self.restarts[phone] = self.restarts.get(phone, 0) + 1
+        counters = self.counters.setdefault(error, {'falhas': 0, 'reenvios': 0, 'desistencias': 0})
+        counters['falhas'] += 1
+        counters['reenvios'] += 1
+        metrics.count('retries_total', error=error)
+        metrics.event('retry', phone=str(phone), error=error, attempt=contato[2], delay=0)
+        self.front.append(contato)
+        return True
+
+    def pending_retries(self):
+        """Quantidade de contatos aguardando reenvio"""
+        return len(self.queue) + len(self.front)
+
+    def _pop_retry(self):
+        self.fresh_since_retry = 0
+        return heapq.heappop(self.queue)[2]
+
+class UiBridge:
+    """Fila entre as threads de envio e o Tk, que só pode ser usado pela thread principal
+
+    As threads chamam post() (ou show_error/show_info) e a janela executa os
+    pedidos a cada UI_FRAME_MS milissegundos em um root.after. Pedidos
+    seguidos com a mesma `key` (ex.: progresso) são juntados e só o último é
+    executado, então a tela é redesenhada no máximo uma vez por quadro, seja
+    qual for o ritmo dos envios. Sem janela (start() não chamado), os avisos
+    vão para o console.
+    """
+    def __init__(self, frame_ms=UI_FRAME_MS):
+        self.frame_ms = frame_ms
+        self.queue = queue.SimpleQueue()
+        self.root = None
+
+    def start(self, root):
+        """Começa a esvaziar a fila na thread principal da janela `root`"""
+        self.root = root
+        root.after(self.frame_ms, self._drain)
+
+    def post(self, callback, *args, key=None):
+        """Agenda `callback(*args)` na thread principal (seguro em qualquer thread)"""
+        if self.root is None:
+            return
+        self.queue.put((key, callback, args))
+
+    def show_error(self, title, message):
+        """messagebox.showerror sem bloquear a thread que pediu"""
+        if self.root is None:
+            print(f"❌ {title}: {message}")
+        else:
+            self.post(messagebox.showerror, title, message)
+
+    def show_info(self, title, message):
+        """messagebox.showinfo sem bloquear a thread que pediu"""
+        if self.root is None:
+            print(f"ℹ️ {title}: {message}")
+        else:
+            self.post(messagebox.showinfo, title, message)
+
+    def _drain(self):
+        pending = []
+        while True:
+            try:
+                key, callback, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if key is not None and pending and pending[-1][0] == key:
+                pending[-1] = (key, callback, args)
+            else:
+                pending.append((key, callback, args))
+        for key, callback, args in pending:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Erro ao atualizar a tela: {e}")
+        try:
+            self.root.after(self.frame_ms, self._drain)
+        except tk.TclError:
+            # Janela já foi fechada
+            self.root = None
+
+ui = UiBridge()
+
+def create_or_update_progress_bar(parent, total, reset=False):
+    """Cria ou atualiza a barra de progresso"""
+    global progress_frame, progress_var, progress_label
+    
+    # Remove barra de progresso existente se necessário
+    if progress_frame and reset:
+        progress_frame.destroy()
+        progress_frame = None
+        
+    # Cria nova barra se não existir
+    if not progress_frame:
+        progress_frame = tk.Frame(parent)
+        progress_frame.pack(fill=tk.X, pady=5)
+        
+        progress_var = tk.DoubleVar()
+        progress_bar = Progressbar(
+            progress_frame, 
+            variable=progress_var,
+            maximum=total,
+            mode='determinate'
+        )
+        progress_bar.pack(fill=tk.X, padx=10)
+        
+        progress_label = tk.Label(progress_frame, text="0%")
+        progress_label.pack(pady=5)
+    
+    return progress_var, progress_label
+
+def update_progress(progress_var, progress_label, current, total):
+    """Atualiza barra de progresso"""
+    progress_var.set(current)
+    percentage = int((current / total) * 100)
+    progress_label.config(text=f"{percentage}% ({current}/{total})")
+
+def start_progress(total, processed):
+    """Recria a barra de progresso para uma campanha (thread principal)"""
+    progress_var, progress_label = create_or_update_progress_bar(root, total, reset=True)
+    update_progress(progress_var, progress_label, processed, max(total, 1))
+
+def show_progress(processed, total):
+    """Mostra o progresso atual da campanha (thread principal)"""
+    update_progress(progress_var, progress_label, processed, max(total, 1))
+    if processed >= total:
+        progress_label.config(text="Envio concluído! (100%)")
+
+class TemplateError(ValueError):
+    """Modelo de mensagem inválido ou incompatível com o CSV"""
+
+def primeiro_nome(values):
+    """Primeiro nome com inicial maiúscula ("JUCINETE MARIA" -> "Jucinete"), vetorizado"""
+    return values.str.split(n=1).str[0].fillna('').str.capitalize()
+
+TEMPLATE_FILTERS = {
+    'primeiro': primeiro_nome,
+}
+
+# Campos que não vêm do CSV: calculados no momento de cada envio
+TEMPLATE_SEND_TIME_FIELDS = {
+    'saudacao': get_saudacao,
+    'dia_semana': get_dia_semana,
+}
+
+def fill_send_time_fields(text, encoded=False):
+    """Troca %saudacao% e %dia_semana% pelos valores de agora (no texto já codificado para URL se `encoded`)"""
+    if not text:
+        return text
+    for field, valor in TEMPLATE_SEND_TIME_FIELDS.items():
+        marcador = f"%{field}%"
+        if encoded:
+            marcador = requests.utils.quote(marcador)
+        if marcador in text:
+            text = text.replace(marcador, requests.utils.quote(valor()) if encoded else valor())
+    return text
+
+class MessageTemplate:
+    """Modelo de mensagem compilado uma vez e renderizado por blocos de contatos
+
+    Aceita qualquer coluna do CSV: %coluna%, %coluna|padrão% (usado quando o
+    valor está vazio) e %coluna:primeiro% (primeiro nome, ex.:
+    %name:primeiro|Cliente%). Campos sem padrão são obrigatórios.
+    %saudacao% e %dia_semana% (TEMPLATE_SEND_TIME_FIELDS) passam intactos e
+    são preenchidos só na hora do envio.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+        posicao = 0
+        for match in TEMPLATE_FIELD.finditer(text):
+            column, filtro, default = match.groups()
+            if filtro and filtro not in TEMPLATE_FILTERS:
+                raise TemplateError(f"Filtro desconhecido no modelo: {match.group(0)}")
+            self.parts.append(text[posicao:match.start()])
+            if column in TEMPLATE_SEND_TIME_FIELDS and not filtro and default is None:
+                self.parts.append(match.group(0))
+            else:
+                self.parts.append((column, filtro, default))
+            posicao = match.end()
+        self.parts.append(text[posicao:])
+        # Junta os trechos de texto vizinhos
+        parts = []
+        for part in self.parts:
+            if isinstance(part, str) and parts and isinstance(parts[-1], str):
+                parts[-1] += part
+            elif part != '':
+                parts.append(part)
+        self.parts = parts
+        fields = [part for part in self.parts if isinstance(part, tuple)]
+        self.columns = list(dict.fromkeys(column for column, _, _ in fields))
+        self.required = list(dict.fromkeys(column for column, _, default in fields if default is None))
+
+    def check(self, source):
+        """Falha antes do envio se o CSV não tem as colunas do modelo ou tem campos obrigatórios vazios"""
+        missing = [column for column in self.columns if column not in source.columns]
+        if missing:
+            raise TemplateError(f"Campos do modelo ausentes no CSV: {', '.join(missing)}")
+        if not self.required:
+            return
+        vazios = 0
+        exemplos = []
+        for chunk in source.iter_chunks(usecols=list(dict.fromkeys(['phone'] + self.required))):
+            empty = (chunk[self.required].apply(lambda values: values.str.strip()) == '').any(axis=1)
+            vazios += int(empty.sum())
+            exemplos.extend(chunk.loc[empty, 'phone'].head(5 - len(exemplos)).tolist())
+        if vazios:
+            raise TemplateError(
+                f"{vazios} contato(s) sem valor em {', '.join(self.required)} "
+                f"(ex.: {', '.join(exemplos)}). Use %campo|padrão% para definir um valor padrão."
+            )
+
+    def render(self, frame):
+        """Renderiza uma mensagem por linha do DataFrame em uma única passada (Series de str)"""
+        result = pd.Series('', index=frame.index, dtype=object)
+        for part in self.parts:
+            if isinstance(part, str):
+                result = result + part
+                continue
+            column, filtro, default = part
+            values = frame[column].fillna('').astype(str).str.strip()
+            if filtro:
+                values = TEMPLATE_FILTERS[filtro](values)
+            if default is not None:
+                values = values.mask(values == '', default)
+            result = result + values
+        return result
+
+def pack_strings(values):
+    """Guarda textos como um único bloco de bytes UTF-8 + deslocamentos (int64)"""
+    data = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in data], out=offsets[1:])
+    return b''.join(data), offsets
+
+def unpack_string(packed, index):
+    """Recupera o texto `index` de um bloco gerado por pack_strings"""
+    buffer, offsets = packed
+    return buffer[offsets[index]:offsets[index + 1]].decode('utf-8')
+
+class TemplateRenderer:
+    """Renderiza as mensagens em blocos à frente do envio e as guarda compactadas
+
+    feed() lê RENDER_BLOCK_SIZE contatos por vez, renderiza o bloco inteiro
+    com o MessageTemplate e guarda as mensagens (e, com encode=True, a versão
+    já codificada para a URL do modo cold) em blocos de bytes UTF-8, em vez
+    de um objeto str por contato. payload() entrega a mensagem do contato.
+    """
+    def __init__(self, template, encode=False, block_size=RENDER_BLOCK_SIZE):
+        self.template = template
+        self.encode = encode
+        self.block_size = block_size
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def feed(self, rows, columns):
+        """Recebe tuplas com `columns` e gera (nome, telefone) com as mensagens já renderizadas"""
+        rows = iter(rows)
+        for lote in iter(lambda: list(itertools.islice(rows, self.block_size)), []):
+            frame = pd.DataFrame(lote, columns=columns)
+            messages = self.template.render(frame).tolist()
+            block = (
+                pack_strings(messages),
+                pack_strings(requests.utils.quote(message) for message in messages) if self.encode else None
+            )
+            phones = frame['phone'].tolist()
+            with self.lock:
+                for position, phone in enumerate(phones):
+                    self.index[phone] = (block, position)
+            yield from zip(frame['name'].tolist(), phones)
+
+    def payload(self, phone):
+        """Retorna (mensagem, mensagem codificada para URL ou None) do contato, com os campos do envio preenchidos"""
+        with self.lock:
+            (messages, encoded), position = self.index.pop(phone)
+        return (fill_send_time_fields(unpack_string(messages, position)),
+                fill_send_time_fields(unpack_string(encoded, position), encoded=True) if encoded else None)
+
+def render_preview(text, contact=PREVIEW_SAMPLE_CONTACT):
+    """Mensagem como `contact` a receberia agora, pelo mesmo TemplateRenderer do envio
+
+    Colunas do modelo que o contato de exemplo não tem ficam vazias (ou com
+    o padrão do campo). Um modelo inválido volta como está.
+    """
+    try:
+        renderer = TemplateRenderer(MessageTemplate(text))
+    except TemplateError:
+        return text
+    columns = list(dict.fromkeys(['name', 'phone'] + renderer.template.columns))
+    row = tuple(str(contact.get(column, '')) for column in columns)
+    for _ in renderer.feed([row], columns):
+        pass
+    return renderer.payload(row[1])[0]
+
+def sorted_member(values, sorted_array):
+    """Versão de np.isin para um array já ordenado (busca binária)"""
+    if not len(sorted_array):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_array, values).clip(max=len(sorted_array) - 1)
+    return sorted_array[positions] == values
+
+class SendLedger:
+    """Registro de envios só de acréscimo (append-only), seguro contra quedas
+
+    Cada tentativa vira uma linha TSV (telefone, status, tentativa, horário,
+    latência, classe do erro, conta). As linhas são gravadas em grupo por uma
+    thread própria, com um fsync a cada LEDGER_FLUSH_INTERVAL segundos ou
+    LEDGER_FLUSH_BATCH registros, então o custo por mensagem é só um append
+    em memória. Uma linha incompleta no fim do arquivo (queda no meio da
+    gravação) é descartada na leitura. Os dados da campanha (CSV de origem,
+    total, conclusão) ficam em LEDGER_META_FILE.
+    """
+    def __init__(self, path=LEDGER_FILE, meta_path=LEDGER_META_FILE):
+        self.path = path
+        self.meta_path = meta_path
+        self.pending = []
+        self.attempts = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.writer = None
+
+    def exists(self):
+        """Indica se há uma campanha registrada"""
+        return os.path.exists(self.meta_path)
+
+    def meta(self):
+        """Dados da campanha registrada"""
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_meta(self, **values):
+        """Atualiza os dados da campanha com gravação atômica"""
+        meta = self.meta() if self.exists() else {}
+        meta.update(values)
+        temp_path = f"{self.meta_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.meta_path)
+
+    def load(self):
+        """Retorna o último registro de cada telefone (DataFrame indexado por telefone)"""
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=LEDGER_COLUMNS).set_index('phone')
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return pd.DataFrame(columns=LEDGER_COLUMNS).set_index('phone')
+        records = pd.read_csv(
+            io.BytesIO(data),
+            sep='\t',
+            names=LEDGER_COLUMNS,
+            dtype={'phone': np.int64, 'status': str, 'attempts': np.int64, 'error': str, 'account': str},
+            keep_default_na=False
+        )
+        latest = records.drop_duplicates('phone', keep='last').set_index('phone')
+        with self.condition:
+            self.attempts = dict(zip(latest.index.tolist(), latest['attempts'].tolist()))
+        return latest
+
+    def start(self, **meta):
+        """Abre o registro para gravação e inicia a thread de gravação em grupo"""
+        self.save_meta(**meta)
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+        self.writer.start()
+
+    def record(self, phone, status, latency=0.0, error='', account='', count_attempt=True):
+        """Acrescenta o resultado de uma tentativa de envio
+
+        Com count_attempt=False a próxima linha do telefone repete o número
+        da tentativa (queda do navegador, que não gasta tentativa do contato).
+        """
+        number = int(phone)
+        with self.condition:
+            attempts = self.attempts.get(number, 0) + 1
+            if count_attempt:
+                self.attempts[number] = attempts
+            self.pending.append(
+                f"{number}\t{status}\t{attempts}\t{time.time():.3f}\t{latency:.3f}\t{error}\t{account}\n"
+            )
+            if len(self.pending) >= LEDGER_FLUSH_BATCH:
+                self.condition.notify()
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread de gravação"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.writer:
+            self.writer.join()
+            self.writer = None
+
+    def archive(self):
+        """Move o registro atual para arquivos com data, liberando uma campanha nova"""
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for path in (self.path, self.meta_path):
+            if os.path.exists(path):
+                base, ext = os.path.splitext(path)
+                os.replace(path, f"{base}_{stamp}{ext}")
+        with self.condition:
+            self.attempts = {}
+
+    def report(self, latest=None):
+        """Resumo da campanha: contagem por status e erro, tentativas e latências"""
+        if latest is None:
+            latest = self.load()
+        sent = latest[latest['status'] == STATUS_SENT]
+        latencies = sent['latency'].astype(float)
+        return {
+            'contatos': int(len(latest)),
+            'status': {k: int(v) for k, v in latest['status'].value_counts().items()},
+            'erros': {k: int(v) for k, v in latest.loc[latest['error'] != '', 'error'].value_counts().items()},
+            'tentativas': int(latest['attempts'].sum()),
+            'latencia_p50': round(float(latencies.quantile(0.5)), 3) if len(latencies) else None,
+            'latencia_p95': round(float(latencies.quantile(0.95)), 3) if len(latencies) else None,
+        }
+
+    def _write_loop(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: self.closed or len(self.pending) >= LEDGER_FLUSH_BATCH,
+                        timeout=LEDGER_FLUSH_INTERVAL
+                    )
+                    lines, self.pending = self.pending, []
+                    stop = self.closed
+                if lines:
+                    f.write(''.join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+                if stop:
+                    return
+
+class ContactSource:
+    """Lê os contatos do CSV em blocos, sem carregar o arquivo inteiro na memória
+
+    Só as colunas CONTACT_COLUMNS são lidas, como texto. Na retomada os
+    contatos que já têm resultado são descartados bloco a bloco (iter_rows).
+    count() conta as quebras de linha em blocos binários, sem interpretar o
+    CSV; campos com quebra de linha entre aspas não são suportados.
+    """
+    def __init__(self, path, chunksize=CSV_CHUNK_SIZE):
+        self.path = path
+        self.chunksize = chunksize
+        with open(path, 'rb') as f:
+            header = f.readline()
+            self.data_start = f.tell()
+        self.columns = next(csv.reader([header.decode('utf-8-sig')]))
+        missing = [column for column in CONTACT_COLUMNS if column not in self.columns]
+        if missing:
+            raise ValueError(f"Colunas ausentes no CSV: {', '.join(missing)}")
+        self._count = None
+
+    def count(self):
+        """Conta as linhas de contatos varrendo o arquivo em blocos binários"""
+        if self._count is None:
+            self._count = self._scan()
+        return self._count
+
+    def _scan(self):
+        """Conta as linhas com conteúdo, que são as que o pandas lê
+
+        Linhas em branco (só espaços, tabs ou \\r) não contam, como no
+        read_csv.
+        """
+        total = 0
+        pending = False  # A linha ainda sem quebra (vinda do bloco anterior) já tem conteúdo
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start)
+            for block in iter(lambda: f.read(CSV_SCAN_BLOCK), b''):
+                data = np.frombuffer(block, dtype=np.uint8)
+                content = np.cumsum(~CSV_BLANK_BYTES[data])
+                breaks = np.flatnonzero(data == 10)
+                if len(breaks):
+                    # Linha com conteúdo: algum byte não branco desde a quebra anterior
+                    ends = content[breaks]
+                    filled = np.diff(ends, prepend=0) > 0
+                    filled[0] |= pending
+                    total += int(filled.sum())
+                    pending = bool(content[-1] > ends[-1])
+                else:
+                    pending = pending or bool(content[-1] > 0)
+        # Última linha sem quebra de linha no final
+        return total + bool(pending)
+
+    def iter_chunks(self, usecols=CONTACT_COLUMNS):
+        """Gera DataFrames de até `chunksize` contatos
+
+        `usecols=None` lê todas as colunas do CSV.
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start)
+            if not f.read(1):
+                return
+            f.seek(self.data_start)
+            reader = pd.read_csv(
+                f,
+                header=None,
+                names=self.columns,
+                usecols=usecols,
+                dtype=str,
+                keep_default_na=False,
+                chunksize=self.chunksize
+            )
+            for chunk in reader:
+                yield chunk
+
+    def iter_rows(self, exclude=None, include=None, columns=CONTACT_COLUMNS):
+        """Gera tuplas (nome, telefone)
+
+        `exclude`/`include` são arrays de telefones (int64) filtrados bloco a
+        bloco, de forma vetorizada, antes de gerar as tuplas. `columns` escolhe
+        outras colunas (a tupla segue essa ordem).
+        """
+        exclude = np.sort(exclude) if exclude is not None and len(exclude) else None
+        include = np.sort(include) if include is not None else None
+        for chunk in self.iter_chunks(usecols=columns):
+            if exclude is not None or include is not None:
+                numbers = pd.to_numeric(chunk['phone'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+                keep = np.ones(len(chunk), dtype=bool)
+                if exclude is not None:
+                    keep &= ~sorted_member(numbers, exclude)
+                if include is not None:
+                    keep &= sorted_member(numbers, include)
+                chunk = chunk[keep]
+            yield from zip(*(chunk[column].tolist() for column in columns))
+
+    def iter_shard(self, shard_index, total_shards, exclude=None, include=None, columns=CONTACT_COLUMNS):
+        """Gera os contatos da fatia `shard_index` (shard_index, +n, +2n...)
+
+        Com filtros, as fatias são formadas depois de filtrar os contatos.
+        """
+        rows = self.iter_rows(exclude=exclude, include=include, columns=columns)
+        return itertools.islice(rows, shard_index, None, total_shards)
+
+    def shard_size(self, shard_index, total_shards):
+        """Quantidade de contatos na fatia `shard_index`"""
+        return len(range(shard_index, self.count(), total_shards))
+
+def normalize_phones(phones, country_code=DEFAULT_COUNTRY_CODE):
+    """Normaliza telefones brasileiros em uma única passada vetorizada
+
+    Remove caracteres não numéricos e zeros à esquerda, separa o código do
+    país, inclui o 9º dígito em celulares de 8 dígitos e valida tamanho e DDD.
+    Retorna duas Series: o número completo como inteiro (55 + DDD + número)
+    e o motivo da rejeição ('' quando o número é válido).
+    """
+    digits = phones.fillna('').astype(str).str.replace(r'\D', '', regex=True)
+    too_long = digits.str.len() > 15
+    numbers = pd.to_numeric(digits.mask(too_long | (digits == ''), '0')).to_numpy(dtype=np.int64)
+
+    # Quantidade de dígitos sem zeros à esquerda
+    lengths = np.searchsorted(POWERS_OF_TEN, numbers, side='right')
+
+    # Com código do país: 12 (fixo) ou 13 (celular) dígitos começando com 55
+    cc = int(country_code)
+    cc_length = len(country_code)
+    has_country_code = np.isin(lengths, [12, 13]) & (
+        numbers // POWERS_OF_TEN[np.clip(lengths - cc_length, 0, None)] == cc
+    )
+    national_length = np.where(has_country_code, lengths - cc_length, lengths)
+    national = np.where(has_country_code, numbers % POWERS_OF_TEN[np.clip(national_length, 0, None)], numbers)
+
+    subscriber_length = np.clip(national_length - 2, 0, None)
+    ddd = national // POWERS_OF_TEN[subscriber_length]
+    subscriber = national % POWERS_OF_TEN[subscriber_length]
+
+    # Celular antigo com 8 dígitos (começa com 6-9) ganha o 9º dígito
+    needs_nine = (national_length == 10) & (subscriber // 10 ** 7 >= 6)
+    subscriber = np.where(needs_nine, subscriber + 9 * 10 ** 8, subscriber)
+    subscriber_length = np.where(needs_nine, 9, subscriber_length)
+
+    reason = np.select(
+        [
+            (numbers == 0) & ~too_long,
+            too_long | ~np.isin(national_length, [10, 11]),
+            ~np.isin(ddd, BRAZIL_DDDS),
+            (subscriber_length == 9) & (subscriber // 10 ** 8 != 9),
+        ],
+        ['vazio', 'tamanho_invalido', 'ddd_invalido', 'celular_invalido'],
+        default=''
+    )
+    normalized = (
+        cc * POWERS_OF_TEN[subscriber_length + 2]
+        + ddd * POWERS_OF_TEN[subscriber_length]
+        + subscriber
+    )
+    return pd.Series(normalized, index=phones.index), pd.Series(reason, index=phones.index)
+
+def prepare_contacts(source, country_code=DEFAULT_COUNTRY_CODE, invalid_policy=INVALID_PHONE_SKIP,
+                     reuse_existing=False):
+    """Normaliza, valida e remove duplicados antes do envio
+
+    Gera <arquivo>_validos.csv (telefones normalizados, demais colunas
+    preservadas) e <arquivo>_rejeitados.csv (linha original + motivo), e
+    retorna (ContactSource dos contatos válidos, resumo por motivo). Números
+    que o phone_cache sabe não ter WhatsApp são rejeitados ('skip') ou movidos
+    para o fim da lista ('deprioritize'). Se os arquivos gerados forem mais
+    novos que o CSV original e que a última mudança nos números sem WhatsApp
+    do cache (ou sempre, com reuse_existing), são reaproveitados.
+    """
+    base = os.path.splitext(source.path)[0]
+    valid_path = f"{base}_validos.csv"
+    rejected_path = f"{base}_rejeitados.csv"
+    summary_path = f"{base}_resumo.json"
+    deferred_path = f"{base}_adiados.csv"
+
+    newest_input = 0 if reuse_existing else max(os.path.getmtime(source.path), phone_cache.invalid_changed_at())
+    if all(os.path.exists(p) and os.path.getmtime(p) >= newest_input
+           for p in (valid_path, rejected_path, summary_path)):
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        if reuse_existing or summary.get('invalid_policy') == invalid_policy:
+            return ContactSource(valid_path, source.chunksize), summary
+
+    summary = {'total': 0, 'validos': 0, 'adiados': 0, 'rejeitados': {}, 'invalid_policy': invalid_policy}
+    seen = np.empty(0, dtype=np.int64)
+    known_invalid = phone_cache.known_invalid()
+    deferred_first = True
+    first = True
+    for chunk in source.iter_chunks(usecols=None):
+        normalized, reason = normalize_phones(chunk['phone'], country_code)
+
+        # Duplicados dentro do bloco e em relação aos blocos anteriores
+        valid = reason == ''
+        duplicated = valid & (normalized.where(valid, 0).duplicated() | np.isin(normalized, seen))
+        reason = reason.mask(duplicated, 'duplicado')
+        valid = reason == ''
+        seen = np.concatenate([seen, normalized[valid].to_numpy()])
+
+        # Números já vistos sem WhatsApp
+        without_whatsapp = valid & np.isin(normalized, known_invalid)
+        if invalid_policy == INVALID_PHONE_DEPRIORITIZE:
+            deferred = chunk[without_whatsapp].assign(phone=normalized[without_whatsapp].astype(str))
+            deferred.to_csv(deferred_path, mode='w' if deferred_first else 'a', header=deferred_first, index=False)
+            deferred_first = False
+            summary['adiados'] += len(deferred)
+            valid = valid & ~without_whatsapp
+        else:
+            reason = reason.mask(without_whatsapp, 'sem_whatsapp')
+            valid = reason == ''
+
+        accepted = chunk[valid].assign(phone=normalized[valid].astype(str))
+        rejected = chunk[reason != ''].assign(motivo=reason[reason != ''])
+        accepted.to_csv(valid_path, mode='w' if first else 'a', header=first, index=False)
+        rejected.to_csv(rejected_path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+
+        summary['total'] += len(chunk)
+        summary['validos'] += int(valid.sum())
+        for motivo, quantidade in reason[reason != ''].value_counts().items():
+            summary['rejeitados'][motivo] = summary['rejeitados'].get(motivo, 0) + int(quantidade)
+
+    if first:
+        # CSV sem contatos: gera os arquivos só com cabeçalho
+        pd.DataFrame(columns=source.columns).to_csv(valid_path, index=False)
+        pd.DataFrame(columns=source.columns + ['motivo']).to_csv(rejected_path, index=False)
+
+    # Adiados vão para o fim da lista de envio
+    if not deferred_first:
+        with open(deferred_path, 'rb') as deferred, open(valid_path, 'ab') as valid_file:
+            deferred.readline()
+            shutil.copyfileobj(deferred, valid_file)
+        os.remove(deferred_path)
+        summary['validos'] += summary['adiados']
+
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=4)
+    return ContactSource(valid_path, source.chunksize), summary
+
+def parse_date(value):
+    """date/datetime, 'dd/mm/aaaa' ou 'aaaa-mm-dd' -> date; levanta ValueError se inválida"""
+    if isinstance(value, datetime):
+        return value.date()
+    if hasattr(value, 'isoformat'):
+        return value
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(str(value).strip(), formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Data inválida: {value} (use dd/mm/aaaa)")
+
+class ContactStore:
+    """Base local de contatos (SQLite), atualizada a cada CSV exportado
+
+    A chave é o client_id (sem ele, o telefone). O telefone fica normalizado
+    como no envio e o created_at em aaaa-mm-dd, ambos indexados, assim como
+    o momento do último envio confirmado (last_sent_at): "cadastrados desde
+    01/08/2025" ou "sem mensagem há 7 dias" são consultas por índice, e
+    export() grava o resultado em um CSV para a campanha. import_csv() só
+    processa e grava as linhas novas ou alteradas: o hash do conteúdo de
+    cada linha do CSV é procurado (busca binária) entre os hashes já
+    gravados, e as linhas iguais são descartadas antes de normalizar
+    telefones e datas. Os envios confirmados (mark_sent) são gravados em
+    grupo, a cada `flush_batch` envios e no fim da campanha (flush).
+    """
+    def __init__(self, path=CONTACTS_DB_FILE, flush_batch=CONTACTS_FLUSH_BATCH):
+        self.path = path
+        self.flush_batch = flush_batch
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pending = []
+        self.pending_lock = threading.Lock()
+
+    def _connect(self):
+        """Abre o banco na primeira utilização (chamar com o lock)"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.executescript(
+                "CREATE TABLE IF NOT EXISTS contacts ("
+                "client_id TEXT PRIMARY KEY, name TEXT NOT NULL, phone TEXT NOT NULL, created_at TEXT, "
+                "row_hash INTEGER NOT NULL, imported_at REAL NOT NULL, last_sent_at REAL);"
+                "CREATE INDEX IF NOT EXISTS contacts_phone ON contacts (phone);"
+                "CREATE INDEX IF NOT EXISTS contacts_created_at ON contacts (created_at);"
+                "CREATE INDEX IF NOT EXISTS contacts_last_sent_at ON contacts (last_sent_at);"
+            )
+        return self.conn
+
+    def import_csv(self, path):
+        """Importa um CSV exportado (name, phone e, se houver, client_id e created_at)
+
+        Retorna o resumo: linhas lidas, contatos novos, alterados e iguais,
+        linhas repetidas (mesmo client_id de uma linha anterior do arquivo,
+        que vale) e linhas recusadas por data de cadastro inválida.
+        """
+        source = ContactSource(path)
+        colunas = [column for column in CONTACT_STORE_COLUMNS if column in source.columns]
+        summary = {'lidos': 0, 'novos': 0, 'alterados': 0, 'iguais': 0, 'duplicados': 0, 'data_invalida': 0}
+        inicio = time.perf_counter()
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS incoming ("
+                "client_id TEXT PRIMARY KEY, name TEXT, phone TEXT, created_at TEXT, row_hash INTEGER)"
+            )
+            rows = conn.execute("SELECT row_hash FROM contacts").fetchall()
+            known = np.sort(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+            seen = np.empty(0, dtype=np.int64)
+            try:
+                for chunk in source.iter_chunks(usecols=colunas):
+                    summary['lidos'] += len(chunk)
+                    client_id = self._client_ids(chunk)
+
+                    # Repetidos dentro do bloco e em relação aos blocos anteriores
+                    keys = pd.util.hash_pandas_object(client_id, index=False).to_numpy().view(np.int64)
+                    repeated = pd.Series(keys).duplicated().to_numpy() | sorted_member(keys, seen)
+                    seen = np.sort(np.concatenate([seen, keys[~repeated]]))
+                    summary['duplicados'] += int(repeated.sum())
+
+                    # Hash das colunas como vieram no CSV (uint64 guardado como INTEGER do SQLite)
+                    hashes = pd.util.hash_pandas_object(chunk[colunas], index=False).to_numpy().view(np.int64)
+                    changed = ~repeated & ~sorted_member(hashes, known)
+                    summary['iguais'] += int((~repeated & ~changed).sum())
+
+                    if not changed.any():
+                        continue
+
+                    # Telefone e data só das linhas que mudaram; data preenchida e inválida recusa a linha
+                    novas = chunk[changed]
+                    created_at = self._dates(novas)
+                    invalid = (created_at.isna() & self._has_date(novas)).to_numpy()
+                    summary['data_invalida'] += int(invalid.sum())
+                    valid = ~invalid
+                    if not valid.any():
+                        continue
+                    conn.execute("DELETE FROM incoming")
+                    conn.executemany("INSERT INTO incoming VALUES (?, ?, ?, ?, ?)", zip(
+                        client_id[changed][valid].tolist(), novas['name'][valid].tolist(),
+                        self._phones(novas)[valid].tolist(),
+                        created_at[valid].astype(object).where(created_at[valid].notna(), None).tolist(),
+                        hashes[changed][valid].tolist()
+                    ))
+                    novos, alterados, total = conn.execute(
+                        "SELECT SUM(c.client_id IS NULL), SUM(c.row_hash != i.row_hash), COUNT(*) "
+                        "FROM incoming i LEFT JOIN contacts c USING (client_id)"
+                    ).fetchone()
+                    # Upsert só do que mudou; o WHERE true separa o SELECT do ON CONFLICT
+                    conn.execute(
+                        "INSERT INTO contacts (client_id, name, phone, created_at, row_hash, imported_at) "
+                        "SELECT client_id, name, phone, created_at, row_hash, ? FROM incoming WHERE true "
+                        "ON CONFLICT (client_id) DO UPDATE SET name = excluded.name, phone = excluded.phone, "
+                        "created_at = excluded.created_at, row_hash = excluded.row_hash, "
+                        "imported_at = excluded.imported_at WHERE contacts.row_hash != excluded.row_hash",
+                        (time.time(),)
+                    )
+                    summary['novos'] += novos or 0
+                    summary['alterados'] += alterados or 0
+                    summary['iguais'] += total - (novos or 0) - (alterados or 0)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if summary['data_invalida']:
+            print(f"⚠️ {summary['data_invalida']} linhas com created_at inválido não foram importadas (use dd/mm/aaaa)")
+        metrics.event('contacts_import', source=os.path.basename(path),
+                      seconds=round(time.perf_counter() - inicio, 3), **summary)
+        return summary
+
+    @staticmethod
+    def _phones(chunk):
+        """Telefones de um bloco normalizados como no envio, de forma vetorizada"""
+        normalized, reason = normalize_phones(chunk['phone'])
+        # Telefone inválido fica como veio (só dígitos); a campanha o rejeita depois
+        phone = normalized.astype(str)
+        invalid = reason != ''
+        if invalid.any():
+            phone = phone.mask(invalid, chunk['phone'][invalid].str.replace(r'\D', '', regex=True))
+        return phone
+
+    @classmethod
+    def _client_ids(cls, chunk):
+        """client_id de cada linha; sem ele, 'tel:' + telefone normalizado"""
+        if 'client_id' not in chunk:
+            return 'tel:' + cls._phones(chunk)
+        client_id = chunk['client_id'].str.strip()
+        missing = client_id == ''
+        if missing.any():
+            client_id = client_id.mask(missing, 'tel:' + cls._phones(chunk[missing]))
+        return client_id
+
+    @staticmethod
+    def _dates(chunk):
+        """created_at de um bloco em aaaa-mm-dd (NaN se vazio ou inválido); aceita dd/mm/aaaa e aaaa-mm-dd"""
+        if 'created_at' not in chunk:
+            return pd.Series(np.nan, index=chunk.index, dtype=object)
+        texto = chunk['created_at'].str.strip()
+        datas = pd.to_datetime(texto, format='%d/%m/%Y', errors='coerce')
+        outras = datas.isna() & (texto != '')
+        if outras.any():
+            datas = datas.fillna(pd.to_datetime(texto[outras], format='%Y-%m-%d', errors='coerce'))
+        return datas.dt.strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _has_date(chunk):
+        """Linhas com algo preenchido em created_at"""
+        if 'created_at' not in chunk:
+            return pd.Series(False, index=chunk.index)
+        return chunk['created_at'].str.strip() != ''
+
+    def _where(self, created_since=None, created_until=None, not_sent_days=None):
+        """Cláusula WHERE e parâmetros dos filtros de uma consulta"""
+        conditions, params = [], []
+        if created_since is not None:
+            conditions.append("created_at >= ?")
+            params.append(parse_date(created_since).isoformat())
+        if created_until is not None:
+            conditions.append("created_at <= ?")
+            params.append(parse_date(created_until).isoformat())
+        if not_sent_days is not None:
+            if isinstance(not_sent_days, bool) or not isinstance(not_sent_days, (int, float)) or not_sent_days < 0:
+                raise ValueError("Dias sem mensagem deve ser um número não negativo")
+            conditions.append("(last_sent_at IS NULL OR last_sent_at < ?)")
+            params.append(time.time() - not_sent_days * 86400)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def count(self, **filters):
+        """Quantidade de contatos que atendem aos filtros (chaves de CONTACT_QUERY_FILTERS)"""
+        filters.pop('limit', None)
+        where, params = self._where(**self._check(filters))
+        with self.lock:
+            return self._connect().execute(f"SELECT COUNT(*) FROM contacts{where}", params).fetchone()[0]
 
-def wait_for_whatsapp_login(driver):
-    """Aguarda login do WhatsApp verificando o campo de pesquisa"""
-    try:
-        driver.get("https://web.whatsapp.com/")
-        
-        # Aguarda página carregar
-        WebDriverWait(driver, 10).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-        
-        # Aguarda elementos dinâmicos
-        time.sleep(5)
-        
-        # Verifica se o campo de pesquisa está presente (indica que está logado)
-        try:
-            search_box = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((
-                    By.XPATH, '//*[@id="side"]/div[1]/div/div[2]/div[2]/div/div/p'
-                ))
-            )
-            if search_box.is_displayed():
-                print("✅ WhatsApp Web está logado!")
-                save_whatsapp_login_status(True)
-                return True
-        except:
-            print("❌ WhatsApp Web NÃO está logado! Necessário escanear QR Code.")
-            save_whatsapp_login_status(False)
-            return False
-            
-    except Exception as e:
-        print(f"❌ Erro ao verificar login: {e}")
-        save_whatsapp_login_status(False)
-        return False
+    def export(self, path=None, **filters):
+        """Grava os contatos que atendem aos filtros em um CSV pronto para uma campanha
 
-def send_whatsapp_message(driver, phone, message):
-    """Envia mensagem individual via WhatsApp Web"""
-    try:
-        # URL codificada com número e mensagem (mensagem já com nome substituído)
-        encoded_message = requests.utils.quote(message)
-        url = f"https://web.whatsapp.com/send?phone={phone}&text={encoded_message}"
-        driver.get(url)
-        
-        # Aguarda carregamento da conversa
-        message_box = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'div[role="textbox"]'))
-        )
-        
-        # Aguarda mais um pouco para garantir que a página carregou completamente
-        time.sleep(3)
-        
-        # Envia a mensagem
-        try:
-            # Primeiro, tenta enviar com ENTER
-            time.sleep(1)
-            
-        
-            # Se não enviou, tenta clicar no botão de enviar
-            send_button = driver.find_element(By.CSS_SELECTOR, '#main > footer > div.x1n2onr6.xhtitgo.x9f619.x78zum5.x1q0g3np.xuk3077.x193iq5w.x122xwht.x1bmpntp.xs9asl8.x1swvt13.x1pi30zi.xnpuxes.copyable-area > div > span > div > div._ak1r > div.x123j3cw.xs9asl8.x9f619.x78zum5.x6s0dn4.xl56j7k.x1ofbdpd.x100vrsf.x1fns5xo > button > span')
-            send_button.click()
-            
-        except:
-            # Se ambos falharem, tenta um último método
-            driver.execute_script("""
-                document.querySelector('div[role="textbox"]').dispatchEvent(
-                    new KeyboardEvent('keydown', {'key': 'Enter'})
-                );
-            """)
-        
-        # Aguarda confirmação de envio
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'span[data-icon="msg-check"], span[data-icon="msg-dblcheck"]'))
-        )
-        
-        print(f"✅ Mensagem enviada para {phone}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Erro ao enviar para {phone}: {e}")
-        return False
+        Filtros: created_since/created_until (data ou 'dd/mm/aaaa'),
+        not_sent_days (sem envio confirmado nesse número de dias) e limit.
+        Sem `path`, o CSV vai para CONTACT_QUERY_DIR com nome único. Retorna
+        (caminho do CSV, quantidade de contatos).
+        """
+        filters = self._check(filters)
+        limit = filters.pop('limit', None)
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+            raise ValueError("O limite deve ser um número inteiro positivo")
+        where, params = self._where(**filters)
+        if path is None:
+            os.makedirs(CONTACT_QUERY_DIR, exist_ok=True)
+            path = os.path.join(CONTACT_QUERY_DIR,
+                                f"consulta_{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}.csv")
+        sql = (f"SELECT name, phone, client_id, COALESCE(strftime('%d/%m/%Y', created_at), '') "
+               f"FROM contacts{where} ORDER BY rowid" + (" LIMIT ?" if limit else ""))
+        total = 0
+        with self.lock, open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CONTACT_COLUMNS + PERSONALIZE_COLUMNS)
+            cursor = self._connect().execute(sql, params + ([limit] if limit else []))
+            for rows in iter(lambda: cursor.fetchmany(CSV_CHUNK_SIZE), []):
+                writer.writerows(rows)
+                total += len(rows)
+        print(f"🗂️ {total} contatos da base em {path}")
+        return path, total
 
-def save_progress(current_index, total):
-    """Salva o progresso atual do envio"""
-    try:
-        # Se o processo estiver completo, remove o arquivo de progresso
-        if current_index >= total:
-            if os.path.exists(PROGRESS_FILE):
-                os.remove(PROGRESS_FILE)
-                print("✅ Processo concluído, arquivo de progresso removido")
-                if progress_label:
-                    progress_label.config(text="Envio concluído! (100%)")
+    def mark_sent(self, phone):
+        """Anota o envio confirmado para o telefone; grava em grupo a cada `flush_batch` envios"""
+        with self.pending_lock:
+            self.pending.append((time.time(), str(phone)))
+            cheio = len(self.pending) >= self.flush_batch
+        if cheio:
+            self.flush()
+
+    def flush(self):
+        """Grava na base os envios anotados (descartados se a base não foi criada)"""
+        with self.pending_lock:
+            pending, self.pending = self.pending, []
+        if not pending or (self.conn is None and not os.path.exists(self.path)):
             return
+        with self.lock:
+            conn = self._connect()
+            conn.executemany("UPDATE contacts SET last_sent_at = ? WHERE phone = ?", pending)
+            conn.commit()
 
-        # Caso contrário, salva o progresso atual
-        with open(PROGRESS_FILE, 'w') as f:
-            json.dump({
-                'current_index': current_index,
-                'total': total,
-                'timestamp': datetime.now().isoformat()
-            }, f)
-    except Exception as e:
-        print(f"Erro ao salvar progresso: {e}")
+    @staticmethod
+    def _check(filters):
+        unknown = set(filters) - set(CONTACT_QUERY_FILTERS)
+        if unknown:
+            raise ValueError(f"Filtros desconhecidos: {', '.join(sorted(unknown))}")
+        return {key: value for key, value in filters.items() if value not in (None, '')}
 
-def load_progress():
-    """Carrega o último progresso salvo"""
-    try:
-        if os.path.exists(PROGRESS_FILE):
-            with open(PROGRESS_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Erro ao carregar progresso: {e}")
-    return None
+contact_store = ContactStore()
 
-def create_or_update_progress_bar(parent, total, reset=False):
-    """Cria ou atualiza a barra de progresso"""
-    global progress_frame, progress_var, progress_label
-    
-    # Remove barra de progresso existente se necessário
-    if progress_frame and reset:
-        progress_frame.destroy()
-        progress_frame = None
-        
-    # Cria nova barra se não existir
-    if not progress_frame:
-        progress_frame = tk.Frame(parent)
-        progress_frame.pack(fill=tk.X, pady=5)
-        
-        progress_var = tk.DoubleVar()
-        progress_bar = Progressbar(
-            progress_frame, 
-            variable=progress_var,
-            maximum=total,
-            mode='determinate'
-        )
-        progress_bar.pack(fill=tk.X, padx=10)
-        
-        progress_label = tk.Label(progress_frame, text="0%")
-        progress_label.pack(pady=5)
-    
-    return progress_var, progress_label
+def load_accounts():
+    """Retorna as contas (perfis do navegador) configuradas para envio
 
-def update_progress(progress_var, progress_label, current, total):
-    """Atualiza barra de progresso"""
-    progress_var.set(current)
-    percentage = int((current / total) * 100)
-    progress_label.config(text=f"{percentage}% ({current}/{total})")
+    Cada item de `accounts` no config.json tem `name` e `profile` (pasta de
+    dados do navegador). Sem a chave, usa uma única conta em USER_DATA_DIR.
+    """
+    accounts = config_service.get('accounts') or [{'name': 'principal', 'profile': USER_DATA_DIR}]
+    return [
+        {
+            'name': account.get('name') or f"conta{i + 1}",
+            'profile': account.get('profile') or USER_DATA_DIR
+        }
+        for i, account in enumerate(accounts)
+    ]
 
-def enviar_mensagens(contatos, mensagem_base):
-    """Envia mensagens para lista de contatos"""
-    global driver
-    
-    # Sempre reinicia a barra de progresso
-    progress_var, progress_label = create_or_update_progress_bar(root, len(contatos), reset=True)
-    
-    # Verifica progresso anterior
-    last_progress = load_progress()
-    start_index = 0
-    
-    if last_progress and last_progress['current_index'] < last_progress['total']:
-        if messagebox.askyesno("Continuar Envio", 
-                              "Existe um envio anterior incompleto. Deseja continuar de onde parou?"):
-            start_index = last_progress['current_index']
-            print(f"📝 Continuando do índice {start_index}")
-        else:
-            print("🔄 Iniciando novo envio do começo")
-            if os.path.exists(PROGRESS_FILE):
-                os.remove(PROGRESS_FILE)
-    
-    # Atualiza barra com progresso inicial
-    update_progress(progress_var, progress_label, start_index, len(contatos))
-    
-    # Carrega configuração do navegador
-    config = load_config()
-    browser_type = config.get('browser_type', 'chrome')
-    
-    print(f"🌐 Iniciando com navegador: {BROWSER_TYPES[browser_type]}")
-    
+def whatsapp_page_ready(driver):
+    """Indica se o navegador já está no WhatsApp Web carregado e logado"""
     try:
-        # Primeiro tenta verificar login em modo headless
-        print("🔄 Iniciando driver em modo headless...")
-        driver = initialize_driver(headless=True, browser_type=browser_type)
+        return driver.current_url.startswith(WHATSAPP_WEB_URL) and bool(driver.find_elements(By.ID, "side"))
+    except Exception:
+        return False
+
+def start_logged_driver(browser_type, user_data_dir=None):
+    """Entrega o navegador headless já logado, passando pelo QR Code se necessário
+
+    O navegador visível só é aberto quando o QR Code precisa mesmo ser lido:
+    o perfil mostrou o QR agora ou foi visto deslogado há pouco (login_status).
+    """
+    if login_status.get(user_data_dir) is not False:
+        # Navegador do serviço ainda aberto e logado: nada a fazer
+        driver = browser_service.get(browser_type, headless=True, user_data_dir=user_data_dir)
         if not driver:
             raise Exception("Falha ao inicializar navegador")
-            
+        if whatsapp_page_ready(driver):
+            print("♻️ Reaproveitando sessão do WhatsApp Web já carregada")
+            return driver
+
         # Verifica login em modo headless
-        if wait_for_whatsapp_login(driver):
+        if wait_for_whatsapp_login(driver, user_data_dir):
             print("✅ Login detectado, iniciando envio em modo headless...")
-        else:
-            # Se não está logado, fecha driver headless e abre modo normal
-            print("❌ Não logado, abrindo navegador para scan do QR Code...")
-            driver.quit()
-            driver = initialize_driver(headless=False, browser_type=browser_type)
-            
-            # Aguarda login com timeout maior (5 minutos)
-            if not wait_for_whatsapp_login_with_qr(driver):
-                messagebox.showerror("Erro", "Tempo excedido aguardando login do WhatsApp!")
-                return
-                
-            print("✅ Login realizado com sucesso!")
-            
-            # Fecha navegador normal e reabre em modo headless
-            driver.quit()
-            driver = initialize_driver(headless=True, browser_type=browser_type)
-            
-            # Confirma que manteve login
-            if not wait_for_whatsapp_login(driver):
-                messagebox.showerror("Erro", "Não foi possível manter o login após scan do QR Code!")
-                return
-        
-        mensagens_enviadas = 0
-        hora_inicio = time.time()
-        
-        # Itera sobre contatos começando do índice salvo
-        for index, row in contatos.iloc[start_index:].iterrows():
-            # Controle de taxa de envio
-            if mensagens_enviadas >= MAX_MESSAGES_PER_HOUR:
-                tempo_espera = 3600 - (time.time() - hora_inicio)
-                if tempo_espera > 0:
-                    time.sleep(tempo_espera)
-                mensagens_enviadas = 0
-                hora_inicio = time.time()
+            return driver
+
+        # Página não carregou: o QR Code não resolveria
+        if login_status.get(user_data_dir) is None:
+            raise Exception("WhatsApp Web não carregou a tempo")
+
+        # Se não está logado, fecha driver headless e abre modo normal
+        print("❌ Não logado, abrindo navegador para scan do QR Code...")
+    else:
+        print("❌ Perfil deslogado na última verificação, abrindo navegador para scan do QR Code...")
+    browser_service.discard(user_data_dir)
+    driver = browser_service.get(browser_type, headless=False, user_data_dir=user_data_dir)
+
+    # Aguarda login com timeout maior (5 minutos)
+    if not driver or not wait_for_whatsapp_login_with_qr(driver, user_data_dir=user_data_dir):
+        browser_service.discard(user_data_dir)
+        ui.show_error("Erro", "Tempo excedido aguardando login do WhatsApp!")
+        return None
 
-            # Pausa entre lotes
-            if index > 0 and index % BATCH_SIZE == 0:
-                time.sleep(300)
+    print("✅ Login realizado com sucesso!")
+
+    # Fecha navegador normal e reabre em modo headless
+    browser_service.discard(user_data_dir)
+    driver = browser_service.get(browser_type, headless=True, user_data_dir=user_data_dir)
+
+    # Confirma que manteve login
+    if not driver or not wait_for_whatsapp_login(driver, user_data_dir):
+        browser_service.discard(user_data_dir)
+        ui.show_error("Erro", "Não foi possível manter o login após scan do QR Code!")
+        return None
+    return driver
+
+def recycle_driver(browser_type, user_data_dir, account_name, reason):
+    """Fecha o navegador da conta e abre outro já logado, tentando algumas vezes
+
+    Retorna None se não conseguir reabrir ou se o envio for interrompido.
+    """
+    print(f"♻️ Reciclando navegador da conta {account_name} ({reason})...")
+    metrics.count('browser_recycles_total', account=account_name, reason=reason)
+    metrics.event('browser_recycle', account=account_name, reason=reason)
+    for tentativa in range(1, WATCHDOG_RESTART_ATTEMPTS + 1):
+        browser_service.discard(user_data_dir)
+        try:
+            # None: login não confirmado, não adianta insistir
+            return start_logged_driver(browser_type, user_data_dir)
+        except Exception as e:
+            print(f"⚠️ Falha ao reabrir navegador ({tentativa}/{WATCHDOG_RESTART_ATTEMPTS}): {e}")
+        if stop_sending.wait(WATCHDOG_RESTART_DELAY * tentativa):
+            return None
+    return None
+
+def run_session(account, fila, render, browser_type, send_mode, ledger, on_processed, limits=None,
+                attachment=None):
+    """Envia os contatos da RetryScheduler de uma conta respeitando os limites dessa conta
+
+    `render(nome, telefone)` retorna (mensagem, mensagem codificada para URL
+    ou None) de cada contato. `limits` substitui os limites de envio do
+    config.json (chaves de CAMPAIGN_LIMITS). `attachment` (MediaCache) vai
+    em todas as mensagens. Alterações na configuração
+    durante o envio valem na hora: limites novos são aplicados ao limitador
+    e a troca de navegador recicla o navegador da conta.
+    """
+    name = account['name']
+    limits = dict(limits or {})
+    troca_navegador = threading.Event()
+
+    def on_config(changed):
+        if 'limits' in changed:
+            limiter.retune(**{**send_limits(), **limits})
+            print(f"⚙️ Limites de envio da conta {name} atualizados")
+        if {'browser_type', 'lean_browser'} & set(changed):
+            troca_navegador.set()
+
+    driver = None
+    try:
+        driver = start_logged_driver(browser_type, account['profile'])
+        if not driver:
+            return
+
+        # Intervalo, teto por hora e pausa entre lotes valem por conta, somando
+        # os envios de todas as campanhas
+        limiter = account_limiter(name, {**send_limits(), **limits})
+        config_service.subscribe(on_config)
+        # Mensagem já montada dos contatos que aguardam reenvio
+        mensagens_reenvio = {}
+        watchdog = BrowserWatchdog(name)
+
+        # Contatos pendentes da conta, com os reenvios intercalados
+        while not stop_sending.is_set():
+            contato, espera = fila.next_contact()
+            if contato is None:
+                if espera is None:
+                    break
+                # Só restam reenvios ainda em backoff
+                with metrics.timer('retry_backoff_seconds'):
+                    stop_sending.wait(espera)
+                continue
+            contact_name, phone, tentativa = contato
+
+            # Pausa entre lotes e teto por hora passam antes de abrir a conversa;
+            # só o intervalo entre mensagens corre junto com a navegação
+            inicio_espera = time.perf_counter()
+            if not limiter.wait_ready():
+                print(f"⏹️ Envio da conta {name} interrompido")
+                break
+            metrics.count('rate_limited_seconds_total', time.perf_counter() - inicio_espera)
 
             # Preparar mensagem
-            name = row["name"]
-            phone = row["phone"]
-            mensagem = mensagem_base.replace("%name%", name)
-            
+            mensagem, mensagem_codificada = mensagens_reenvio.pop(phone, None) or render(contact_name, phone)
+
             # Enviar mensagem
-            if send_whatsapp_message(driver, phone, mensagem):
-                mensagens_enviadas += 1
-            
-            # Atualiza e salva progresso
-            current_index = index + 1
-            update_progress(progress_var, progress_label, current_index, len(contatos))
-            save_progress(current_index, len(contatos))
-            
-            # Se terminou, atualiza label
-            if current_index >= len(contatos):
-                progress_label.config(text="Envio concluído! (100%)")
-            
-            # Delay entre mensagens
-            time.sleep(DELAY_BETWEEN_MESSAGES)
-            
+            timings = {}
+            erro = ''
+            reenviar = repetir = False
+            if send_whatsapp_message(driver, phone, mensagem, timings=timings, mode=send_mode,
+                                     wait_turn=limiter.acquire, encoded_message=mensagem_codificada,
+                                     attachment=attachment):
+                status = STATUS_SENT
+            else:
+                erro = timings.get('error', '')
+                if erro == ERROR_CANCELLED:
+                    print(f"⏹️ Envio da conta {name} interrompido")
+                    break
+                status = STATUS_INVALID if erro == ERROR_INVALID_PHONE else STATUS_FAILED
+                # Queda do navegador não é do contato: ele é o próximo no navegador novo
+                repetir = erro == ERROR_DRIVER_CRASH and fila.retry_now(contato, erro)
+                reenviar = repetir or fila.report_failure(contato, erro)
+                if reenviar:
+                    mensagens_reenvio[phone] = (mensagem, mensagem_codificada)
+                if repetir:
+                    print(f"🔁 {phone} será reenviado assim que o navegador voltar")
+                elif reenviar:
+                    print(f"🔁 {phone} volta para a fila (tentativa {tentativa + 1}/{fila.max_attempts})")
+
+            # Registra a tentativa; o progresso só anda quando o contato tem resultado final
+            ledger.record(phone, status, timings.get('total', 0.0), erro, name,
+                          count_attempt=not repetir)
+            if status == STATUS_SENT:
+                contact_store.mark_sent(phone)
+            if not reenviar:
+                on_processed()
+            watchdog.record(timings.get('total') if status == STATUS_SENT else None)
+
+            # Navegador caiu ou degradou: abre outro e segue com a fila; o contato
+            # que caiu junto já está na frente da RetryScheduler
+            if erro == ERROR_DRIVER_CRASH:
+                print(f"💥 Navegador da conta {name} parou de responder")
+                metrics.count('driver_restarts_total', account=name)
+                motivo = 'crash'
+            elif troca_navegador.is_set():
+                troca_navegador.clear()
+                browser_type = config_service.get('browser_type')
+                motivo = 'config'
+            else:
+                motivo = watchdog.check(driver, browser_service.browser_pid(account['profile']))
+            if motivo:
+                driver = recycle_driver(browser_type, account['profile'], name, motivo)
+                if not driver:
+                    return
+                watchdog.reset()
+
+        # Navegador continua aberto para a próxima campanha
+        browser_service.release(driver)
+
     except Exception as e:
-        messagebox.showerror("Erro", f"Erro durante envio: {e}")
-    finally:
+        ui.show_error("Erro", f"Erro durante envio ({name}): {e}")
         if driver:
-            driver.quit()
-            driver = None
+            browser_service.discard(account['profile'])
+    finally:
+        config_service.unsubscribe(on_config)
+
+class CampaignError(Exception):
+    """Campanha recusada antes do envio (CSV, modelo ou registro inválido)"""
+
+def campaign_ledger(base):
+    """SendLedger de uma campanha a partir do nome base dos arquivos ("send_ledger_<id>")"""
+    return SendLedger(f"{base}.tsv", f"{base}.json")
+
+def send_rate(limits, accounts=1):
+    """Envios por segundo que os limites permitem, somando as contas"""
+    por_mensagem = max(
+        RATE_WINDOW / limits['per_hour'] if limits['per_hour'] else 0,
+        limits['spacing'] + (limits['batch_pause'] / limits['batch_size'] if limits['batch_size'] else 0),
+        1  # O envio em si leva cerca de um segundo
+    )
+    return accounts / por_mensagem
+
+class CampaignQueue:
+    """Agenda de campanhas: quem envia agora é a mais importante dentro da janela
+
+    É o ponto de entrada do motor de envio: a interface e o servidor_envio.py
+    só enfileiram campanhas (CSV, modelo, limites) com submit(), que aceita
+    também prioridade (maior primeiro), início agendado e janela diária de
+    envio (padrão: send_window do config.json). Uma campanha envia por vez,
+    com o limite por hora de cada conta compartilhado entre elas
+    (account_limiter); a thread da agenda não dorme por campanha: espera na
+    Condition só até o próximo evento (início, abertura ou fechamento de
+    janela). Ao sair da janela, ou quando uma campanha mais importante pode
+    enviar, a atual é pausada (JOB_PAUSED) e depois continua do ponto em que
+    parou pelo próprio registro (um SendLedger por campanha). O estado é
+    gravado em CAMPAIGN_JOBS_FILE a cada mudança, e o navegador do
+    BrowserService continua aberto entre campanhas. O progresso
+    (processed/total) e a previsão de término (eta) ficam só em memória; a
+    previsão é refeita fora do lock, só quando a agenda ou os limites mudam.
+    """
+    def __init__(self, path=CAMPAIGN_JOBS_FILE):
+        self.path = path
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.revision = 0
+        self.eta_lock = threading.Lock()
+        self.eta_key = None
+        self.worker = None
+        self.current = None
+        self.pausing = None
+        self.closed = False
+
+    def start(self, recover=False):
+        """Carrega o histórico e começa a processar a agenda
+
+        Campanhas que estavam na fila ou em andamento quando o processo parou
+        voltam para a fila (a que estava em andamento continua de onde parou)
+        se `recover` for True; senão ficam como interrompidas. Pausadas
+        continuam pausadas, esperando a vez.
+        """
+        with self.condition:
+            if self.worker:
+                return
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.jobs = {job['id']: job for job in json.load(f)}
+            for job in self.jobs.values():
+                if job['status'] == JOB_RUNNING:
+                    job['resume'] = True
+                if job['status'] in (JOB_QUEUED, JOB_RUNNING):
+                    job['status'] = JOB_QUEUED if recover else JOB_INTERRUPTED
+            self._save()
+            self.closed = False
+            config_service.subscribe(self._on_config)
+            self.worker = threading.Thread(target=self._run, name="campanhas", daemon=True)
+            self.worker.start()
+
+    def submit(self, csv_path=None, template='', retry_failed_only=False, resume=False, limits=None,
+               priority=0, start_at=None, window=None, attachment=None, query=None):
+        """Valida e agenda uma campanha; retorna uma cópia dela
+
+        `start_at` é um datetime ou texto ISO ("2026-10-19T08:00"); `window`
+        uma janela "HH:MM-HH:MM" (None usa send_window do config.json, ""
+        libera qualquer hora). `attachment` é a imagem ou PDF anexado a cada
+        mensagem (None usa menu_attachment do config.json, "" envia só o
+        texto); ele já é preparado aqui. `query` define os contatos por uma
+        consulta à base local (filtros de ContactStore.export, ex.
+        {"not_sent_days": 7}) em vez do CSV; o resultado é gravado agora. Com
+        retry_failed_only ou resume a campanha usa o registro da última
+        campanha encerrada.
+        """
+        limits = dict(limits or {})
+        try:
+            validate_limits(limits)
+            if window is not None:
+                parse_window(window)
+        except ValueError as e:
+            raise CampaignError(str(e))
+        if isinstance(start_at, str):
+            try:
+                start_at = datetime.fromisoformat(start_at)
+            except ValueError:
+                raise CampaignError(f"Início inválido: {start_at} (use AAAA-MM-DDTHH:MM)")
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise CampaignError("A prioridade deve ser um número inteiro")
+        if not template.strip() and not config_service.get('personalize_messages'):
+            raise CampaignError("A mensagem da campanha está vazia")
+        if attachment:
+            try:
+                media_cache.prepare(attachment)
+            except (OSError, ValueError) as e:
+                raise CampaignError(f"Erro ao preparar o anexo: {e}")
+        if query is not None and not retry_failed_only:
+            if not isinstance(query, dict):
+                raise CampaignError("A consulta de contatos deve ser um objeto com filtros")
+            try:
+                csv_path, _ = contact_store.export(**query)
+            except (ValueError, sqlite3.Error) as e:
+                raise CampaignError(f"Consulta de contatos inválida: {e}")
+        if not retry_failed_only:
+            try:
+                # Só o cabeçalho aqui; a contagem é feita em _count, fora da thread de quem agenda
+                ContactSource(csv_path)
+            except Exception as e:
+                raise CampaignError(f"Erro ao abrir arquivo CSV: {e}")
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'csv': os.path.abspath(csv_path) if csv_path else None,
+            'template': template,
+            'retry_failed_only': retry_failed_only,
+            'resume': resume,
+            'limits': limits,
+            'priority': priority,
+            'start_at': start_at.isoformat(timespec='minutes') if start_at else None,
+            'window': window,
+            'attachment': os.path.abspath(attachment) if attachment else attachment,
+            'query': query,
+            'ledger': self._last_ledger_base() if retry_failed_only or resume else f"send_ledger_{job_id}",
+            'status': JOB_QUEUED,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'processed': 0,
+            'total': None,
+            'eta': None,
+            'report': None,
+            'error': None,
+        }
+        with self.condition:
+            self.jobs[job['id']] = job
+            self._save()
+            self.condition.notify_all()
+            position = 1 + sum(1 for other in self.jobs.values()
+                               if other is not job and other['status'] in (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED)
+                               and self._rank(other) > self._rank(job))
+        print(f"📥 Campanha {job['id']} na agenda (posição {position})")
+        if job['csv'] and not retry_failed_only:
+            threading.Thread(target=self._count, args=(job,), name=f"contagem-{job_id}", daemon=True).start()
+        return dict(job)
+
+    def _count(self, job):
+        """Conta os contatos do CSV da campanha em segundo plano (a previsão aparece em seguida)"""
+        try:
+            total = ContactSource(job['csv']).count()
+        except Exception as e:
+            print(f"⚠️ Não foi possível contar os contatos de {job['csv']}: {e}")
+            return
+        with self.condition:
+            # O envio, se já começou, informa o total pelo progresso
+            if job['total'] is None:
+                job['total'] = total
+                self._save()
+
+    def get(self, job_id):
+        """Cópia da campanha `job_id` (None se não existir)"""
+        self._refresh_estimates()
+        with self.condition:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        """Cópia de todas as campanhas, da mais antiga para a mais nova"""
+        self._refresh_estimates()
+        with self.condition:
+            return [dict(job) for job in self.jobs.values()]
+
+    def last_ledger(self):
+        """Registro da última campanha encerrada (o LEDGER_FILE se nenhuma passou pela agenda)"""
+        with self.condition:
+            return campaign_ledger(self._last_ledger_base())
+
+    def cancel(self, job_id):
+        """Cancela a campanha na agenda ou interrompe a que está em andamento"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] in JOB_FINISHED:
+                return False
+            if job is self.current:
+                self.pausing = None
+                stop_sending.set()
+            else:
+                self._finish(job, JOB_CANCELLED)
+            return True
+
+    def stop(self):
+        """Cancela as campanhas agendadas e interrompe a atual"""
+        with self.condition:
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Aguarda a campanha terminar e retorna uma cópia dela"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.jobs[job_id]['status'] in JOB_FINISHED, timeout)
+            return dict(self.jobs[job_id])
+
+    def close(self, wait=True):
+        """Interrompe a campanha atual e encerra a thread da agenda
+
+        Campanhas ainda agendadas continuam gravadas para a próxima execução.
+        Com wait=False não espera o envio em andamento terminar de parar.
+        """
+        with self.condition:
+            self.closed = True
+            if self.current:
+                stop_sending.set()
+            self.condition.notify_all()
+        config_service.unsubscribe(self._on_config)
+        if self.worker and wait:
+            self.worker.join()
+        self.worker = None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                job = None
+                while not self.closed:
+                    job, espera = self._pick(datetime.now())
+                    if job:
+                        break
+                    self.condition.wait(espera)
+                if self.closed:
+                    return
+                # Limpa o "parar" sob o lock: um cancel() a partir daqui vale para esta campanha
+                stop_sending.clear()
+                self.pausing = None
+                self.current = job
+                job['status'] = JOB_RUNNING
+                job['started_at'] = job['started_at'] or datetime.now().isoformat()
+                self._save()
+                threading.Thread(target=self._execute, args=(job,), name=f"campanha-{job['id']}",
+                                 daemon=True).start()
+
+                # Enquanto a campanha envia, acorda só quando a janela dela fechar ou
+                # quando uma mais importante puder começar
+                while self.current is job:
+                    espera = None
+                    if not self.pausing and not stop_sending.is_set():
+                        motivo, espera = self._preempt(job, datetime.now())
+                        if motivo:
+                            print(f"⏸️ Campanha {job['id']} pausada ({motivo})")
+                            self.pausing = motivo
+                            stop_sending.set()
+                    self.condition.wait(espera)
+
+    def _execute(self, job):
+        def on_progress(processed, total):
+            job['processed'] = processed
+            job['total'] = total
+
+        status, report, error = JOB_DONE, None, None
+        try:
+            contatos = ContactSource(job['csv']) if job['csv'] and not job['retry_failed_only'] else None
+            report = enviar_mensagens(contatos, job['template'], retry_failed_only=job['retry_failed_only'],
+                                      resume=job['resume'], limits=job['limits'], on_progress=on_progress,
+                                      ledger=campaign_ledger(job.get('ledger') or self._legacy_ledger_base()),
+                                      attachment=job.get('attachment'))
+            if stop_sending.is_set():
+                status = JOB_INTERRUPTED if self.closed else JOB_PAUSED if self.pausing else JOB_CANCELLED
+        except CampaignError as e:
+            status, error = JOB_FAILED, str(e)
+            ui.show_error("Erro", error)
+        except Exception as e:
+            status, error = JOB_FAILED, f"{e.__class__.__name__}: {e}"
+            ui.show_error("Erro", f"Erro durante envio: {e}")
+
+        with self.condition:
+            job['report'] = report
+            job['error'] = error
+            if status == JOB_INTERRUPTED:
+                # Volta na próxima execução com recover=True, continuando de onde parou
+                job['resume'] = True
+                self._save()
+            elif status == JOB_PAUSED:
+                # Continua de onde parou quando for a vez dela de novo
+                job['status'] = JOB_PAUSED
+                job['resume'] = True
+                self._save()
+            else:
+                self._finish(job, status)
+            self.current = None
+            self.pausing = None
+            self.condition.notify_all()
+        print(f"🏁 Campanha {job['id']}: {status}")
+
+    def _window(self, job):
+        """Janela da campanha: a dela ou a padrão do config.json"""
+        window = job.get('window')
+        return parse_window(config_service.get('send_window') if window is None else window)
+
+    def _rank(self, job):
+        """Ordem de prioridade: maior prioridade, depois a mais antiga"""
+        return job.get('priority', 0), -datetime.fromisoformat(job['created_at']).timestamp()
+
+    def _eligible(self, job, quando):
+        """Indica se a campanha pode enviar em `quando` (já começou e está na janela)"""
+        if job.get('start_at') and datetime.fromisoformat(job['start_at']) > quando:
+            return False
+        return in_window(self._window(job), quando)
+
+    def _next_eligible(self, job, quando):
+        """Próximo momento em que a campanha pode enviar"""
+        if job.get('start_at') and datetime.fromisoformat(job['start_at']) > quando:
+            quando = datetime.fromisoformat(job['start_at'])
+        window = self._window(job)
+        return quando if in_window(window, quando) else next_window_change(window, quando)
+
+    def _pick(self, agora):
+        """(campanha para enviar agora, None) ou (None, segundos até a próxima poder começar)"""
+        pendentes = [job for job in self.jobs.values() if job['status'] in (JOB_QUEUED, JOB_PAUSED)]
+        prontas = [job for job in pendentes if self._eligible(job, agora)]
+        if prontas:
+            return max(prontas, key=self._rank), None
+        if not pendentes:
+            return None, None
+        proxima = min(self._next_eligible(job, agora) for job in pendentes)
+        return None, max((proxima - agora).total_seconds(), 1)
+
+    def _preempt(self, job, agora):
+        """(motivo para pausar a campanha atual, None) ou (None, segundos até a próxima verificação)"""
+        window = self._window(job)
+        if not in_window(window, agora):
+            return "fora da janela de envio", None
+        melhores = [other for other in self.jobs.values()
+                    if other['status'] in (JOB_QUEUED, JOB_PAUSED) and self._rank(other) > self._rank(job)]
+        if any(self._eligible(other, agora) for other in melhores):
+            return "campanha mais importante na vez", None
+        eventos = [self._next_eligible(other, agora) for other in melhores]
+        if window:
+            eventos.append(next_window_change(window, agora))
+        if not eventos:
+            return None, None
+        return None, max((min(eventos) - agora).total_seconds(), 1)
+
+    def _refresh_estimates(self):
+        """Refaz a previsão (eta) das campanhas pendentes se a agenda ou os limites mudaram"""
+        with self.eta_lock:
+            with self.condition:
+                pendentes = [dict(job) for job in self.jobs.values()
+                             if job['status'] in (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED)]
+                # O total de uma campanha pode chegar pelo progresso, sem passar por _save
+                key = (self.revision, tuple(job['total'] for job in pendentes))
+                if key == self.eta_key:
+                    return
+            etas = self._estimate(pendentes, datetime.now())
+            with self.condition:
+                if self.revision != key[0]:
+                    return  # A agenda mudou durante a simulação; a próxima leitura refaz
+                for job in pendentes:
+                    if job['id'] in self.jobs:
+                        self.jobs[job['id']]['eta'] = etas.get(job['id'])
+                self.eta_key = key
+
+    @staticmethod
+    def _estimate(pendentes, agora):
+        """{id: eta} das campanhas `pendentes`, simulando a agenda em passos de CAMPAIGN_ETA_STEP"""
+        # Configuração lida uma vez: a simulação pode ter milhares de passos
+        limites = send_limits()
+        janela_padrao = config_service.get('send_window')
+        contas = len(load_accounts())
+        restante, taxa, janela, inicio, ordem = {}, {}, {}, {}, {}
+        for job in pendentes:
+            if job['total'] is None:
+                continue
+            job_id = job['id']
+            restante[job_id] = max(job['total'] - job['processed'], 0)
+            taxa[job_id] = send_rate({**limites, **job['limits']}, contas)
+            janela[job_id] = parse_window(janela_padrao if job.get('window') is None else job['window'])
+            inicio[job_id] = datetime.fromisoformat(job['start_at']) if job.get('start_at') else None
+            ordem[job_id] = job.get('priority', 0), -datetime.fromisoformat(job['created_at']).timestamp()
+        etas = {}
+        quando = agora
+        fim = agora + timedelta(seconds=CAMPAIGN_ETA_HORIZON)
+        while quando < fim and any(restante.values()):
+            prontas = [job_id for job_id, falta in restante.items()
+                       if falta and (inicio[job_id] is None or inicio[job_id] <= quando)
+                       and in_window(janela[job_id], quando)]
+            if prontas:
+                job_id = max(prontas, key=ordem.get)
+                envios = taxa[job_id] * CAMPAIGN_ETA_STEP
+                if envios >= restante[job_id]:
+                    termino = quando + timedelta(seconds=restante[job_id] / taxa[job_id])
+                    etas[job_id] = termino.isoformat(timespec='minutes')
+                    restante[job_id] = 0
+                else:
+                    restante[job_id] -= envios
+            quando += timedelta(seconds=CAMPAIGN_ETA_STEP)
+        return etas
+
+    def _on_config(self, changed):
+        # Janela padrão, limites ou contas mudaram: reavalia a agenda e a previsão
+        if {'send_window', 'limits', 'accounts'} & set(changed):
+            with self.condition:
+                self.revision += 1
+                self.condition.notify_all()
+
+    def _last_ledger_base(self):
+        encerradas = [job for job in self.jobs.values() if job['status'] in JOB_FINISHED and job['started_at']]
+        if encerradas:
+            return encerradas[-1].get('ledger') or self._legacy_ledger_base()
+        return self._legacy_ledger_base()
+
+    @staticmethod
+    def _legacy_ledger_base():
+        return os.path.splitext(LEDGER_FILE)[0]
+
+    def _finish(self, job, status):
+        job['status'] = status
+        job['finished_at'] = datetime.now().isoformat()
+        job['eta'] = None
+        # Histórico limitado às campanhas encerradas mais recentes
+        finished = [job_id for job_id, other in self.jobs.items() if other['status'] in JOB_FINISHED]
+        for job_id in finished[:-CAMPAIGN_JOBS_KEEP]:
+            del self.jobs[job_id]
+        self._save()
+        self.condition.notify_all()
+
+    def _save(self):
+        # Toda mudança na agenda passa por aqui: a previsão em cache deixa de valer
+        self.revision += 1
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self.jobs.values()), f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+campaign_queue = CampaignQueue()
+
+def iniciar_campanha(contatos, mensagem_base, retry_failed_only=False):
+    """Faz as perguntas ao usuário na thread principal e enfileira a campanha"""
+    ledger = campaign_queue.last_ledger()
+    resume = False
+    if retry_failed_only:
+        if not ledger.exists():
+            messagebox.showinfo("Reenviar Falhas", "Nenhum envio registrado para reenviar.")
+            return
+    elif ledger.exists() and not ledger.meta().get('completed'):
+        resume = messagebox.askyesno("Continuar Envio",
+                                     "Existe um envio anterior incompleto. Deseja continuar de onde parou?")
+
+    try:
+        campaign_queue.submit(contatos.path if contatos else None, mensagem_base,
+                              retry_failed_only=retry_failed_only, resume=resume)
+    except CampaignError as e:
+        messagebox.showerror("Erro", str(e))
+
+def enviar_mensagens(contatos, mensagem_base, retry_failed_only=False, resume=False, limits=None,
+                     on_progress=None, ledger=None, attachment=None):
+    """Envia mensagens para os contatos de um ContactSource, divididos entre as contas configuradas
+
+    Com retry_failed_only=True reenvia apenas os contatos que falharam na
+    última campanha registrada no SendLedger (`contatos` é ignorado). Com
+    resume=True continua a campanha incompleta do registro; senão ela é
+    arquivada. `limits` substitui os limites de envio do config.json e
+    `on_progress(processados, total)` acompanha o andamento. Roda fora da
+    thread principal (normalmente pela CampaignQueue): a tela só é
+    atualizada pelo UiBridge. `ledger` é o SendLedger da campanha (padrão
+    LEDGER_FILE). `attachment` é o arquivo anexado a cada mensagem (None usa
+    menu_attachment do config.json, '' envia só o texto). Retorna o resumo da
+    campanha; erros de validação levantam CampaignError.
+    """
+    # Carrega configuração do navegador e das contas
+    browser_type = config_service.get('browser_type')
+    send_mode = config_service.get('send_mode')
+    personalize = config_service.get('personalize_messages')
+    accounts = load_accounts()
+
+    # Verifica envio anterior no registro
+    ledger = ledger or SendLedger()
+    resuming = False
+
+    if retry_failed_only:
+        if not ledger.exists():
+            raise CampaignError("Nenhum envio registrado para reenviar.")
+        contatos = ContactSource(ledger.meta()['source'])
+    elif ledger.exists() and not ledger.meta().get('completed'):
+        if resume:
+            resuming = True
+            print("📝 Continuando envio anterior")
+        else:
+            print("🔄 Iniciando novo envio do começo")
+            ledger.archive()
+    elif ledger.exists():
+        ledger.archive()
+
+    if not retry_failed_only:
+        # Normaliza e valida os telefones antes de abrir o navegador; na retomada
+        # a lista já gerada é mantida
+        try:
+            contatos, resumo = prepare_contacts(
+                contatos,
+                invalid_policy=config_service.get('invalid_phone_policy'),
+                reuse_existing=resuming
+            )
+        except Exception as e:
+            raise CampaignError(f"Erro ao validar contatos: {e}")
+        print(f"📋 {resumo['validos']}/{resumo['total']} contatos válidos; rejeitados: {resumo['rejeitados']}")
+
+    # Modelo compilado uma vez; campos ausentes ou vazios barram o envio antes de começar
+    if not personalize:
+        try:
+            template = MessageTemplate(mensagem_base)
+            template.check(contatos)
+        except TemplateError as e:
+            raise CampaignError(f"Erro no modelo da mensagem: {e}")
+
+    # Anexo preparado uma vez para a campanha inteira
+    anexo = None
+    arquivo_anexo = config_service.get('menu_attachment') if attachment is None else attachment
+    if arquivo_anexo:
+        try:
+            anexo = media_cache.prepare(arquivo_anexo)
+        except (OSError, ValueError) as e:
+            raise CampaignError(f"Erro ao preparar o anexo: {e}")
 
-def wait_for_whatsapp_login_with_qr(driver, timeout=300):
+    # O registro decide quem ainda precisa receber: na retomada pula quem já
+    # tem resultado final e devolve à fila quem falhou com tentativas
+    # sobrando; no reenvio pega só quem falhou
+    latest = ledger.load()
+    tentativas = {}
+    if retry_failed_only:
+        include = latest.index[latest['status'] == STATUS_FAILED].to_numpy(dtype=np.int64)
+        exclude = None
+        total = len(include)
+        processed = 0
+        ledger.start(completed=False)
+    else:
+        include = None
+        falhou = latest['status'] == STATUS_FAILED
+        desistiu = falhou & (latest['error'].isin(PERMANENT_ERRORS) | (latest['attempts'] >= RETRY_MAX_ATTEMPTS))
+        final = latest['status'].isin([STATUS_SENT, STATUS_INVALID]) | desistiu
+        exclude = latest.index[final].to_numpy(dtype=np.int64)
+        reenvio = latest.loc[falhou & ~desistiu, 'attempts']
+        tentativas = dict(zip(reenvio.index.tolist(), reenvio.tolist()))
+        total = contatos.count()
+        processed = len(exclude)
+        ledger.start(source=contatos.path, total=total, completed=False,
+                     started_at=datetime.now().isoformat())
+        if tentativas:
+            print(f"🔁 {len(tentativas)} contatos com falha voltam para a fila")
+
+    # Sempre reinicia a barra de progresso, já com o progresso inicial
+    ui.post(start_progress, total, processed)
+    if on_progress:
+        on_progress(processed, total)
+
+    print(f"🌐 Iniciando com navegador: {BROWSER_TYPES[browser_type]} (modo {send_mode}, "
+          f"{len(accounts)} conta(s))")
+    metrics.event('campaign_start', total=total, processed=processed, browser=browser_type, mode=send_mode,
+                  accounts=len(accounts), retry_failed_only=retry_failed_only)
+    inicio_campanha = time.perf_counter()
+
+    progress_lock = threading.Lock()
+
+    def on_processed():
+        """Junta o progresso das contas em uma única visão"""
+        nonlocal processed
+        with progress_lock:
+            processed += 1
+            ui.post(show_progress, processed, total, key='progress')
+            if on_progress:
+                on_progress(processed, total)
+
+    # Com a personalização ligada o texto da IA de cada contato é gerado em
+    # lotes à frente do envio; senão todos recebem a mensagem da tela
+    personalizer = None
+    if personalize:
+        personalizer = BatchPersonalizer()
+        colunas = CONTACT_COLUMNS + [c for c in PERSONALIZE_COLUMNS if c in contatos.columns]
+        print(f"🤖 Personalizando mensagens em lotes de {personalizer.batch_size} contatos")
+
+        def render(contact_name, phone):
+            return montar_mensagem_pizza_mania(contact_name, personalizer.body_for(phone),
+                                               get_dia_semana(), get_saudacao()), None
+
+        def shard(i):
+            rows = contatos.iter_shard(i, len(accounts), exclude=exclude, include=include, columns=colunas)
+            return personalizer.feed(rows, colunas)
+    else:
+        renderer = TemplateRenderer(template, encode=send_mode == SEND_MODE_COLD)
+        colunas = list(dict.fromkeys(CONTACT_COLUMNS + template.columns))
+
+        def render(contact_name, phone):
+            return renderer.payload(phone)
+
+        def shard(i):
+            rows = contatos.iter_shard(i, len(accounts), exclude=exclude, include=include, columns=colunas)
+            return renderer.feed(rows, colunas)
+
+    # Cada conta envia sua fatia em paralelo com o próprio navegador
+    filas = [RetryScheduler(shard(i), attempts=tentativas) for i in range(len(accounts))]
+    workers = [
+        threading.Thread(
+            target=run_session,
+            args=(account, fila, render, browser_type, send_mode, ledger, on_processed, limits, anexo),
+            name=f"envio-{account['name']}",
+            daemon=True
+        )
+        for account, fila in zip(accounts, filas)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Fecha o registro e grava o resumo da campanha
+    ledger.close()
+    contact_store.flush()
+    phone_cache.flush()
+    report = ledger.report()
+
+    # Contadores por classe de falha somados entre as contas
+    report['falhas_por_classe'] = {}
+    for fila in filas:
+        for classe, contagem in fila.counters.items():
+            soma = report['falhas_por_classe'].setdefault(classe, dict.fromkeys(contagem, 0))
+            for chave, valor in contagem.items():
+                soma[chave] += valor
+    if personalizer:
+        report['personalizacao'] = personalizer.counters
+    ledger.save_meta(completed=not stop_sending.is_set() and report['contatos'] >= ledger.meta().get('total', 0),
+                     report=report)
+    metrics.observe('campaign_seconds', time.perf_counter() - inicio_campanha)
+    metrics.event('campaign_end', stopped=stop_sending.is_set(), report=report)
+    print(f"📊 Resumo do envio: {report}")
+    return report
+
+def wait_for_whatsapp_login_with_qr(driver, timeout=300, user_data_dir=None):
     """Aguarda login do WhatsApp com timeout maior para scan do QR Code"""
     try:
-        driver.get("https://web.whatsapp.com/")
-        
-        # Aguarda página carregar
-        WebDriverWait(driver, 30).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
+        driver.get(f"{WHATSAPP_WEB_URL}/")
+
+        # O QR Code fica na tela até o scan; só a lista de conversas encerra a espera
+        WebDriverWait(driver, timeout, poll_frequency=1).until(
+            lambda d: d.execute_script(LOGIN_STATE_SCRIPT, WHATSAPP_SIDE_SELECTOR, WHATSAPP_QR_SELECTOR) == 'logged_in'
         )
-        
-        # Aguarda ou o QR code ou a lista de chats aparecer
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                # Verifica se está logado
-                search_box = driver.find_element(By.XPATH, '//*[@id="side"]/div[1]/div/div[2]/div[2]/div/div/p')
-                if search_box.is_displayed():
-                    print("✅ Login detectado após scan do QR Code!")
-                    save_whatsapp_login_status(True)
-                    return True
-            except:
-                # Aguarda 2 segundos antes de verificar novamente
-                time.sleep(2)
-                
+        print("✅ Login detectado após scan do QR Code!")
+        login_status.save(True, user_data_dir)
+        return True
+
+    except TimeoutException:
+        login_status.save(False, user_data_dir)
         return False
-            
     except Exception as e:
         print(f"❌ Erro ao aguardar login: {e}")
+        login_status.invalidate(user_data_dir)
         return False
 
 def get_serial_number():
@@ -648,12 +4452,84 @@ def create_menu():
     config_menu = tk.Menu(menubar, tearoff=0)
     menubar.add_cascade(label="Configurações", menu=config_menu)
     config_menu.add_command(label="Padrões de Entrada", command=lambda: DefaultsDialog(root))
+
+    contacts_menu = tk.Menu(menubar, tearoff=0)
+    menubar.add_cascade(label="Contatos", menu=contacts_menu)
+    contacts_menu.add_command(label="Importar CSV para a base...", command=import_contacts)
+    contacts_menu.add_command(label="Selecionar da base...", command=lambda: ContactQueryDialog(root))
     
     help_menu = tk.Menu(menubar, tearoff=0)
     menubar.add_cascade(label="Ajuda", menu=help_menu)
     help_menu.add_command(label="Sobre", command=lambda: AboutDialog(root))
 
-class AboutDialog(tk.Toplevel):
+def import_contacts():
+    """Importa um CSV exportado para a base de contatos, gravando só o que mudou"""
+    path = filedialog.askopenfilename(title="Selecione o CSV exportado",
+                                      filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos CSV", "*.CSV")])
+    if not path:
+        return
+    try:
+        resumo = contact_store.import_csv(path)
+        total = contact_store.count()
+    except (OSError, ValueError) as e:
+        messagebox.showerror("Erro", f"Erro ao importar contatos: {e}")
+        return
+    messagebox.showinfo("Importar Contatos",
+                        f"{resumo['lidos']} linhas lidas\n"
+                        f"Novos: {resumo['novos']}\nAlterados: {resumo['alterados']}\n"
+                        f"Sem mudança: {resumo['iguais']}\nRepetidos no arquivo: {resumo['duplicados']}\n"
+                        f"Recusados por data inválida: {resumo['data_invalida']}\n\n{total} contatos na base")
+
+class ContactQueryDialog(tk.Toplevel if tk else object):
+    """Diálogo que seleciona contatos da base e usa o resultado como CSV da campanha"""
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Selecionar da Base")
+        self.resizable(False, False)
+
+        main_frame = tk.Frame(self, padx=20, pady=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.entries = {}
+        for linha, (filtro, rotulo) in enumerate((('created_since', "Cadastrados desde (dd/mm/aaaa):"),
+                                                   ('created_until', "Cadastrados até (dd/mm/aaaa):"),
+                                                   ('not_sent_days', "Sem mensagem há (dias):"),
+                                                   ('limit', "Limite de contatos:"))):
+            tk.Label(main_frame, text=rotulo).grid(row=linha, column=0, sticky='w', pady=2)
+            entry = tk.Entry(main_frame, width=14)
+            entry.grid(row=linha, column=1, sticky='w', padx=5, pady=2)
+            self.entries[filtro] = entry
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.grid(row=len(self.entries), column=0, columnspan=2, pady=(15, 0))
+        tk.Button(button_frame, text="Selecionar", command=self.select).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Cancelar", command=self.destroy).pack(side=tk.LEFT, padx=5)
+
+    def select(self):
+        """Exporta os contatos filtrados e os coloca como CSV da campanha"""
+        try:
+            filters = {}
+            for filtro, entry in self.entries.items():
+                value = entry.get().strip()
+                if not value:
+                    continue
+                if filtro == 'not_sent_days':
+                    value = float(value.replace(',', '.'))
+                elif filtro == 'limit':
+                    value = int(value)
+                filters[filtro] = value
+            path, total = contact_store.export(**filters)
+        except ValueError as e:
+            messagebox.showerror("Erro", f"Consulta inválida: {e}", parent=self)
+            return
+        except OSError as e:
+            messagebox.showerror("Erro", f"Erro ao consultar a base: {e}", parent=self)
+            return
+        csv_file_path.set(path)
+        messagebox.showinfo("Selecionar da Base", f"{total} contatos selecionados\n{path}", parent=self)
+        self.destroy()
+
+class AboutDialog(tk.Toplevel if tk else object):
     """Diálogo com informações sobre o sistema"""
     def __init__(self, parent):
         super().__init__(parent)
@@ -786,7 +4662,7 @@ Em caso de problemas:
                  width=15,
                  height=2).pack(pady=(20,0))
 
-class SerialDialog(tk.Toplevel):
+class SerialDialog(tk.Toplevel if tk else object):
     """Diálogo simples de ativação do produto"""
     def __init__(self, parent):
         super().__init__(parent)
@@ -818,25 +4694,27 @@ class SerialDialog(tk.Toplevel):
     def validate_serial(self):
         """Valida o serial inserido"""
         if self.serial_entry.get() == get_serial_number():
-            config = load_config()
-            config['serial_number'] = self.serial_entry.get()
-            save_config(config)
+            try:
+                config_service.update(serial_number=self.serial_entry.get())
+            except OSError as e:
+                messagebox.showerror("Erro", f"Erro ao salvar configurações: {e}")
+                return
             messagebox.showinfo("Sucesso", "Produto ativado com sucesso!")
             self.destroy()
         else:
             messagebox.showerror("Erro", "Serial inválido!")
 
-class DefaultsDialog(tk.Toplevel):
+class DefaultsDialog(tk.Toplevel if tk else object):
     """Diálogo para configuração de padrões"""
     def __init__(self, parent):
         super().__init__(parent)
         self.title("Padrões de Entrada")
-        self.geometry("500x400")  # Aumentado para acomodar opções de navegador
+        self.geometry("500x600")  # Aumentado para acomodar opções de navegador, limites, janela e anexo
         
         main_frame = tk.Frame(self, padx=20, pady=20)
         main_frame.pack(fill=tk.BOTH, expand=True)
         
-        config = load_config()
+        config = {key: config_service.get(key) for key in CONFIG_DEFAULTS}
         
         # WhatsApp Number
         whatsapp_frame = tk.Frame(main_frame)
@@ -876,6 +4754,51 @@ class DefaultsDialog(tk.Toplevel):
                                    value="edge")
         edge_radio.pack(side=tk.LEFT, padx=10)
         
+        # Personalização por contato
+        self.personalize_var = tk.BooleanVar(value=config.get('personalize_messages', False))
+        tk.Checkbutton(main_frame,
+                       text="Personalizar o texto da IA para cada contato",
+                       variable=self.personalize_var).pack(anchor='w', pady=(0, 10))
+
+        # Navegador enxuto no envio
+        self.lean_var = tk.BooleanVar(value=config.get('lean_browser', False))
+        tk.Checkbutton(main_frame,
+                       text="Navegador enxuto no envio (sem imagens, mídia e fontes)",
+                       variable=self.lean_var).pack(anchor='w', pady=(0, 10))
+
+        # Limites de envio (valem também para a campanha em andamento)
+        limits_frame = tk.Frame(main_frame)
+        limits_frame.pack(fill=tk.X, pady=(0, 10))
+        limites = send_limits()
+        self.limit_entries = {}
+        for limit, rotulo in (('per_hour', "Por hora:"), ('spacing', "Intervalo (s):"),
+                              ('batch_size', "Lote:"), ('batch_pause', "Pausa (s):")):
+            tk.Label(limits_frame, text=rotulo).pack(side=tk.LEFT, padx=(5, 2))
+            entry = tk.Entry(limits_frame, width=5)
+            entry.insert(0, f"{limites[limit]:g}")
+            entry.pack(side=tk.LEFT)
+            self.limit_entries[limit] = entry
+
+        # Janela diária de envio padrão das campanhas
+        window_frame = tk.Frame(main_frame)
+        window_frame.pack(fill=tk.X, pady=(0, 10))
+
+        tk.Label(window_frame, text="Janela de envio (HH:MM-HH:MM):").pack(side=tk.LEFT, padx=5)
+        self.window_entry = tk.Entry(window_frame, width=14)
+        self.window_entry.insert(0, config.get('send_window', ''))
+        self.window_entry.pack(side=tk.LEFT, padx=5)
+
+        # Imagem ou PDF do cardápio anexado a cada mensagem
+        attachment_frame = tk.Frame(main_frame)
+        attachment_frame.pack(fill=tk.X, pady=(0, 10))
+
+        tk.Label(attachment_frame, text="Anexo do cardápio:").pack(side=tk.LEFT, padx=5)
+        self.attachment_entry = tk.Entry(attachment_frame, width=30)
+        self.attachment_entry.insert(0, config.get('menu_attachment', ''))
+        self.attachment_entry.pack(side=tk.LEFT, padx=5)
+        tk.Button(attachment_frame, text="Escolher...",
+                  command=self.choose_attachment).pack(side=tk.LEFT)
+        
         # Serial Number (read-only)
         serial_frame = tk.Frame(main_frame)
         serial_frame.pack(fill=tk.X, pady=(0, 20))
@@ -906,37 +4829,69 @@ class DefaultsDialog(tk.Toplevel):
         tk.Button(button_frame, text="Cancelar", 
                  command=self.destroy).pack(side=tk.LEFT, padx=5)
 
+    def choose_attachment(self):
+        """Escolhe a imagem ou PDF anexado às mensagens"""
+        extensoes = " ".join(f"*{ext}" for ext in MEDIA_IMAGE_EXTENSIONS + MEDIA_DOCUMENT_EXTENSIONS)
+        path = filedialog.askopenfilename(parent=self, filetypes=[("Imagem ou PDF", extensoes)])
+        if path:
+            self.attachment_entry.delete(0, tk.END)
+            self.attachment_entry.insert(0, path)
+
     def save_settings(self):
         """Salva as configurações de padrões"""
-        config = load_config()
-        config['whatsapp'] = {
-            'number': self.whatsapp_entry.get(),
-            'menu_link': self.menu_entry.get()
-        }
-        config['browser_type'] = self.browser_var.get()
-        
-        if save_config(config):
-            initialize_config()
-            self.destroy()
+        try:
+            anexo = self.attachment_entry.get().strip()
+            if anexo:
+                # Já deixa o anexo preparado para a próxima campanha
+                media_cache.prepare(anexo)
+            limits = {}
+            for limit, entry in self.limit_entries.items():
+                value = float(entry.get().replace(',', '.'))
+                limits[limit] = int(value) if value.is_integer() else value
+            config_service.update(
+                whatsapp={
+                    'number': self.whatsapp_entry.get(),
+                    'menu_link': self.menu_entry.get()
+                },
+                browser_type=self.browser_var.get(),
+                personalize_messages=self.personalize_var.get(),
+                lean_browser=self.lean_var.get(),
+                limits=limits,
+                send_window=self.window_entry.get().strip(),
+                menu_attachment=anexo
+            )
+        except ValueError as e:
+            messagebox.showerror("Erro", f"Configuração inválida: {e}")
+            return
+        except OSError as e:
+            messagebox.showerror("Erro", f"Erro ao salvar configurações: {e}")
+            return
+        self.destroy()
 
 def main():
     """Função principal"""
     global root, message_display, start_button, csv_file_path
     
     initialize_config()
+    metrics.serve(config_service.get('metrics_port'))
+
+    # Começa a gerar variantes de mensagem enquanto a janela abre
+    if GEMINI_API_KEY:
+        gemini_client.prefetch(montar_prompt_pizza_mania())
     
     root = tk.Tk()
     root.title("Envio de Mensagens - Robo do Zap")
     root.geometry("800x600")
+    ui.start(root)
+    campaign_queue.start()
     
     create_menu()
     
     # Verifica serial apenas se nunca foi ativado
-    config = load_config()
-    if not config.get('serial_number'):
+    if not config_service.get('serial_number'):
         root.withdraw()
         SerialDialog(root)
-        if not config.get('serial_number'):
+        if not config_service.get('serial_number'):
             root.destroy()
             return
         root.deiconify()
@@ -982,22 +4937,49 @@ def main():
                               command=mostrar_preview_mensagem)
     generate_button.pack(side=tk.LEFT, padx=5)
     
+    def iniciar_envio():
+        """Abre o CSV (só o cabeçalho) e inicia o envio em segundo plano"""
+        try:
+            contatos = ContactSource(csv_file_path.get())
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao abrir arquivo CSV: {e}")
+            return
+        iniciar_campanha(contatos, message_display.get("1.0", "end").strip())
+
     start_button = tk.Button(button_frame, text="Iniciar Envio", 
-                            command=lambda: threading.Thread(target=enviar_mensagens, args=(pd.read_csv(csv_file_path.get()), message_display.get("1.0", "end").strip()), daemon=True).start(), 
+                            command=iniciar_envio, 
                             state=tk.DISABLED)
     start_button.pack(side=tk.LEFT, padx=5)
 
+    retry_button = tk.Button(button_frame, text="Reenviar Falhas",
+                            command=lambda: iniciar_campanha(
+                                None, message_display.get("1.0", "end").strip(), retry_failed_only=True
+                            ),
+                            state=tk.DISABLED)
+    retry_button.pack(side=tk.LEFT, padx=5)
+
+    stop_button = tk.Button(button_frame, text="Parar Envio", command=campaign_queue.stop)
+    stop_button.pack(side=tk.LEFT, padx=5)
+
     def update_start_button(event=None):
         content = message_display.get("1.0", "end").strip()
         if content:
             start_button.config(state=tk.NORMAL)
+            retry_button.config(state=tk.NORMAL)
         else:
             start_button.config(state=tk.DISABLED)
+            retry_button.config(state=tk.DISABLED)
         message_display.edit_modified(False)
     
     message_display.bind("<<Modified>>", update_start_button)
     
-    root.protocol("WM_DELETE_WINDOW", lambda: (driver.quit() if driver else None, root.destroy()))
+    root.protocol("WM_DELETE_WINDOW", lambda: (
+        campaign_queue.close(wait=False),
+        gemini_client.shutdown(),
+        browser_service.shutdown(keep_open=config_service.get('keep_browser_open')),
+        metrics.close(),
+        root.destroy()
+    ))
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,393 @@
+"""Benchmark de envio contra o mock local do WhatsApp Web
+
+Mede, sem celular nem conta real, mensagens/minuto, latência por envio
+(p50/p95/p99), CPU e memória (RSS) do robô e do navegador:
+
+- modos cold e warm de send_whatsapp_message (padrão);
+- --campanha: o motor completo de envio (run_session com fila de reenvio,
+  limitador, modelo de mensagem e SendLedger) sobre contatos sintéticos;
+- --intervalo: ritmo antigo (sleep depois de cada envio) x SendRateLimiter;
+- --enxuto: perfil padrão x navegador enxuto (lean_browser), com tráfego
+  (KB servidos pelo mock), CPU e RSS a cada 100 mensagens;
+- --anexo: mensagens com anexo (arquivo original x preparado pelo
+  MediaCache), com o custo do preparo e o custo extra por mensagem em
+  relação ao envio só de texto (segundos e KB enviados ao mock).
+
+As taxas de falha do mock (--invalid-rate, --chat-fail-rate,
+--ack-fail-rate) exercitam os caminhos de erro. --salvar grava os resultados
+em JSON e --comparar aponta regressões em relação a um arquivo salvo
+(código de saída 1), para rodar antes de uma campanha. No fim é exibida a
+média de cada fase medida pelas métricas do app (inicialização do
+navegador, login, navegação, composição, clique e confirmação).
+
+CPU e RSS do navegador usam o pacote psutil, se instalado; sem ele só o
+processo Python é medido.
+
+Uso:
+    python benchmark_envio.py --mensagens 30
+    python benchmark_envio.py --mensagens 50 --campanha --ack-fail-rate 0.05
+    python benchmark_envio.py --mensagens 20 --intervalo 2
+    python benchmark_envio.py --mensagens 100 --enxuto
+    python benchmark_envio.py --mensagens 30 --anexo cardapio.jpg
+    python benchmark_envio.py --salvar base.json
+    python benchmark_envio.py --comparar base.json
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import app
+from mock_whatsapp import DEFAULT_FAILURES, mock_stats, start_mock_server
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class ResourceMonitor:
+    """Mede CPU e RSS do processo atual e dos filhos (driver e navegador)
+
+    Com psutil o RSS é somado em toda a árvore de processos a cada
+    `interval` segundos (pico e final) e o CPU guarda o último tempo visto de
+    cada processo, para não perder os que fecham antes do fim.
+    """
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.stop = threading.Event()
+        self.cpu = {}
+        self.baseline = {}
+        self.rss_peak = 0
+        self.rss_last = 0
+
+    def __enter__(self):
+        if psutil:
+            self._sample()
+            self.baseline = dict(self.cpu)
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+        else:
+            self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if psutil:
+            self._sample()
+            self.stop.set()
+            self.thread.join()
+
+    def _loop(self):
+        while not self.stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        current = psutil.Process()
+        rss = 0
+        for process in [current] + current.children(recursive=True):
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    self.cpu[process.pid] = times.user + times.system
+                    rss += process.memory_info().rss
+            except psutil.Error:
+                continue
+        self.rss_last = rss
+        self.rss_peak = max(self.rss_peak, rss)
+
+    def result(self):
+        """CPU em segundos e RSS em MB (None quando não dá para medir)"""
+        if psutil:
+            cpu = sum(total - self.baseline.get(pid, 0.0) for pid, total in self.cpu.items())
+            return {
+                'cpu_s': round(cpu, 2),
+                'rss_pico_mb': round(self.rss_peak / 2 ** 20, 1),
+                'rss_final_mb': round(self.rss_last / 2 ** 20, 1),
+            }
+        # Só o processo Python: ru_maxrss é em KB no Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+        return {
+            'cpu_s': round(time.process_time() - self.start_cpu, 2),
+            'rss_pico_mb': round(peak, 1) if peak else None,
+            'rss_final_mb': None,
+        }
+
+
+def resumir(cenario, enviadas, tentativas, duracao, latencias, erros, recursos, trafego=None, upload=None):
+    """Monta o resultado de um cenário
+
+    `trafego` são os bytes servidos pelo mock durante o cenário; tráfego e CPU
+    também são normalizados a cada 100 mensagens enviadas. `upload` são os
+    bytes de anexos recebidos pelo mock, mostrados por mensagem.
+    """
+    latencias = np.asarray(latencias, dtype=float)
+    percentis = np.percentile(latencias, [50, 95, 99]) if len(latencias) else [None] * 3
+    por_100 = 100 / enviadas if enviadas else None
+    return {
+        'cenario': cenario,
+        'enviadas': enviadas,
+        'tentativas': tentativas,
+        'duracao_s': round(duracao, 2),
+        'msg_min': round(enviadas / duracao * 60, 2) if duracao else 0.0,
+        'p50': round(float(percentis[0]), 3) if len(latencias) else None,
+        'p95': round(float(percentis[1]), 3) if len(latencias) else None,
+        'p99': round(float(percentis[2]), 3) if len(latencias) else None,
+        'erros': dict(erros),
+        **recursos,
+        'kb': round(trafego / 1024, 1) if trafego is not None else None,
+        'kb_100': round(trafego / 1024 * por_100, 1) if trafego is not None and por_100 else None,
+        'cpu_s_100': round(recursos['cpu_s'] * por_100, 2) if por_100 else None,
+        'kb_upload_msg': round(upload / 1024 / enviadas, 1) if upload is not None and enviadas else None,
+    }
+
+
+def imprimir(resultado):
+    """Mostra um resultado em uma linha"""
+    def fmt(valor, sufixo=''):
+        return 'n/d' if valor is None else f"{valor}{sufixo}"
+    print(f"📊 {resultado['cenario']}: {resultado['enviadas']}/{resultado['tentativas']} em "
+          f"{resultado['duracao_s']}s = {resultado['msg_min']} msg/min | "
+          f"p50 {fmt(resultado['p50'], 's')} p95 {fmt(resultado['p95'], 's')} p99 {fmt(resultado['p99'], 's')} | "
+          f"CPU {fmt(resultado['cpu_s'], 's')} RSS pico {fmt(resultado['rss_pico_mb'], ' MB')}"
+          + (f" | {resultado['kb_100']} KB e {resultado['cpu_s_100']}s CPU/100 msg" if resultado['kb_100'] else "")
+          + (f" | {resultado['kb_upload_msg']} KB de anexo/msg" if resultado.get('kb_upload_msg') else "")
+          + (f" | erros {resultado['erros']}" if resultado['erros'] else ""))
+
+
+def medir_modo(mode, mensagens, browser_type, intervalo=0, limitador=False, lean=False, server=None,
+               anexo=None, nome_anexo="anexo"):
+    """Envia `mensagens` mensagens com send_whatsapp_message no modo indicado
+
+    Com `intervalo` > 0 respeita esse espaçamento entre envios: com sleep
+    depois de cada envio ou, com `limitador`, pelo SendRateLimiter. `lean`
+    abre o navegador enxuto; com o `server` do mock o tráfego é medido.
+    `anexo` (como o de MediaCache.prepare) vai em todas as mensagens.
+    """
+    antes = mock_stats(server) if server else None
+    with ResourceMonitor() as monitor:
+        driver = app.initialize_driver(headless=True, browser_type=browser_type, lean=lean)
+        try:
+            if not app.wait_for_whatsapp_login(driver):
+                raise RuntimeError("Mock não exibiu a tela logada")
+            app.warm_fallbacks.clear()
+            limiter = None
+            if limitador:
+                limiter = app.SendRateLimiter(per_hour=mensagens + 1, spacing=intervalo, batch_size=0)
+            enviadas = 0
+            latencias = []
+            erros = collections.Counter()
+            inicio = time.perf_counter()
+            for i in range(mensagens):
+                timings = {}
+                if app.send_whatsapp_message(driver, f"55679{i:08d}", f"Teste {i} 🍕", timings=timings,
+                                             mode=mode, wait_turn=limiter.acquire if limiter else None,
+                                             attachment=anexo):
+                    enviadas += 1
+                    latencias.append(timings['total'])
+                else:
+                    erros[timings.get('error', '')] += 1
+                if intervalo and not limiter:
+                    time.sleep(intervalo)
+            duracao = time.perf_counter() - inicio
+        finally:
+            driver.quit()
+    nome = mode if not intervalo else f"{mode}+{'limitador' if limitador else 'sleep'}"
+    if lean:
+        nome += "+enxuto"
+    if anexo:
+        nome += f"+{nome_anexo}"
+    depois = mock_stats(server) if server else None
+    trafego = depois['bytes'] - antes['bytes'] if server else None
+    upload = depois['uploaded_bytes'] - antes['uploaded_bytes'] if server and anexo else None
+    return resumir(nome, enviadas, mensagens, duracao, latencias, erros, monitor.result(), trafego, upload)
+
+
+def anexo_sintetico(pasta):
+    """Cardápio de teste (~4 MB): foto 2600x1950 com Pillow, senão um PDF preenchido"""
+    if app.Image:
+        path = os.path.join(pasta, "cardapio_teste.jpg")
+        imagem = app.Image.effect_noise((2600, 1950), 40).convert('RGB')
+        imagem.save(path, 'JPEG', quality=95)
+        return path
+    path = os.path.join(pasta, "cardapio_teste.pdf")
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n' + os.urandom(4 * 2**20) + b'\n%%EOF\n')
+    return path
+
+
+def medir_anexo(arquivo, mensagens, browser_type, server, base):
+    """Envio com anexo: original x preparado, comparados ao envio só de texto (`base`)"""
+    cache = app.MediaCache(tempfile.mkdtemp(prefix="robodozap_media_"))
+    inicio = time.perf_counter()
+    preparado = cache.prepare(arquivo)
+    preparo = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    cache.prepare(arquivo)
+    reuso = time.perf_counter() - inicio
+    original = dict(preparado, path=os.path.abspath(arquivo), bytes=os.path.getsize(arquivo))
+    print(f"📎 Preparo do anexo: {original['bytes'] / 1024:.0f} KB -> {preparado['bytes'] / 1024:.0f} KB "
+          f"em {preparo:.2f}s (uma vez); reaproveitado em {reuso * 1000:.2f} ms")
+
+    resultados = []
+    for nome, anexo in (("original", original), ("preparado", preparado)):
+        resultados.append(medir_modo(app.SEND_MODE_WARM, mensagens, browser_type, server=server,
+                                     anexo=anexo, nome_anexo=f"anexo-{nome}"))
+        imprimir(resultados[-1])
+        if base['msg_min'] and resultados[-1]['msg_min']:
+            por_msg = 60 / resultados[-1]['msg_min'] - 60 / base['msg_min']
+            print(f"📎 Custo extra do anexo {nome}: {por_msg:+.3f}s e "
+                  f"{resultados[-1]['kb_upload_msg'] or 0} KB por mensagem")
+    return resultados
+
+
+def medir_campanha(mensagens, browser_type, send_mode, intervalo):
+    """Roda o motor de envio (run_session) sobre `mensagens` contatos sintéticos"""
+    pasta = tempfile.mkdtemp(prefix="robodozap_campanha_")
+    ledger = app.SendLedger(os.path.join(pasta, "ledger.tsv"), os.path.join(pasta, "ledger.json"))
+    ledger.start(total=mensagens)
+
+    # Limites do benchmark: só o intervalo pedido, reenvios com backoff curto
+    app.DELAY_BETWEEN_MESSAGES = intervalo
+    app.BATCH_SIZE = 0
+    app.MAX_MESSAGES_PER_HOUR = mensagens * app.RETRY_MAX_ATTEMPTS + 1
+    app.rate_limiters.clear()
+    contatos = [(f"CLIENTE {i} DA SILVA", f"55679{i:08d}") for i in range(mensagens)]
+    renderer = app.TemplateRenderer(app.MessageTemplate("Olá %name:primeiro%! Teste 🍕"),
+                                    encode=send_mode == app.SEND_MODE_COLD)
+    fila = app.RetryScheduler(renderer.feed(contatos, ['name', 'phone']), base_delay=1)
+    account = {'name': 'benchmark', 'profile': app.USER_DATA_DIR}
+
+    with ResourceMonitor() as monitor:
+        inicio = time.perf_counter()
+        app.run_session(account, fila, lambda name, phone: renderer.payload(phone),
+                        browser_type, send_mode, ledger, on_processed=lambda: None)
+        duracao = time.perf_counter() - inicio
+        app.browser_service.shutdown()
+    ledger.close()
+
+    tentativas = pd.read_csv(ledger.path, sep='\t', names=app.LEDGER_COLUMNS, keep_default_na=False)
+    enviadas = tentativas[tentativas['status'] == app.STATUS_SENT]
+    erros = collections.Counter(tentativas.loc[tentativas['error'] != '', 'error'].tolist())
+    return resumir(f"campanha-{send_mode}", len(enviadas), len(tentativas), duracao,
+                   enviadas['latency'].tolist(), erros, monitor.result())
+
+
+def comparar(resultados, caminho, tolerancia):
+    """Compara com resultados salvos; retorna a lista de regressões encontradas"""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        base = {resultado['cenario']: resultado for resultado in json.load(f)}
+    regressoes = []
+    for resultado in resultados:
+        anterior = base.get(resultado['cenario'])
+        if not anterior:
+            continue
+        if resultado['msg_min'] < anterior['msg_min'] * (1 - tolerancia):
+            regressoes.append(f"{resultado['cenario']}: msg/min {anterior['msg_min']} -> {resultado['msg_min']}")
+        for chave in ('p95', 'p99'):
+            if anterior[chave] and resultado[chave] and resultado[chave] > anterior[chave] * (1 + tolerancia):
+                regressoes.append(f"{resultado['cenario']}: {chave} {anterior[chave]}s -> {resultado[chave]}s")
+    return regressoes
+
+
+def main():
+    """Executa os cenários pedidos e imprime/salva/compara os resultados"""
+    parser = argparse.ArgumentParser(description="Benchmark de envio (mock)")
+    parser.add_argument('--mensagens', type=int, default=20)
+    parser.add_argument('--browser', choices=sorted(app.BROWSER_TYPES), default='chrome')
+    parser.add_argument('--boot-ms', type=int, default=1500)
+    parser.add_argument('--intervalo', type=float, default=0,
+                        help="Segundos entre envios para comparar sleep x SendRateLimiter")
+    parser.add_argument('--campanha', action='store_true', help="Mede também o motor completo (run_session)")
+    parser.add_argument('--enxuto', action='store_true', help="Compara o perfil padrão com o navegador enxuto")
+    parser.add_argument('--anexo', nargs='?', const='',
+                        help="Mede mensagens com este anexo (sem arquivo usa um cardápio de teste de ~4 MB)")
+    parser.add_argument('--salvar', help="Grava os resultados neste arquivo JSON")
+    parser.add_argument('--comparar', help="Compara com um arquivo salvo por --salvar")
+    parser.add_argument('--tolerancia', type=float, default=0.15,
+                        help="Piora relativa aceita antes de acusar regressão")
+    for name, value in DEFAULT_FAILURES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    args = parser.parse_args()
+
+    falhas = {name: getattr(args, name) for name in DEFAULT_FAILURES}
+    server, url = start_mock_server(boot_ms=args.boot_ms, **falhas)
+    app.WHATSAPP_WEB_URL = url
+    app.USER_DATA_DIR = tempfile.mkdtemp(prefix="robodozap_bench_")
+    app.login_status = app.LoginStatus(os.path.join(app.USER_DATA_DIR, "login_status.json"))
+    # Configuração só com os padrões (limites do benchmark ficam nas globais do app)
+    config_path = os.path.join(app.USER_DATA_DIR, "config.json")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+    app.config_service = app.ConfigService(config_path)
+    app.phone_cache = app.PhoneCache(os.path.join(app.USER_DATA_DIR, "numbers.db"))
+    app.metrics = app.Metrics(os.path.join(app.USER_DATA_DIR, "events.jsonl"))
+
+    try:
+        resultados = []
+        for mode in (app.SEND_MODE_COLD, app.SEND_MODE_WARM):
+            resultados.append(medir_modo(mode, args.mensagens, args.browser, server=server))
+            imprimir(resultados[-1])
+        ganho = resultados[1]['msg_min'] / max(resultados[0]['msg_min'], 1e-9)
+        print(f"🚀 warm/cold: {ganho:.2f}x")
+
+        if args.intervalo:
+            for limitador in (False, True):
+                resultados.append(medir_modo(app.SEND_MODE_COLD, args.mensagens, args.browser,
+                                             intervalo=args.intervalo, limitador=limitador))
+                imprimir(resultados[-1])
+            print(f"🚀 limitador/sleep: {resultados[-1]['msg_min'] / max(resultados[-2]['msg_min'], 1e-9):.2f}x")
+
+        if args.enxuto:
+            # Perfil padrão já medido acima (warm); mesmo cenário com o navegador enxuto
+            padrao = resultados[1]
+            resultados.append(medir_modo(app.SEND_MODE_WARM, args.mensagens, args.browser, lean=True, server=server))
+            imprimir(resultados[-1])
+            enxuto = resultados[-1]
+            for chave, rotulo in (('kb_100', 'KB/100 msg'), ('cpu_s_100', 's CPU/100 msg'), ('rss_pico_mb', 'MB RSS pico')):
+                if padrao[chave] and enxuto[chave] is not None:
+                    print(f"🪶 {rotulo}: {padrao[chave]} -> {enxuto[chave]} "
+                          f"({(1 - enxuto[chave] / padrao[chave]) * 100:.0f}% a menos)")
+
+        if args.anexo is not None:
+            arquivo = args.anexo or anexo_sintetico(app.USER_DATA_DIR)
+            resultados.extend(medir_anexo(arquivo, args.mensagens, args.browser, server, resultados[1]))
+
+        if args.campanha:
+            resultados.append(medir_campanha(args.mensagens, args.browser, app.SEND_MODE_WARM, args.intervalo))
+            imprimir(resultados[-1])
+    finally:
+        server.shutdown()
+        app.metrics.close()
+
+    # Onde o tempo foi gasto, somando todos os cenários
+    medias = [f"{nome} {h['mean']}s (n={h['count']})"
+              for nome, h in sorted(app.metrics.snapshot()['histograms'].items())]
+    print("🔬 Média por fase: " + "; ".join(medias))
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=4, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.salvar}")
+    if args.comparar:
+        regressoes = comparar(resultados, args.comparar, args.tolerancia)
+        for regressao in regressoes:
+            print(f"⚠️ Regressão: {regressao}")
+        if regressoes:
+            sys.exit(1)
+        print("✅ Sem regressões em relação à base")
+
+
+if __name__ == "__main__":
+    main()
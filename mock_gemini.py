@@ -0,0 +1,108 @@
+"""Servidor local que imita o endpoint generateContent da API do Gemini
+
+Responde cada POST com um texto diferente no formato da API
+(candidates[0].content.parts[0].text), com latência e taxa de erro
+configuráveis. Pedidos de lote (linhas "id: perfil" no prompt) recebem uma
+lista JSON [{"id": ..., "texto": ...}], com uma fração opcional de itens
+inválidos. Serve para testar o GeminiClient sem chave nem rede.
+
+Uso:
+    python mock_gemini.py --port 8766 --latency-ms 800
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_PATH = "/v1/models/gemini-pro:generateContent"
+
+BATCH_LINE = re.compile(r'^(\d+): ', re.MULTILINE)
+
+MOCK_BODIES = [
+    "🍕 Que tal uma *pizza quentinha* hoje? A *Pizza Mania* é _a melhor da cidade_! Peça já! 😋",
+    "🧀 Queijo derretendo e borda crocante: só a *Pizza Mania* faz assim! _Bora pedir?_ 🍕",
+    "🎉 Hoje é dia de *pizza* com a família! A *Pizza Mania* espera seu pedido 😄🍕",
+]
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    """Responde POST no caminho do generateContent"""
+    latency_ms = 800
+    fail_rate = 0.0
+    item_fail_rate = 0.0
+    counter = itertools.count(1)
+    requests_seen = []
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0] != MOCK_PATH:
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.requests_seen.append(body)
+        time.sleep(self.latency_ms / 1000)
+        if random.random() < self.fail_rate:
+            self.send_error(503)
+            return
+
+        number = next(self.counter)
+        prompt = body.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+        ids = [int(i) for i in BATCH_LINE.findall(prompt)]
+        if ids:
+            # Lote: itens "falhos" saem sem texto para exercitar o fallback
+            text = "```json\n" + json.dumps([
+                {'id': i, 'texto': f"{MOCK_BODIES[i % len(MOCK_BODIES)]} (lote {number}, item {i})"}
+                if random.random() >= self.item_fail_rate else {'id': i}
+                for i in ids
+            ], ensure_ascii=False) + "\n```"
+        else:
+            text = f"{MOCK_BODIES[number % len(MOCK_BODIES)]} (variante {number})"
+        payload = json.dumps({
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_gemini(port=0, latency_ms=800, fail_rate=0.0, item_fail_rate=0.0):
+    """Inicia o mock em uma thread e retorna (servidor, url do generateContent)"""
+    handler = type('ConfiguredMockGeminiHandler', (MockGeminiHandler,), {
+        'latency_ms': latency_ms,
+        'fail_rate': fail_rate,
+        'item_fail_rate': item_fail_rate,
+        'counter': itertools.count(1),
+        'requests_seen': []
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{MOCK_PATH}"
+
+
+def main():
+    """Executa o mock em primeiro plano"""
+    parser = argparse.ArgumentParser(description="Mock local da API do Gemini")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency-ms', type=int, default=800)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--item-fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_mock_gemini(args.port, args.latency_ms, args.fail_rate, args.item_fail_rate)
+    print(f"🧪 Mock do Gemini em {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
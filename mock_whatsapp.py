@@ -0,0 +1,450 @@
+"""Servidor local que imita as partes do WhatsApp Web usadas pelo robô
+
+Serve uma página única (SPA) com a pesquisa de conversas em #side, o QR Code
+(quando deslogado), a rota send?phone=&text=, a caixa de mensagem, o botão de
+enviar, o clipe de anexos (foto ou documento, com prévia, legenda e upload
+para POST /upload) e os ícones de confirmação (msg-check / msg-dblcheck),
+com latências e taxas de falha configuráveis:
+
+- invalid_rate: fração dos números tratados como sem WhatsApp (sempre os
+  mesmos números, escolhidos por hash do telefone);
+- chat_fail_rate: fração das conversas que nunca abrem;
+- ack_fail_rate: fração das mensagens que ficam sem confirmação (msg-time).
+
+Deslogado, o mock mostra o QR Code até receber POST /scan (ou window.mockScan()
+na página, automático depois de qr_scan_ms se > 0); POST /logout volta ao QR.
+
+Como o app real, a página carrega uma fonte, as fotos de perfil da lista de
+conversas e, a cada conversa aberta, a foto do contato e miniaturas de mídia
+(tamanhos em DEFAULT_ASSETS). mock_stats(servidor) retorna os bytes e
+requisições servidos e os bytes e arquivos recebidos em /upload, para medir
+o tráfego do navegador. Como no app real, a prévia de uma foto só aparece
+depois que o navegador decodifica a imagem, então fotos maiores demoram mais.
+
+Uso:
+    python mock_whatsapp.py --port 8765 --boot-ms 1500
+    python mock_whatsapp.py --logged-out --qr-scan-ms 5000 --ack-fail-rate 0.05
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latências padrão (milissegundos)
+DEFAULT_LATENCIES = {
+    'boot_ms': 1500,      # Carregamento do app (bundles, service worker, IndexedDB)
+    'boot_cpu_ms': 300,   # CPU gasta na hidratação do app
+    'search_ms': 100,     # Resultado da pesquisa de conversas depois de digitar
+    'chat_ms': 150,       # Abertura de conversa dentro do app
+    'ack_ms': 300,        # Tempo até o servidor confirmar a mensagem (msg-check)
+    'dblcheck_ms': 700,   # Tempo até a entrega (msg-dblcheck)
+    'media_ms': 200,      # Processamento da mídia no servidor depois do upload
+}
+
+# Taxas de falha padrão (0 a 1)
+DEFAULT_FAILURES = {
+    'invalid_rate': 0.0,     # Números sem WhatsApp
+    'chat_fail_rate': 0.0,   # Conversas que não abrem
+    'ack_fail_rate': 0.0,    # Mensagens sem confirmação
+}
+
+# Recursos pesados que o app carrega (KB) e conversas na lista lateral
+DEFAULT_ASSETS = {
+    'font_kb': 60,
+    'avatar_kb': 20,
+    'media_kb': 80,
+    'chat_list': 15,
+}
+
+# GIF 1x1 válido; o restante do arquivo é preenchimento até o tamanho pedido
+GIF_PIXEL = b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,' \
+            b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+
+MOCK_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>WhatsApp (mock)</title>
+<style>
+@font-face { font-family: 'MockSegoe'; src: url('/assets/font.woff2') format('woff2'); }
+body { font-family: 'MockSegoe', sans-serif; }
+img { width: 40px; height: 40px; }
+</style>
+</head>
+<body>
+<div id="app"></div>
+<script>
+const CONFIG = __CONFIG__;
+let messageCounter = 0;
+
+function busy(ms) {
+    const end = performance.now() + ms;
+    while (performance.now() < end) {}
+}
+
+function phoneHash(phone) {
+    // FNV-1a: o mesmo número é sempre válido ou sempre inválido
+    let hash = 2166136261;
+    for (const char of String(phone)) {
+        hash ^= char.charCodeAt(0);
+        hash = Math.imul(hash, 16777619);
+    }
+    return (hash >>> 0) / 4294967296;
+}
+
+function showInvalidPopup() {
+    const popup = document.createElement('div');
+    popup.setAttribute('role', 'dialog');
+    popup.setAttribute('data-animate-modal-popup', 'true');
+    popup.innerHTML =
+        '<div>O número de telefone compartilhado através de url é inválido.</div><button>OK</button>';
+    popup.querySelector('button').addEventListener('click', () => popup.remove());
+    document.querySelector('#app').appendChild(popup);
+}
+
+function formatPhone(phone) {
+    // Título do resultado como o WhatsApp Web mostra: "+55 67 91234-5678"
+    const digits = String(phone);
+    if (digits.length < 12) { return '+' + digits; }
+    const local = digits.slice(4);
+    return '+' + digits.slice(0, 2) + ' ' + digits.slice(2, 4) + ' ' + local.slice(0, -4) + '-' + local.slice(-4);
+}
+
+function renderSide() {
+    // Painel #side: o robô considera o login feito quando ele aparece
+    const side = document.createElement('div');
+    side.id = 'side';
+    side.innerHTML =
+        '<div><div><div></div><div><div></div><div><div><div>' +
+        '<p>Pesquisar ou começar uma nova conversa</p>' +
+        '</div></div></div></div></div></div>';
+    // Caixa de pesquisa: só digitação (eventos input) atualiza os resultados
+    const search = document.createElement('div');
+    search.setAttribute('contenteditable', 'true');
+    search.setAttribute('role', 'textbox');
+    search.setAttribute('data-tab', '3');
+    search.setAttribute('aria-label', 'Caixa de texto de pesquisa');
+    side.appendChild(search);
+    // Lista de conversas com foto de perfil
+    const pane = document.createElement('div');
+    pane.id = 'pane-side';
+    const list = document.createElement('div');
+    list.setAttribute('data-testid', 'chat-list');
+    for (let i = 0; i < CONFIG.chat_list; i++) {
+        list.innerHTML += '<div role="listitem"><img src="/pp/chat-' + i + '.jpg">' +
+            '<span title="Conversa ' + i + '">Conversa ' + i + '</span></div>';
+    }
+    pane.appendChild(list);
+    const results = document.createElement('div');
+    results.setAttribute('data-testid', 'search-results');
+    pane.appendChild(results);
+    side.appendChild(pane);
+    let timer = null;
+    search.addEventListener('input', () => {
+        clearTimeout(timer);
+        const query = search.textContent.replace(/\\D/g, '');
+        results.innerHTML = '';
+        list.style.display = query ? 'none' : '';
+        if (!query) { return; }
+        timer = setTimeout(() => {
+            // Número completo com WhatsApp aparece como resultado; sem WhatsApp, nada
+            if (query.length < 10 || phoneHash(query) < CONFIG.invalid_rate) {
+                results.innerHTML = '<span>Nenhuma conversa, contato ou mensagem encontrada</span>';
+                return;
+            }
+            const item = document.createElement('div');
+            item.setAttribute('role', 'listitem');
+            item.innerHTML = '<img src="/pp/' + query + '.jpg"><span></span>';
+            item.querySelector('span').setAttribute('title', formatPhone(query));
+            item.querySelector('span').textContent = formatPhone(query);
+            item.addEventListener('click', () => {
+                search.textContent = '';
+                results.innerHTML = '';
+                list.style.display = '';
+                openChat(query, '');
+            });
+            results.appendChild(item);
+        }, CONFIG.search_ms);
+    });
+    document.querySelector('#app').appendChild(side);
+}
+
+function updateSendButton(main) {
+    const box = main.querySelector('div[role="textbox"]');
+    const footer = main.querySelector('footer');
+    let button = footer.querySelector('button[aria-label="Enviar"]');
+    if (box.textContent.length && !button) {
+        button = document.createElement('button');
+        button.setAttribute('aria-label', 'Enviar');
+        button.innerHTML = '<span data-icon="send">➤</span>';
+        button.addEventListener('click', () => sendMessage(main));
+        footer.appendChild(button);
+    } else if (!box.textContent.length && button) {
+        button.remove();
+    }
+}
+
+function openAttachMenu(main) {
+    // Menu do clipe com os campos de arquivo de fotos e de documentos
+    if (main.querySelector('.attach-menu')) { return; }
+    const menu = document.createElement('div');
+    menu.className = 'attach-menu';
+    menu.innerHTML =
+        '<input type="file" accept="image/*,video/mp4,video/3gpp,video/quicktime" style="display:none">' +
+        '<input type="file" accept="*" style="display:none">';
+    for (const input of menu.querySelectorAll('input')) {
+        input.addEventListener('change', () => {
+            menu.remove();
+            if (input.files.length) { showMediaPreview(main, input.files[0]); }
+        });
+    }
+    main.querySelector('footer').appendChild(menu);
+}
+
+function showMediaPreview(main, file) {
+    const preview = document.createElement('div');
+    preview.setAttribute('data-testid', 'media-editor');
+    const caption = document.createElement('div');
+    caption.setAttribute('role', 'textbox');
+    caption.setAttribute('aria-label', 'Adicionar legenda');
+    caption.setAttribute('contenteditable', 'true');
+    caption.addEventListener('paste', (event) => {
+        event.preventDefault();
+        caption.textContent += event.clipboardData.getData('text/plain');
+    });
+    const button = document.createElement('div');
+    button.setAttribute('role', 'button');
+    button.setAttribute('aria-label', 'Enviar');
+    button.innerHTML = '<span data-icon="send">➤</span>';
+    button.addEventListener('click', () => {
+        preview.remove();
+        sendMedia(main, file, caption.textContent);
+    });
+    const show = () => {
+        preview.appendChild(caption);
+        preview.appendChild(button);
+    };
+    if (file.type.startsWith('image/')) {
+        // Miniatura gerada a partir da imagem decodificada, como no app real
+        const url = URL.createObjectURL(file);
+        const image = new Image();
+        image.src = url;
+        image.decode().catch(() => null).then(() => {
+            const canvas = document.createElement('canvas');
+            const scale = Math.min(1, 100 / Math.max(image.naturalWidth || 1, image.naturalHeight || 1));
+            canvas.width = Math.max(1, Math.round((image.naturalWidth || 1) * scale));
+            canvas.height = Math.max(1, Math.round((image.naturalHeight || 1) * scale));
+            canvas.getContext('2d').drawImage(image, 0, 0, canvas.width, canvas.height);
+            URL.revokeObjectURL(url);
+            preview.appendChild(canvas);
+            show();
+        });
+    } else {
+        preview.innerHTML = '<span data-icon="document"></span><span>' + file.name + '</span>';
+        show();
+    }
+    document.querySelector('#app').appendChild(preview);
+}
+
+function sendMedia(main, file, caption) {
+    messageCounter += 1;
+    const bubble = document.createElement('div');
+    bubble.className = 'message-out';
+    bubble.setAttribute('data-id', 'true_' + main.dataset.phone + '@c.us_' + messageCounter);
+    bubble.innerHTML = '<span class="media"></span><span class="text"></span><span data-icon="msg-time"></span>';
+    bubble.querySelector('.media').textContent = file.name;
+    bubble.querySelector('.text').textContent = caption;
+    main.querySelector('.messages').appendChild(bubble);
+    // O arquivo sobe inteiro a cada mensagem; a confirmação só vem depois do upload
+    fetch('/upload', {method: 'POST', body: file}).then(() => {
+        if (Math.random() < CONFIG.ack_fail_rate) { return; }
+        const icon = bubble.querySelector('span[data-icon="msg-time"]');
+        setTimeout(() => icon.setAttribute('data-icon', 'msg-check'), CONFIG.media_ms + CONFIG.ack_ms);
+        setTimeout(() => icon.setAttribute('data-icon', 'msg-dblcheck'), CONFIG.media_ms + CONFIG.dblcheck_ms);
+    });
+}
+
+function sendMessage(main) {
+    const box = main.querySelector('div[role="textbox"]');
+    const text = box.textContent;
+    if (!text.length) { return; }
+    box.textContent = '';
+    updateSendButton(main);
+    messageCounter += 1;
+    const bubble = document.createElement('div');
+    bubble.className = 'message-out';
+    bubble.setAttribute('data-id', 'true_' + main.dataset.phone + '@c.us_' + messageCounter);
+    bubble.innerHTML = '<span class="text"></span><span data-icon="msg-time"></span>';
+    bubble.querySelector('.text').textContent = text;
+    main.querySelector('.messages').appendChild(bubble);
+    if (Math.random() < CONFIG.ack_fail_rate) { return; }
+    const icon = bubble.querySelector('span[data-icon]');
+    setTimeout(() => icon.setAttribute('data-icon', 'msg-check'), CONFIG.ack_ms);
+    setTimeout(() => icon.setAttribute('data-icon', 'msg-dblcheck'), CONFIG.dblcheck_ms);
+}
+
+function openChat(phone, text) {
+    setTimeout(() => {
+        if (phoneHash(phone) < CONFIG.invalid_rate) { showInvalidPopup(); return; }
+        if (Math.random() < CONFIG.chat_fail_rate) { return; }
+        const previous = document.querySelector('#main');
+        if (previous) { previous.remove(); }
+        const main = document.createElement('div');
+        main.id = 'main';
+        main.dataset.phone = phone;
+        main.innerHTML =
+            '<header><img src="/pp/' + phone + '.jpg">' + phone + '</header>' +
+            '<div class="messages">' +
+            '<img src="/media/' + phone + '-1.webp"><img src="/media/' + phone + '-2.webp">' +
+            '</div>' +
+            '<footer><div title="Anexar" role="button"><span data-icon="plus">+</span></div>' +
+            '<div role="textbox" contenteditable="true"></div></footer>';
+        main.querySelector('div[title="Anexar"]').addEventListener('click', () => openAttachMenu(main));
+        const box = main.querySelector('div[role="textbox"]');
+        box.textContent = text;
+        box.addEventListener('input', () => updateSendButton(main));
+        box.addEventListener('paste', (event) => {
+            event.preventDefault();
+            box.textContent += event.clipboardData.getData('text/plain');
+            updateSendButton(main);
+        });
+        box.addEventListener('keydown', (event) => {
+            if (event.key === 'Enter') { event.preventDefault(); sendMessage(main); }
+        });
+        document.querySelector('#app').appendChild(main);
+        updateSendButton(main);
+    }, CONFIG.chat_ms);
+}
+
+function startApp() {
+    renderSide();
+    const params = new URLSearchParams(location.search);
+    if (location.pathname === '/send' && params.get('phone')) {
+        openChat(params.get('phone'), params.get('text') || '');
+    }
+}
+
+function renderQr() {
+    const qr = document.createElement('div');
+    qr.setAttribute('data-testid', 'qrcode');
+    qr.innerHTML = '<canvas aria-label="Scan me!" width="264" height="264"></canvas>';
+    document.querySelector('#app').appendChild(qr);
+    window.mockScan = () => fetch('/scan', {method: 'POST'}).then(() => { qr.remove(); startApp(); });
+    if (CONFIG.qr_scan_ms > 0) { setTimeout(window.mockScan, CONFIG.qr_scan_ms); }
+}
+
+setTimeout(() => {
+    busy(CONFIG.boot_cpu_ms);
+    if (CONFIG.logged_in) { startApp(); } else { renderQr(); }
+}, CONFIG.boot_ms);
+</script>
+</body>
+</html>
+"""
+
+
+class MockWhatsAppHandler(BaseHTTPRequestHandler):
+    """Responde / e /send com a página do mock, os recursos (fonte, fotos, mídia),
+    /scan, /logout com o estado do login e /upload com os anexos enviados"""
+    options = {**DEFAULT_LATENCIES, **DEFAULT_FAILURES, **DEFAULT_ASSETS, 'qr_scan_ms': 0}
+    state = {'logged_in': True, 'bytes': 0, 'requests': 0, 'uploaded_bytes': 0, 'uploads': 0}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path in ('/', '/send'):
+            config = {**self.options, 'logged_in': self.state['logged_in']}
+            body = MOCK_PAGE.replace('__CONFIG__', json.dumps(config)).encode('utf-8')
+            self._send(body, 'text/html; charset=utf-8', 'no-store')
+        elif path == '/assets/font.woff2':
+            self._send(bytes(self.options['font_kb'] * 1024), 'font/woff2')
+        elif path.startswith('/pp/'):
+            self._send(self._image(self.options['avatar_kb']), 'image/gif')
+        elif path.startswith('/media/'):
+            self._send(self._image(self.options['media_kb']), 'image/gif')
+        else:
+            self.send_error(404)
+
+    def _image(self, kb):
+        return GIF_PIXEL + bytes(max(0, kb * 1024 - len(GIF_PIXEL)))
+
+    def _send(self, body, content_type, cache='max-age=3600'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', cache)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.lock:
+            self.state['bytes'] += len(body)
+            self.state['requests'] += 1
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/upload':
+            length = int(self.headers.get('Content-Length', 0))
+            received = len(self.rfile.read(length))
+            with self.lock:
+                self.state['uploaded_bytes'] += received
+                self.state['uploads'] += 1
+            self.send_response(204)
+            self.end_headers()
+            return
+        if path not in ('/scan', '/logout'):
+            self.send_error(404)
+            return
+        self.state['logged_in'] = path == '/scan'
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port=0, logged_in=True, qr_scan_ms=0, **options):
+    """Inicia o mock em uma thread e retorna (servidor, url base)
+
+    `options` aceita as chaves de DEFAULT_LATENCIES, DEFAULT_FAILURES e
+    DEFAULT_ASSETS.
+    """
+    unknown = set(options) - set(DEFAULT_LATENCIES) - set(DEFAULT_FAILURES) - set(DEFAULT_ASSETS)
+    if unknown:
+        raise ValueError(f"Opções desconhecidas: {', '.join(sorted(unknown))}")
+    handler = type('ConfiguredMockHandler', (MockWhatsAppHandler,), {
+        'options': {**DEFAULT_LATENCIES, **DEFAULT_FAILURES, **DEFAULT_ASSETS, **options, 'qr_scan_ms': qr_scan_ms},
+        'state': {'logged_in': logged_in, 'bytes': 0, 'requests': 0, 'uploaded_bytes': 0, 'uploads': 0},
+        'lock': threading.Lock()
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def mock_stats(server):
+    """Bytes e requisições servidos e anexos recebidos pelo mock até agora"""
+    handler = server.RequestHandlerClass
+    with handler.lock:
+        return {key: handler.state[key] for key in ('bytes', 'requests', 'uploaded_bytes', 'uploads')}
+
+
+def main():
+    """Executa o mock em primeiro plano"""
+    parser = argparse.ArgumentParser(description="Mock local do WhatsApp Web")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--logged-out', action='store_true', help="Começa mostrando o QR Code")
+    parser.add_argument('--qr-scan-ms', type=int, default=0, help="Simula o scan do QR depois desse tempo")
+    for name, value in {**DEFAULT_LATENCIES, **DEFAULT_ASSETS}.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+    for name, value in DEFAULT_FAILURES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    args = vars(parser.parse_args())
+    port = args.pop('port')
+    logged_in = not args.pop('logged_out')
+    server, url = start_mock_server(port, logged_in=logged_in, **args)
+    print(f"🧪 Mock do WhatsApp Web em {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Robo do Zap sem interface gráfica: servidor de campanhas e linha de comando
+
+O servidor (`servir`) mantém o navegador aberto e processa as campanhas
+enfileiradas uma após a outra, com o mesmo motor de envio da interface
+(app.CampaignQueue). Campanhas de prioridade maior passam na frente, e cada
+uma só envia dentro da sua janela diária (ou da send_window do config.json);
+fora dela fica pausada e continua de onde parou. O estado das campanhas fica
+em campaign_jobs.json; se o servidor parar no meio de uma campanha, ela
+continua de onde parou na próxima vez que ele subir. As campanhas chegam
+por uma API HTTP local:
+
+    POST   /jobs          {"csv": "contatos.csv", "template": "%saudacao%, %name%!",
+                           "retry_failed_only": false, "resume": false,
+                           "limits": {"spacing": 5, "per_hour": 45,
+                                      "batch_size": 30, "batch_pause": 300},
+                           "priority": 0, "start_at": "2026-10-19T09:00",
+                           "window": "09:00-20:00", "attachment": "cardapio.jpg"}
+                          ou, no lugar do "csv", uma consulta à base de contatos:
+                          {"query": {"created_since": "01/08/2025",
+                                     "not_sent_days": 7, "limit": 500}, ...}
+    GET    /jobs          lista as campanhas
+    GET    /jobs/<id>     estado, progresso e previsão de término (eta)
+    DELETE /jobs/<id>     cancela (ou interrompe) a campanha
+    GET    /config        configuração em vigor (sem a chave da API)
+    PATCH  /config        {"limits": {"per_hour": 60}} altera a configuração;
+                          vale na hora, inclusive na campanha em andamento
+
+Os demais comandos são clientes dessa API; com --local a campanha roda direto
+neste processo, sem servidor, com a agenda em campaign_jobs_local.json (o
+--reenviar-falhas e o --continuar locais usam a última campanha local). O
+comando `importar` atualiza a base local de contatos (contatos.db) com um
+CSV exportado, gravando só o que mudou.
+
+Uso:
+    python servidor_envio.py servir --porta 8791
+    python servidor_envio.py enviar contatos.csv --mensagem "Olá %name:primeiro%!" --intervalo 5
+    python servidor_envio.py enviar contatos.csv --arquivo-mensagem mensagem.txt --aguardar --anexo cardapio.pdf
+    python servidor_envio.py enviar vip.csv --mensagem "%saudacao%!" --prioridade 5 --inicio 09:00 --janela 09:00-12:00
+    python servidor_envio.py enviar --reenviar-falhas --local
+    python servidor_envio.py importar contatos.csv
+    python servidor_envio.py enviar --desde 01/08/2025 --sem-envio-ha 7 --mensagem "%saudacao%, %name:primeiro%!"
+    python servidor_envio.py status [ID]
+    python servidor_envio.py cancelar ID
+    python servidor_envio.py configurar --por-hora 60 --intervalo 8 --janela 08:00-20:00
+"""
+import argparse
+import json
+import signal
+import sys
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import app
+
+DEFAULT_PORT = 8791
+POLL_INTERVAL = 2  # Segundos entre consultas com --aguardar
+LOCAL_JOBS_FILE = "campaign_jobs_local.json"  # Campanhas de `enviar --local`, longe das do servidor
+
+# Configuração que a API não devolve
+PRIVATE_CONFIG = ('api_key', 'serial_number')
+
+# Opções da linha de comando -> filtros da base de contatos (app.CONTACT_QUERY_FILTERS)
+QUERY_OPTIONS = {
+    'desde': 'created_since',
+    'ate': 'created_until',
+    'sem_envio_ha': 'not_sent_days',
+    'limite': 'limit',
+}
+
+# Opções da linha de comando -> limites da campanha (app.CAMPAIGN_LIMITS)
+LIMIT_OPTIONS = {
+    'intervalo': 'spacing',
+    'por_hora': 'per_hour',
+    'lote': 'batch_size',
+    'pausa_lote': 'batch_pause',
+}
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """API HTTP da fila de campanhas"""
+    def do_GET(self):
+        if self.path == '/config':
+            self._reply(200, configuracao_publica())
+            return
+        if self.path == '/jobs':
+            self._reply(200, app.campaign_queue.list())
+            return
+        job = app.campaign_queue.get(self._job_id())
+        if job:
+            self._reply(200, job)
+        else:
+            self._reply(404, {'erro': "Campanha não encontrada"})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._reply(404, {'erro': "Caminho não encontrado"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError("A campanha deve ser um objeto JSON")
+            job = app.campaign_queue.submit(
+                body.get('csv'),
+                body.get('template', ''),
+                retry_failed_only=bool(body.get('retry_failed_only', False)),
+                resume=bool(body.get('resume', False)),
+                limits=body.get('limits'),
+                priority=body.get('priority', 0),
+                start_at=body.get('start_at'),
+                window=body.get('window'),
+                attachment=body.get('attachment'),
+                query=body.get('query')
+            )
+        except (ValueError, app.CampaignError) as e:
+            self._reply(400, {'erro': str(e)})
+            return
+        self._reply(201, job)
+
+    def do_PATCH(self):
+        if self.path != '/config':
+            self._reply(404, {'erro': "Caminho não encontrado"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict) or set(body) & set(PRIVATE_CONFIG):
+                raise ValueError("Configuração não pode ser alterada pela API")
+            unknown = set(body) - set(app.CONFIG_DEFAULTS)
+            if unknown:
+                raise ValueError(f"Configurações desconhecidas: {', '.join(sorted(unknown))}")
+            app.config_service.update(**body)
+        except ValueError as e:
+            self._reply(400, {'erro': str(e)})
+            return
+        self._reply(200, configuracao_publica())
+
+    def do_DELETE(self):
+        if app.campaign_queue.cancel(self._job_id()):
+            self._reply(200, app.campaign_queue.get(self._job_id()))
+        else:
+            self._reply(404, {'erro': "Campanha não encontrada ou já encerrada"})
+
+    def _job_id(self):
+        prefix = '/jobs/'
+        return self.path[len(prefix):] if self.path.startswith(prefix) else None
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, indent=4).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def configuracao_publica():
+    """Configuração em vigor, com os limites de envio resolvidos e sem dados privados"""
+    config = {key: app.config_service.get(key) for key in app.CONFIG_DEFAULTS if key not in PRIVATE_CONFIG}
+    config['limits'] = app.send_limits()
+    return config
+
+
+def carregar_configuracao():
+    """Carrega a configuração do app; o produto precisa ter sido ativado pela interface"""
+    app.initialize_config()
+    if not app.config_service.get('serial_number'):
+        sys.exit("❌ Produto não ativado. Ative uma vez pela interface (python app.py).")
+
+
+def encerrar():
+    """Para a fila e fecha navegador, gerador de mensagens e métricas"""
+    app.campaign_queue.close()
+    app.gemini_client.shutdown()
+    app.browser_service.shutdown(keep_open=app.config_service.get('keep_browser_open'))
+    app.metrics.close()
+
+
+def servir(args):
+    """Sobe a fila de campanhas e a API HTTP até receber Ctrl+C ou SIGTERM"""
+    carregar_configuracao()
+    app.metrics.serve(app.config_service.get('metrics_port'))
+    if app.GEMINI_API_KEY:
+        app.gemini_client.prefetch(app.montar_prompt_pizza_mania())
+    app.campaign_queue.start(recover=True)
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.porta), JobHandler)
+    server.daemon_threads = True
+
+    def parar(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, parar)
+    print(f"🚀 Servidor de campanhas em http://127.0.0.1:{server.server_address[1]}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("⏹️ Encerrando servidor...")
+    finally:
+        server.server_close()
+        encerrar()
+
+
+def url_servidor(args):
+    return f"http://127.0.0.1:{args.porta}/jobs"
+
+
+def pedido(method, url, **kwargs):
+    """Chama a API do servidor e retorna o JSON da resposta"""
+    try:
+        response = requests.request(method, url, timeout=10, **kwargs)
+    except requests.ConnectionError:
+        sys.exit(f"❌ Servidor não encontrado em {url}. Rode 'servir' ou use --local.")
+    payload = response.json()
+    if response.status_code >= 400:
+        sys.exit(f"❌ {payload.get('erro', response.status_code)}")
+    return payload
+
+
+def horario_inicio(texto):
+    """'HH:MM' (próxima ocorrência) ou data ISO -> texto ISO para o start_at da campanha"""
+    try:
+        hora = datetime.strptime(texto, '%H:%M')
+    except ValueError:
+        return texto
+    agora = datetime.now()
+    inicio = agora.replace(hour=hora.hour, minute=hora.minute, second=0, microsecond=0)
+    if inicio <= agora:
+        inicio += timedelta(days=1)
+    return inicio.isoformat(timespec='minutes')
+
+
+def imprimir_campanha(job):
+    """Mostra uma campanha em uma linha"""
+    progresso = f"{job['processed']}/{job['total']}" if job['total'] is not None else "-"
+    if job['retry_failed_only']:
+        origem = "reenvio de falhas"
+    elif job.get('query'):
+        origem = "base: " + ", ".join(f"{filtro}={valor}" for filtro, valor in job['query'].items())
+    else:
+        origem = job['csv']
+    previsao = f"até {job['eta']}" if job.get('eta') else ""
+    print(f"{job['id']}  {job['status']:<11} p{job.get('priority', 0):<3} {progresso:>11}  {previsao:<20} {origem}"
+          + (f"  ({job['error']})" if job['error'] else ""))
+
+
+def enviar(args):
+    """Enfileira uma campanha no servidor ou a executa neste processo (--local)"""
+    if args.arquivo_mensagem:
+        with open(args.arquivo_mensagem, 'r', encoding='utf-8') as f:
+            template = f.read().strip()
+    else:
+        template = args.mensagem or ''
+    query = {filtro: getattr(args, option) for option, filtro in QUERY_OPTIONS.items()
+             if getattr(args, option) is not None}
+    if not args.reenviar_falhas and not args.csv and not query:
+        sys.exit("❌ Informe o arquivo CSV, filtros da base de contatos ou use --reenviar-falhas.")
+    if args.csv and query:
+        sys.exit("❌ Use o arquivo CSV ou os filtros da base de contatos, não os dois.")
+    limits = {limit: getattr(args, option) for option, limit in LIMIT_OPTIONS.items()
+              if getattr(args, option) is not None}
+    campanha = {
+        'csv': args.csv,
+        'template': template,
+        'retry_failed_only': args.reenviar_falhas,
+        'resume': args.continuar,
+        'limits': limits,
+        'priority': args.prioridade,
+        'start_at': horario_inicio(args.inicio) if args.inicio else None,
+        'window': args.janela,
+        'attachment': args.anexo,
+        'query': query or None,
+    }
+
+    if args.local:
+        carregar_configuracao()
+        # Agenda própria: a do campaign_jobs.json pode ser de um `servir` no ar
+        app.campaign_queue = app.CampaignQueue(LOCAL_JOBS_FILE)
+        app.campaign_queue.start()
+        job_id = None
+        try:
+            job_id = app.campaign_queue.submit(campanha.pop('csv'), campanha.pop('template'), **campanha)['id']
+            app.campaign_queue.wait(job_id)
+        except app.CampaignError as e:
+            sys.exit(f"❌ {e}")
+        except KeyboardInterrupt:
+            print("⏹️ Interrompendo envio...")
+        finally:
+            encerrar()
+        job = app.campaign_queue.get(job_id)
+        if not job:
+            return
+    else:
+        job = pedido('POST', url_servidor(args), json=campanha)
+        print(f"📥 Campanha {job['id']} enfileirada")
+        while args.aguardar and job['status'] not in app.JOB_FINISHED:
+            time.sleep(POLL_INTERVAL)
+            job = pedido('GET', f"{url_servidor(args)}/{job['id']}")
+            print(f"⏳ {job['status']} {job['processed']}/{job['total'] or '?'}", end='\r')
+        if args.aguardar:
+            print()
+
+    imprimir_campanha(job)
+    if job['report']:
+        print(json.dumps(job['report'], indent=4, ensure_ascii=False))
+    if job['status'] == app.JOB_FAILED:
+        sys.exit(1)
+
+
+def configurar(args):
+    """Altera os limites e a janela de envio; com o servidor no ar valem na hora, até na campanha em andamento"""
+    limits = {limit: getattr(args, option) for option, limit in LIMIT_OPTIONS.items()
+              if getattr(args, option) is not None}
+    values = {'limits': limits} if limits else {}
+    if args.janela is not None:
+        values['send_window'] = args.janela
+    if args.local:
+        carregar_configuracao()
+        try:
+            app.config_service.update(**values)
+        except ValueError as e:
+            sys.exit(f"❌ {e}")
+        config = configuracao_publica()
+    elif values:
+        config = pedido('PATCH', f"http://127.0.0.1:{args.porta}/config", json=values)
+    else:
+        config = pedido('GET', f"http://127.0.0.1:{args.porta}/config")
+    print(json.dumps(config, indent=4, ensure_ascii=False))
+
+
+def importar(args):
+    """Atualiza a base de contatos com um CSV exportado, gravando só as linhas novas ou alteradas"""
+    try:
+        resumo = app.contact_store.import_csv(args.csv)
+        total = app.contact_store.count()
+    except (OSError, ValueError) as e:
+        sys.exit(f"❌ Erro ao importar contatos: {e}")
+    print(f"🗂️ {resumo['lidos']} linhas lidas: {resumo['novos']} novos, {resumo['alterados']} alterados, "
+          f"{resumo['iguais']} sem mudança, {resumo['duplicados']} repetidos, "
+          f"{resumo['data_invalida']} recusados por data inválida ({total} contatos na base)")
+
+
+def status(args):
+    """Lista as campanhas do servidor ou mostra uma delas"""
+    if args.id:
+        print(json.dumps(pedido('GET', f"{url_servidor(args)}/{args.id}"), indent=4, ensure_ascii=False))
+        return
+    for job in pedido('GET', url_servidor(args)):
+        imprimir_campanha(job)
+
+
+def cancelar(args):
+    """Cancela uma campanha na fila ou interrompe a que está em andamento"""
+    job = pedido('DELETE', f"{url_servidor(args)}/{args.id}")
+    print(f"⏹️ Campanha {job['id']} cancelada")
+
+
+def main():
+    """Interpreta a linha de comando e executa o comando pedido"""
+    parser = argparse.ArgumentParser(description="Robo do Zap sem interface gráfica")
+    parser.add_argument('--porta', type=int, default=DEFAULT_PORT, help="Porta da API de campanhas")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    comando = comandos.add_parser('servir', help="Processa as campanhas enfileiradas")
+    comando.set_defaults(func=servir)
+
+    comando = comandos.add_parser('enviar', help="Envia uma campanha")
+    comando.add_argument('csv', nargs='?', help="CSV com as colunas name e phone")
+    comando.add_argument('--mensagem', help="Modelo da mensagem (%%name%%, %%name:primeiro%%, ...)")
+    comando.add_argument('--arquivo-mensagem', help="Arquivo de texto com o modelo da mensagem")
+    comando.add_argument('--reenviar-falhas', action='store_true', help="Reenvia as falhas da última campanha")
+    comando.add_argument('--continuar', action='store_true', help="Continua a campanha incompleta registrada")
+    comando.add_argument('--intervalo', type=float, help="Segundos mínimos entre envios")
+    comando.add_argument('--por-hora', type=int, help="Máximo de envios por hora (por conta)")
+    comando.add_argument('--lote', type=int, help="Envios por lote (0 desativa a pausa)")
+    comando.add_argument('--pausa-lote', type=float, help="Segundos de pausa entre lotes")
+    comando.add_argument('--prioridade', type=int, default=0, help="Campanhas de prioridade maior passam na frente")
+    comando.add_argument('--inicio', help="Começa a enviar a partir de HH:MM ou AAAA-MM-DDTHH:MM")
+    comando.add_argument('--janela', help="Janela diária de envio HH:MM-HH:MM (padrão: a do config.json)")
+    comando.add_argument('--anexo', help="Imagem ou PDF anexado a cada mensagem (padrão: menu_attachment do config.json)")
+    comando.add_argument('--desde', help="Sem CSV: clientes da base cadastrados desde dd/mm/aaaa")
+    comando.add_argument('--ate', help="Sem CSV: clientes da base cadastrados até dd/mm/aaaa")
+    comando.add_argument('--sem-envio-ha', type=float, help="Sem CSV: clientes da base sem mensagem há N dias")
+    comando.add_argument('--limite', type=int, help="Sem CSV: no máximo N clientes da base")
+    comando.add_argument('--local', action='store_true', help="Envia neste processo, sem servidor (agenda própria)")
+    comando.add_argument('--aguardar', action='store_true', help="Acompanha a campanha até terminar")
+    comando.set_defaults(func=enviar)
+
+    comando = comandos.add_parser('configurar', help="Mostra ou altera os limites e a janela de envio")
+    comando.add_argument('--intervalo', type=float, help="Segundos mínimos entre envios")
+    comando.add_argument('--por-hora', type=int, help="Máximo de envios por hora (por conta)")
+    comando.add_argument('--lote', type=int, help="Envios por lote (0 desativa a pausa)")
+    comando.add_argument('--pausa-lote', type=float, help="Segundos de pausa entre lotes")
+    comando.add_argument('--janela', help="Janela diária de envio padrão HH:MM-HH:MM (vazio libera qualquer hora)")
+    comando.add_argument('--local', action='store_true', help="Altera o config.json sem passar pelo servidor")
+    comando.set_defaults(func=configurar)
+
+    comando = comandos.add_parser('importar', help="Importa um CSV exportado para a base de contatos")
+    comando.add_argument('csv', help="CSV com as colunas name e phone (e client_id, created_at)")
+    comando.set_defaults(func=importar)
+
+    comando = comandos.add_parser('status', help="Lista as campanhas")
+    comando.add_argument('id', nargs='?')
+    comando.set_defaults(func=status)
+
+    comando = comandos.add_parser('cancelar', help="Cancela uma campanha")
+    comando.add_argument('id')
+    comando.set_defaults(func=cancelar)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
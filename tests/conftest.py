@@ -0,0 +1,31 @@
+"""Configuração comum dos testes: importa o app.py da raiz e isola os arquivos de estado"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeClock:
+    """Relógio controlado pelo teste, no lugar de time.monotonic"""
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def pasta_temporaria(tmp_path, monkeypatch):
+    """Cada teste roda em uma pasta própria: registros, bancos e eventos não vão para o repositório"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def relogio():
+    return FakeClock()
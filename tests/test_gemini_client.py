@@ -0,0 +1,59 @@
+import pytest
+
+import app
+import mock_gemini
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    """GeminiClient apontado para o mock_gemini, com o estoque em uma pasta temporária"""
+    server, url = mock_gemini.start_mock_gemini(latency_ms=0)
+    monkeypatch.setattr(app, 'GEMINI_API_URL', url)
+    client = app.GeminiClient(cache=app.VariantCache(str(tmp_path / "variants.db")), pool_size=3, workers=3)
+    yield client, server.RequestHandlerClass
+    client.shutdown()
+    server.shutdown()
+
+
+def esperar_estoque(client, key, quantidade):
+    with client.lock:
+        pending = list(client.pending.get(key, ()))
+    app.wait_futures(pending, timeout=10)
+    assert client.cache.count(key) == quantidade
+
+
+def test_take_gera_e_repoe_o_estoque(cliente):
+    client, handler = cliente
+    body = app.montar_prompt_pizza_mania()
+    primeira = client.take(body, "Sexta-feira")
+    assert primeira == f"{mock_gemini.MOCK_BODIES[1]} (variante 1)"
+    key = client.cache_key(body, "Sexta-feira")
+    esperar_estoque(client, key, 3)
+    assert len(handler.requests_seen) == 4
+
+    # Do estoque: nenhuma variante se repete e uma nova geração repõe a usada
+    segunda = client.take(body, "Sexta-feira")
+    assert segunda != primeira
+    esperar_estoque(client, key, 3)
+    assert len(handler.requests_seen) == 5
+
+
+def test_estoque_separado_por_dia_da_semana(cliente):
+    client, _ = cliente
+    body = app.montar_prompt_pizza_mania()
+    assert client.cache_key(body, "Sexta-feira") != client.cache_key(body, "Sábado")
+    client.prefetch(body, "Sexta-feira")
+    esperar_estoque(client, client.cache_key(body, "Sexta-feira"), 3)
+    assert client.cache.count(client.cache_key(body, "Sábado")) == 0
+
+
+def test_erro_da_api_sobe_para_quem_chamou(tmp_path, monkeypatch):
+    server, url = mock_gemini.start_mock_gemini(latency_ms=0, fail_rate=1.0)
+    monkeypatch.setattr(app, 'GEMINI_API_URL', url)
+    client = app.GeminiClient(cache=app.VariantCache(str(tmp_path / "variants.db")), pool_size=0)
+    try:
+        with pytest.raises(app.requests.HTTPError):
+            client.take(app.montar_prompt_pizza_mania(), "Sexta-feira")
+    finally:
+        client.shutdown()
+        server.shutdown()
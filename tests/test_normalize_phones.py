@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def normalizar(*phones):
+    numbers, reasons = app.normalize_phones(pd.Series(phones, dtype=object))
+    return list(zip(numbers.tolist(), reasons.tolist()))
+
+
+def test_formatos_validos():
+    """Pontuação, código do país e zeros à esquerda somem; o resultado é 55 + DDD + número"""
+    assert normalizar('(11) 98765-4321', '+55 11 98765-4321', '011987654321', '5511987654321') == [
+        (5511987654321, ''),
+    ] * 4
+
+
+def test_fixo_mantem_oito_digitos():
+    assert normalizar('(21) 3333-4444', '552133334444') == [(552133334444, '')] * 2
+
+
+def test_celular_antigo_ganha_nono_digito():
+    """Celular com 8 dígitos (começando com 6-9) recebe o 9 na frente"""
+    assert normalizar('11 8765-4321', '55 31 7123-4567') == [(5511987654321, ''), (5531971234567, '')]
+
+
+def test_motivos_de_rejeicao():
+    resultado = normalizar('', None, 'abc', '123', '20 98765-4321', '11 88765-4321', '1' * 20)
+    assert [reason for _, reason in resultado] == [
+        'vazio', 'vazio', 'vazio', 'tamanho_invalido', 'ddd_invalido', 'celular_invalido', 'tamanho_invalido',
+    ]
+
+
+def test_mantem_o_indice():
+    phones = pd.Series(['11987654321', 'x'], index=[10, 20])
+    numbers, reasons = app.normalize_phones(phones)
+    assert numbers.index.tolist() == [10, 20] and reasons.index.tolist() == [10, 20]
+    assert numbers.dtype == np.int64
+
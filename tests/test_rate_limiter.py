@@ -0,0 +1,76 @@
+import threading
+
+import app
+
+
+def limitador(relogio, **limits):
+    limits = {'per_hour': 100, 'spacing': 10, 'batch_size': 0, 'batch_pause': 0, **limits}
+    return app.SendRateLimiter(**limits, clock=relogio)
+
+
+def test_intervalo_entre_envios(relogio):
+    limiter = limitador(relogio)
+    assert limiter.delay() == 0
+    assert limiter.acquire()
+    assert limiter.delay() == 10
+    relogio.advance(4)
+    assert limiter.delay() == 6
+    # wait_ready ignora o intervalo: só pausas longas passam antes de abrir a conversa
+    assert limiter.delay(spacing=False) == 0
+
+
+def test_teto_por_hora_em_janela_deslizante(relogio):
+    limiter = limitador(relogio, per_hour=2, spacing=0)
+    assert limiter.acquire()
+    relogio.advance(100)
+    assert limiter.acquire()
+    assert limiter.delay() == app.RATE_WINDOW - 100
+    relogio.advance(app.RATE_WINDOW - 100)
+    assert limiter.delay() == 0
+
+
+def test_pausa_entre_lotes(relogio):
+    limiter = limitador(relogio, spacing=1, batch_size=2, batch_pause=60)
+    assert limiter.acquire()
+    assert limiter.delay(spacing=False) == 0
+    relogio.advance(1)
+    assert limiter.acquire()
+    assert limiter.delay() == 60
+    assert limiter.delay(spacing=False) == 60
+
+
+def test_retune_mantem_os_envios_feitos(relogio):
+    limiter = limitador(relogio, spacing=0)
+    for _ in range(3):
+        assert limiter.acquire()
+    limiter.retune(per_hour=3)
+    assert limiter.delay() == app.RATE_WINDOW
+    limiter.retune(per_hour=10, spacing=5)
+    assert limiter.delay() == 5
+    assert limiter.sent == 3
+
+
+def test_cancelamento_interrompe_a_espera(relogio):
+    cancel = threading.Event()
+    limiter = app.SendRateLimiter(per_hour=1, spacing=0, batch_size=0, batch_pause=0, cancel=cancel, clock=relogio)
+    assert limiter.acquire()
+    cancel.set()
+    assert not limiter.acquire()
+    assert not limiter.wait_ready()
+    assert limiter.sent == 1
+
+
+def test_acquire_concorrente_conta_cada_envio_uma_vez():
+    limiter = app.SendRateLimiter(per_hour=10000, spacing=0, batch_size=0, batch_pause=0)
+
+    def enviar():
+        for _ in range(250):
+            assert limiter.acquire()
+
+    threads = [threading.Thread(target=enviar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.sent == 2000
+    assert len(limiter.window) == 2000
@@ -0,0 +1,84 @@
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def sem_variacao(monkeypatch):
+    """Backoff sem os ±20% de variação, para os tempos serem exatos"""
+    monkeypatch.setattr(app.random, 'uniform', lambda a, b: 1.0)
+
+
+def fila(relogio, contatos=3, **kwargs):
+    kwargs = {'max_attempts': 3, 'base_delay': 10, 'interleave': 2, **kwargs}
+    return app.RetryScheduler([(f"c{i}", f"1199999000{i}") for i in range(contatos)], clock=relogio, **kwargs)
+
+
+def esvaziar(scheduler):
+    enviados = []
+    while True:
+        contato, espera = scheduler.next_contact()
+        if contato is None:
+            return enviados, espera
+        enviados.append(contato)
+
+
+def test_contatos_novos_em_ordem(relogio):
+    enviados, espera = esvaziar(fila(relogio))
+    assert [attempt for _, _, attempt in enviados] == [1, 1, 1]
+    assert [name for name, _, _ in enviados] == ['c0', 'c1', 'c2']
+    assert espera is None
+
+
+def test_falha_transitoria_volta_com_backoff_exponencial(relogio):
+    scheduler = fila(relogio, contatos=1)
+    contato, _ = scheduler.next_contact()
+    assert scheduler.report_failure(contato, app.ERROR_ACK_TIMEOUT)
+    assert scheduler.next_contact() == (None, 10)
+    relogio.advance(10)
+    contato, _ = scheduler.next_contact()
+    assert contato == ('c0', '11999990000', 2)
+    assert scheduler.report_failure(contato, app.ERROR_ACK_TIMEOUT)
+    assert scheduler.next_contact() == (None, 20)
+    assert scheduler.counters[app.ERROR_ACK_TIMEOUT] == {'falhas': 2, 'reenvios': 2, 'desistencias': 0}
+
+
+def test_desiste_no_limite_de_tentativas_e_em_erro_permanente(relogio):
+    scheduler = fila(relogio, max_attempts=1)
+    primeiro, _ = scheduler.next_contact()
+    segundo, _ = scheduler.next_contact()
+    assert not scheduler.report_failure(primeiro, app.ERROR_ACK_TIMEOUT)
+    assert not fila(relogio).report_failure(segundo, app.ERROR_INVALID_PHONE)
+    assert scheduler.counters[app.ERROR_ACK_TIMEOUT]['desistencias'] == 1
+    assert scheduler.pending_retries() == 0
+
+
+def test_reenvio_vencido_espera_contatos_novos(relogio):
+    scheduler = fila(relogio, contatos=5, interleave=2)
+    contato, _ = scheduler.next_contact()
+    scheduler.report_failure(contato, app.ERROR_COMPOSE_TIMEOUT)
+    relogio.advance(10)
+    enviados, _ = esvaziar(scheduler)
+    # c0 vence na hora, mas só passa na frente depois de dois contatos novos (c0 e c1)
+    assert [(name, attempt) for name, _, attempt in enviados] == [
+        ('c1', 1), ('c0', 2), ('c2', 1), ('c3', 1), ('c4', 1),
+    ]
+
+
+def test_retomada_segue_a_contagem_de_tentativas(relogio):
+    scheduler = fila(relogio, attempts={11999990001: 2})
+    enviados, _ = esvaziar(scheduler)
+    assert [attempt for _, _, attempt in enviados] == [1, 3, 1]
+
+
+def test_queda_do_navegador_volta_na_frente_sem_gastar_tentativa(relogio):
+    scheduler = fila(relogio, max_attempts=2)
+    contato, _ = scheduler.next_contact()
+    assert scheduler.retry_now(contato, app.ERROR_DRIVER_CRASH)
+    assert scheduler.pending_retries() == 1
+    assert scheduler.next_contact() == (contato, 0)
+    assert scheduler.retry_now(contato, app.ERROR_DRIVER_CRASH)
+    assert scheduler.next_contact() == (contato, 0)
+    # Um contato que sempre derruba o navegador não volta para sempre
+    assert not scheduler.retry_now(contato, app.ERROR_DRIVER_CRASH)
+    assert scheduler.next_contact()[0][0] == 'c1'
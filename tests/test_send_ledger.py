@@ -0,0 +1,80 @@
+import app
+
+
+def registro(tmp_path):
+    return app.SendLedger(str(tmp_path / "send_ledger.tsv"), str(tmp_path / "send_ledger.json"))
+
+
+def test_ultimo_registro_de_cada_telefone(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start(csv="contatos.csv", total=2)
+    ledger.record('5511987654321', app.STATUS_FAILED, 1.5, app.ERROR_ACK_TIMEOUT, 'principal')
+    ledger.record('5511987654321', app.STATUS_SENT, 2.0, '', 'principal')
+    ledger.record('5521987654321', app.STATUS_INVALID, 0.5, app.ERROR_INVALID_PHONE, 'principal')
+    ledger.close()
+
+    latest = registro(tmp_path).load()
+    assert latest.loc[5511987654321, 'status'] == app.STATUS_SENT
+    assert latest.loc[5511987654321, 'attempts'] == 2
+    assert latest.loc[5521987654321, 'error'] == app.ERROR_INVALID_PHONE
+    assert registro(tmp_path).meta() == {'csv': "contatos.csv", 'total': 2}
+
+
+def test_relatorio(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_FAILED, 1.0, app.ERROR_ACK_TIMEOUT)
+    ledger.record('5511987654321', app.STATUS_SENT, 2.0)
+    ledger.record('5521987654321', app.STATUS_FAILED, 1.0, app.ERROR_COMPOSE_TIMEOUT)
+    ledger.close()
+    report = ledger.report()
+    assert report['contatos'] == 2
+    assert report['status'] == {app.STATUS_SENT: 1, app.STATUS_FAILED: 1}
+    assert report['erros'] == {app.ERROR_COMPOSE_TIMEOUT: 1}
+    assert report['tentativas'] == 3
+    assert report['latencia_p50'] == 2.0
+
+
+def test_linha_incompleta_no_fim_e_descartada(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_SENT, 1.0)
+    ledger.close()
+    with open(ledger.path, 'a', encoding='utf-8') as f:
+        f.write("5521987654321\tsen")
+    assert registro(tmp_path).load().index.tolist() == [5511987654321]
+
+
+def test_retomada_continua_a_contagem_de_tentativas(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_FAILED, 1.0, app.ERROR_ACK_TIMEOUT)
+    ledger.close()
+
+    ledger = registro(tmp_path)
+    ledger.load()
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_SENT, 1.0)
+    ledger.close()
+    assert ledger.load().loc[5511987654321, 'attempts'] == 2
+
+
+def test_queda_do_navegador_nao_gasta_tentativa(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_FAILED, 0.0, app.ERROR_DRIVER_CRASH, count_attempt=False)
+    ledger.record('5511987654321', app.STATUS_SENT, 1.0)
+    ledger.close()
+    with open(ledger.path, encoding='utf-8') as f:
+        assert [line.split('\t')[2] for line in f] == ['1', '1']
+
+
+def test_archive_libera_uma_campanha_nova(tmp_path):
+    ledger = registro(tmp_path)
+    ledger.start()
+    ledger.record('5511987654321', app.STATUS_SENT, 1.0)
+    ledger.close()
+    ledger.archive()
+    assert not ledger.exists()
+    assert ledger.load().empty
+    assert len(list(tmp_path.glob("send_ledger_*.tsv"))) == 1
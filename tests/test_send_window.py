@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+def as_(hora, minuto=0):
+    return datetime(2026, 10, 16, hora, minuto)
+
+
+def test_parse_window():
+    assert app.parse_window("08:00-20:00") == (480, 1200)
+    assert app.parse_window("22:30-02:00") == (1350, 120)
+    assert app.parse_window("18:00-24:00") == (1080, 1440)
+    assert app.parse_window("") is None
+    assert app.parse_window(None) is None
+
+
+@pytest.mark.parametrize('texto', ["8-20", "08:00", "25:00-26:00", "08:60-09:00", "10:00-10:00"])
+def test_parse_window_invalida(texto):
+    with pytest.raises(ValueError):
+        app.parse_window(texto)
+
+
+def test_in_window():
+    janela = app.parse_window("08:00-20:00")
+    assert not app.in_window(janela, as_(7, 59))
+    assert app.in_window(janela, as_(8))
+    assert app.in_window(janela, as_(19, 59))
+    assert not app.in_window(janela, as_(20))
+    assert app.in_window(None, as_(3))
+
+
+def test_in_window_atravessando_a_meia_noite():
+    janela = app.parse_window("22:00-02:00")
+    assert app.in_window(janela, as_(23))
+    assert app.in_window(janela, as_(1, 59))
+    assert not app.in_window(janela, as_(2))
+    assert not app.in_window(janela, as_(12))
+
+
+def test_next_window_change():
+    janela = app.parse_window("08:00-20:00")
+    assert app.next_window_change(janela, as_(6)) == as_(8)
+    assert app.next_window_change(janela, as_(9)) == as_(20)
+    assert app.next_window_change(janela, as_(21)) == datetime(2026, 10, 17, 8, 0)
+    assert app.next_window_change(None, as_(9)) is None
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+import requests
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def campos_fixos(monkeypatch):
+    """Saudação e dia da semana fixos: o teste não depende da hora em que roda"""
+    monkeypatch.setitem(app.TEMPLATE_SEND_TIME_FIELDS, 'saudacao', lambda: "Bom dia")
+    monkeypatch.setitem(app.TEMPLATE_SEND_TIME_FIELDS, 'dia_semana', lambda: "Sexta-feira")
+
+
+COLUNAS = ['name', 'phone', 'bairro']
+LINHAS = [('Maria Silva', '5511987654321', 'Centro'), ('João', '5521987654321', '')]
+
+
+def renderizar(texto, encode=False, block_size=1):
+    renderer = app.TemplateRenderer(app.MessageTemplate(texto), encode=encode, block_size=block_size)
+    contatos = list(renderer.feed(LINHAS, COLUNAS))
+    return renderer, contatos
+
+
+def test_feed_entrega_os_contatos_na_ordem():
+    _, contatos = renderizar("Oi %name%")
+    assert contatos == [('Maria Silva', '5511987654321'), ('João', '5521987654321')]
+
+
+def test_campos_do_csv_filtros_e_padrao():
+    renderer, _ = renderizar("Oi %name:primeiro%, entregamos no %bairro|seu bairro%!", block_size=10)
+    assert renderer.payload('5511987654321') == ("Oi Maria, entregamos no Centro!", None)
+    assert renderer.payload('5521987654321') == ("Oi João, entregamos no seu bairro!", None)
+
+
+def test_campos_do_envio_preenchidos_no_payload():
+    texto = "*%saudacao% %name%!* Hoje é %dia_semana%."
+    renderer, _ = renderizar(texto, encode=True)
+    mensagem, codificada = renderer.payload('5511987654321')
+    assert mensagem == "*Bom dia Maria Silva!* Hoje é Sexta-feira."
+    assert codificada == requests.utils.quote(mensagem)
+
+
+def test_payload_entrega_a_mensagem_uma_vez():
+    renderer, _ = renderizar("Oi %name%")
+    renderer.payload('5511987654321')
+    with pytest.raises(KeyError):
+        renderer.payload('5511987654321')
+
+
+def test_modelo_valida_colunas_e_filtros(tmp_path):
+    with pytest.raises(app.TemplateError):
+        app.MessageTemplate("Oi %name:maiusculas%")
+    csv_path = tmp_path / "contatos.csv"
+    pd.DataFrame(LINHAS, columns=COLUNAS).to_csv(csv_path, index=False)
+    source = app.ContactSource(str(csv_path))
+    with pytest.raises(app.TemplateError, match="ausentes"):
+        app.MessageTemplate("Oi %cidade%").check(source)
+    with pytest.raises(app.TemplateError, match="sem valor"):
+        app.MessageTemplate("Oi %bairro%").check(source)
+    app.MessageTemplate("Oi %bairro|você%").check(source)
+
+
+def test_preview_usa_a_mesma_renderizacao():
+    mensagem = app.montar_mensagem_pizza_mania("%name%", "Corpo")
+    assert app.render_preview(mensagem).startswith("*Bom dia Maria Silva!* 👋\n\nHoje é *Sexta-feira*!")